@@ -0,0 +1,103 @@
+import hashlib
+import math
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+import email_config
+import mailer
+from csv_state import normalize
+
+# ---------------- CONFIG ----------------
+# EMAIL_ADDRESS's account; it keeps the original file names
+PRIMARY_ACCOUNT = "main"
+# ----------------------------------------
+
+logger = mailer.logger
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class Account(namedtuple("Account", "name address password limit followup_limit primary")):
+    """
+    One sending mailbox and its per-run quotas.
+
+    Every account keeps its own sent logs, outbox, journals and log file:
+    the primary account uses the original names (sent_log.csv, outbox.db),
+    the others add their name, e.g. sent_log.work.csv and outbox.work.db.
+    """
+    __slots__ = ()
+
+    def path(self, filename):
+        if self.primary:
+            return filename
+        root, ext = os.path.splitext(filename)
+        return f"{root}.{self.name}{ext}"
+
+def load_accounts(extra=None):
+    """
+    The primary account (EMAIL_ADDRESS) followed by the SENDER_ACCOUNTS.
+    """
+    accounts = [Account(
+        PRIMARY_ACCOUNT, email_config.EMAIL_ADDRESS, email_config.EMAIL_PASSWORD,
+        email_config.INITIAL_LIMIT, email_config.FOLLOWUP_LIMIT, True
+    )]
+    for i, entry in enumerate(email_config.SENDER_ACCOUNTS if extra is None else extra, start=2):
+        name = str(entry.get("name") or f"account{i}")
+        if not _NAME_RE.match(name) or any(account.name == name for account in accounts):
+            raise ValueError(f"Sender account names must be unique and use only letters, digits, - and _: {name!r}")
+        if not entry.get("address"):
+            raise ValueError(f"Sender account {name} has no address")
+        accounts.append(Account(
+            name, entry["address"], entry.get("password"),
+            int(entry.get("limit", email_config.INITIAL_LIMIT)),
+            int(entry.get("followup_limit", email_config.FOLLOWUP_LIMIT)),
+            False
+        ))
+    return accounts
+
+def find_account(accounts, name=None):
+    """
+    The account called `name`, or the primary one if no name is given.
+    """
+    for account in accounts:
+        if account.name == (name or PRIMARY_ACCOUNT):
+            return account
+    raise ValueError(f"Unknown sender account {name!r}; configured: {', '.join(a.name for a in accounts)}")
+
+def _score(account, key):
+    # Weighted rendezvous hashing: the highest -weight/ln(u) wins, with u uniform in (0, 1)
+    digest = hashlib.blake2b(f"{account.name}\0{key}".encode("utf-8"), digest_size=8).digest()
+    u = (int.from_bytes(digest, "big") + 0.5) / 2 ** 64
+    return -max(account.limit, 0) / math.log(u)
+
+def shard_for(address, accounts):
+    """
+    The account that sends to `address`. The choice depends only on the
+    normalized address and the accounts' names and limits, so it's the same
+    on every run, accounts get recipients in proportion to their limits and
+    adding an account only moves the addresses it takes over.
+    """
+    if len(accounts) == 1:
+        return accounts[0]
+    key = normalize(address)
+    return max(accounts, key=lambda account: _score(account, key))
+
+def run_per_account(script, accounts, argv=None):
+    """
+    Runs `script` once per account, each in its own process with
+    `--account <name>` added to this run's arguments, and waits for all
+    of them. Returns the number of runs that failed.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    processes = [
+        (account, subprocess.Popen([sys.executable, script, *argv, "--account", account.name]))
+        for account in accounts
+    ]
+    failed = 0
+    for account, process in processes:
+        code = process.wait()
+        if code:
+            logger.error(f"{os.path.basename(script)} for account {account.name} exited with status {code}.")
+            failed += 1
+    return failed
@@ -0,0 +1,433 @@
+import argparse
+import csv
+import email
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+import email_config
+import mailer
+
+def legacy_build(from_addr, to_email, subject, body, attachment_path):
+    """
+    The per-recipient message build used before the attachment cache:
+    re-read, re-encode and re-serialize everything for every message.
+    """
+    msg = MIMEMultipart()
+    msg["From"] = from_addr
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+
+    if attachment_path and os.path.exists(attachment_path):
+        with open(attachment_path, "rb") as f:
+            attach = MIMEApplication(f.read(), _subtype="pdf")
+            attach.add_header("Content-Disposition", "attachment", filename=os.path.basename(attachment_path))
+            msg.attach(attach)
+
+    return msg.as_string()
+
+def time_per_call(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n
+
+def bench_build(n):
+    subject = email_config.INITIAL_SUBJECTS[0]
+    body = email_config.INITIAL_BODY_TEMPLATE.format(
+        first_name="Ankush",
+        opening=email_config.INITIAL_OPENINGS[0],
+        signature=email_config.INITIAL_SIGNATURES[0],
+        links=email_config.LINKS
+    )
+    path = email_config.ATTACHMENT_PATH
+
+    legacy = time_per_call(lambda i: legacy_build("me@example.com", f"user{i}@example.com", subject, body, path), n)
+    cached = time_per_call(lambda i: mailer.build_message("me@example.com", f"user{i}@example.com", subject, body, path), n)
+
+    print(f"Message build ({n} messages, attachment: {path})")
+    print(f"  legacy MIMEMultipart.as_string: {legacy * 1e6:10.1f} us/message")
+    print(f"  cached attachment + bytes gen:  {cached * 1e6:10.1f} us/message")
+    print(f"  speedup:                        {legacy / cached:10.1f}x")
+
+def legacy_render(first_name):
+    """
+    The per-recipient rendering used before the variant table: random
+    choices plus a full str.format of the body template every time.
+    """
+    subject = random.choice(email_config.INITIAL_SUBJECTS)
+    body = email_config.INITIAL_BODY_TEMPLATE.format(
+        first_name=first_name,
+        opening=random.choice(email_config.INITIAL_OPENINGS),
+        signature=random.choice(email_config.INITIAL_SIGNATURES),
+        links=email_config.LINKS
+    )
+    return subject, body
+
+def bench_render(n):
+    import templates
+
+    recipients = [(f"user{i}@company{i % 997}.com", f"Name{i}") for i in range(n)]
+
+    start = time.perf_counter()
+    table = templates.initial_table()
+    compile_time = time.perf_counter() - start
+
+    legacy = time_per_call(lambda i: legacy_render(recipients[i][1]), n)
+    # Consumed lazily, batch by batch, the way the scheduler pulls jobs
+    start = time.perf_counter()
+    for _ in table.iter_rendered(recipients):
+        pass
+    batched = (time.perf_counter() - start) / n
+
+    print(f"Template rendering ({n} messages, {len(table)} pre-rendered variants in {compile_time * 1e3:.1f} ms)")
+    print(f"  legacy random.choice + format: {legacy * 1e6:8.2f} us/message")
+    print(f"  variant table iter_rendered:   {batched * 1e6:8.2f} us/message")
+    print(f"  speedup:                       {legacy / batched:8.1f}x")
+
+def synthetic_contacts(n):
+    """
+    Synthetic campaign state for n contacts: everyone was sent the first
+    email, 5% replied, 10% were followed up and 3% bounced.
+    """
+    emails = [f"user{i}@company{i % 997}.com" for i in range(n)]
+    contacts = [(email, f"Name{i}") for i, email in enumerate(emails)]
+    sent = random.Random(1).sample(emails, n)
+    return contacts, sent, emails[::20], emails[1::10], emails[2::33]
+
+def bench_followups(sizes):
+    import send_followup
+
+    print("Follow-up selection (set anti-join)")
+    for n in sizes:
+        state = synthetic_contacts(n)
+        start = time.perf_counter()
+        pending = send_followup.select_followups(*state)
+        elapsed = time.perf_counter() - start
+        print(f"  {n:>9} contacts: {elapsed * 1e3:9.1f} ms  {elapsed / n * 1e9:7.1f} ns/contact  ({len(pending)} pending)")
+
+def bench_stats(n, appended):
+    """
+    Full stats build over n synthetic sends vs. an update after `appended`
+    more, run in a scratch directory so the real state files are untouched.
+    """
+    import tempfile
+    import stats
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open("sent_log.csv", "w") as f:
+                f.write("email,sent_on\n")
+                f.writelines(f"user{i}@company{i % 997}.com,2026-01-{i % 28 + 1:02d}\n" for i in range(n))
+            with open("replied.csv", "w") as f:
+                f.write("email,detected_on\n")
+                f.writelines(f"user{i}@company{i % 997}.com,2026-02-{i % 28 + 1:02d}\n" for i in range(0, n, 20))
+
+            with stats.StatsEngine() as engine:
+                start = time.perf_counter()
+                engine.update()
+                full = time.perf_counter() - start
+
+            with open("sent_log.csv", "a") as f:
+                f.writelines(f"new{i}@example.com,2026-03-01\n" for i in range(appended))
+            with stats.StatsEngine() as engine:
+                start = time.perf_counter()
+                added = engine.update()
+                incremental = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    print(f"Stats aggregation ({n} sends)")
+    print(f"  full build:              {full * 1e3:9.1f} ms")
+    print(f"  update after {added:>6} new: {incremental * 1e3:9.1f} ms")
+
+# Cold-start import budget for each entry-point script
+STARTUP_BUDGET_MS = 200
+STARTUP_SCRIPTS = ["send_email", "send_followup", "reply_checker", "bounce_checker", "mail_checker", "stats"]
+
+def import_time_ms(module):
+    """
+    Total import time of `module` in a fresh interpreter, from -X importtime,
+    and whether pandas was pulled in along the way.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    )
+    total_us = 0
+    loaded_pandas = False
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+        loaded_pandas = loaded_pandas or name.strip() == "pandas"
+    return total_us / 1000, loaded_pandas
+
+def bench_startup(budget_ms):
+    print(f"Cold-start import time (budget {budget_ms} ms)")
+    over = []
+    for module in STARTUP_SCRIPTS:
+        elapsed, loaded_pandas = import_time_ms(module)
+        status = "ok" if elapsed <= budget_ms else "OVER BUDGET"
+        note = "  (imports pandas)" if loaded_pandas else ""
+        print(f"  {module:<16} {elapsed:8.1f} ms  {status}{note}")
+        if elapsed > budget_ms:
+            over.append(module)
+    if over:
+        sys.exit(f"Over the {budget_ms} ms startup budget: {', '.join(over)}")
+
+BOUNCE_SAMPLES_DIR = "bounce_samples"
+
+def legacy_parse_bounce(msg):
+    """
+    The bounce parsing used before dsn_parser: regexes over the whole
+    re-serialized message, lowercased, compiled implicitly on every call.
+    """
+    text = msg.as_string()
+    recipient = None
+    for pattern in [r"Final-Recipient: rfc822;(.+)", r"Original-Recipient: rfc822;(.+)",
+                    r"Your message wasn't delivered to\s+(\S+@\S+)"]:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            recipient = match.group(1).strip().lower()
+            break
+    if not recipient:
+        return None, None
+
+    lowered = text.lower()
+    if re.search(r"5\.\d\.\d|address not found|user unknown|no such user", lowered):
+        return recipient, "hard"
+    if re.search(r"4\.\d\.\d|mailbox full|temporarily|try again later", lowered):
+        return recipient, "soft"
+    return recipient, "unknown"
+
+def new_parse_bounce(msg):
+    import dsn_parser
+    info = dsn_parser.parse_bounce(msg)
+    return (info.recipient, info.bounce_type) if info else (None, None)
+
+def bench_bounces(repeat):
+    with open(os.path.join(BOUNCE_SAMPLES_DIR, "expected.csv"), newline="") as f:
+        expected = list(csv.DictReader(f))
+    messages = []
+    for row in expected:
+        with open(os.path.join(BOUNCE_SAMPLES_DIR, row["file"]), "rb") as f:
+            messages.append(email.message_from_bytes(f.read()))
+
+    print(f"Bounce parsing ({len(messages)} samples x {repeat})")
+    for label, parse in (("legacy regex scan", legacy_parse_bounce), ("dsn_parser", new_parse_bounce)):
+        correct = 0
+        for row, msg in zip(expected, messages):
+            recipient, bounce_type = parse(msg)
+            if row["bounce_type"] == "none":
+                ok = recipient is None
+            else:
+                ok = recipient == row["recipient"] and bounce_type == row["bounce_type"]
+            correct += ok
+            if not ok:
+                print(f"    {label} misclassified {row['file']}: {recipient} ({bounce_type})")
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for msg in messages:
+                parse(msg)
+        elapsed = time.perf_counter() - start
+        rate = repeat * len(messages) / elapsed
+        print(f"  {label:<18} {rate:10.0f} msgs/sec   accuracy {correct}/{len(messages)}")
+
+# Entry points run by `e2e`, in this order, against the local stand-in servers
+E2E_SCRIPTS = [
+    ("send_email", "main"),
+    ("send_followup", "main"),
+    ("reply_checker", "check_for_replies"),
+    ("bounce_checker", "main"),
+    ("mail_checker", "main"),
+]
+
+# email_config overrides for e2e runs: no pacing, caps or budget, so the
+# numbers measure the scripts rather than their sleeps
+E2E_CONFIG = {
+    "INITIAL_MIN_DELAY": 0, "INITIAL_MAX_DELAY": 0,
+    "FOLLOWUP_MIN_DELAY": 0, "FOLLOWUP_MAX_DELAY": 0,
+    "MAX_SENDS_PER_MINUTE": 0, "DOMAIN_MIN_INTERVAL": 0, "DOMAIN_MAX_PER_RUN": 0,
+    "RUN_BUDGET_SECONDS": None, "SEND_FAILURE_DELAY": 0,
+    "RATE_INITIAL_BACKOFF": 0.01, "RATE_MAX_BACKOFF": 0.1,
+}
+
+_E2E_CHILD = """
+import json, sys
+import email_config
+for name, value in json.loads(sys.argv[3]).items():
+    setattr(email_config, name, value)
+import metrics
+module, entry = sys.argv[1], sys.argv[2]
+sys.argv = [module + ".py"]
+with metrics.run(module):
+    getattr(__import__(module), entry)()
+"""
+
+def write_e2e_state(n, sent_fraction=0.5):
+    """
+    Writes a synthetic campaign of n contacts into the current directory,
+    with the first `sent_fraction` of them already sent. Returns the sent addresses.
+    """
+    sent_count = int(n * sent_fraction)
+    with open("emails.csv", "w") as f:
+        f.write("email,first_name\n")
+        f.writelines(f"user{i}@company{i % 997}.com,Name{i}\n" for i in range(n))
+    with open("sent_log.csv", "w") as f:
+        f.write("email,sent_on\n")
+        f.writelines(f"user{i}@company{i % 997}.com,2026-01-{i % 28 + 1:02d}\n" for i in range(sent_count))
+    return [f"user{i}@company{i % 997}.com" for i in range(sent_count)]
+
+def run_e2e_script(module, entry, config, env):
+    """
+    Runs one script in a fresh interpreter. Returns (seconds, exit code, peak RSS in MB).
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _E2E_CHILD, module, entry, json.dumps(config)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # wait4 reports the peak RSS of this child alone
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return time.perf_counter() - start, proc.returncode, usage.ru_maxrss / 1024
+
+def last_run_phases(path, top=5):
+    """
+    The slowest phases of the last run recorded in a metrics.jsonl, as one line.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return None
+    phases = json.loads(lines[-1])["phases"]
+    slowest = sorted(phases.items(), key=lambda item: -item[1]["sum"])[:top]
+    return ", ".join(f"{name} {phase['sum']:.2f}s/{phase['count']}" for name, phase in slowest)
+
+def bench_e2e(sizes, sends, replies, bounces, latency, throttle_every, reject_every, workers):
+    import fake_servers
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    print(f"End-to-end runs ({sends} sends, {replies} replies, {bounces} bounces, "
+          f"latency {latency * 1e3:.0f} ms, throttle every {throttle_every or '-'}, reject every {reject_every or '-'})")
+    print(f"  {'contacts':>9}  {'script':<15} {'seconds':>8} {'msgs':>6} {'msgs/sec':>9} {'handshakes':>10} {'bytes':>11} {'peak RSS':>9}")
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                sent = write_e2e_state(n)
+                if os.path.exists(os.path.join(repo, email_config.ATTACHMENT_PATH)):
+                    shutil.copy(os.path.join(repo, email_config.ATTACHMENT_PATH), email_config.ATTACHMENT_PATH)
+                mailboxes = fake_servers.synthetic_mailboxes(sent, replies, bounces)
+            finally:
+                os.chdir(cwd)
+
+            smtp = fake_servers.FakeSMTPServer(latency=latency, throttle_every=throttle_every,
+                                               reject_every=reject_every).start()
+            imap = fake_servers.FakeIMAPServer(mailboxes, latency=latency).start()
+            env = {k: v for k, v in os.environ.items() if k != "GITHUB_EVENT_NAME"}
+            env.update(
+                PYTHONPATH=repo, EMAIL_ADDRESS="me@example.com", EMAIL_PASSWORD="benchmark",
+                SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp.port), SMTP_STARTTLS="0",
+                IMAP_HOST="127.0.0.1", IMAP_PORT=str(imap.port), IMAP_SSL="0",
+            )
+            config = dict(E2E_CONFIG, INITIAL_LIMIT=sends, FOLLOWUP_LIMIT=sends, SEND_WORKERS=workers)
+
+            try:
+                for module, entry in E2E_SCRIPTS:
+                    server = smtp if module.startswith("send_") else imap
+                    before = dict(server.counters)
+                    os.chdir(tmp)
+                    try:
+                        elapsed, code, rss = run_e2e_script(module, entry, config, env)
+                    finally:
+                        os.chdir(cwd)
+                    delta = {k: v - before.get(k, 0) for k, v in server.counters.items()}
+
+                    if server is smtp:
+                        messages = delta["messages"]
+                    else:
+                        folders = ["INBOX"] if module == "reply_checker" else email_config.CHECK_FOLDERS
+                        messages = sum(len(mailboxes[f].messages) for f in folders if f in mailboxes)
+                    status = "" if code == 0 else f"  (exit {code})"
+                    print(f"  {n:>9}  {module:<15} {elapsed:8.2f} {messages:>6} {messages / elapsed:9.1f} "
+                          f"{delta['connections']:>10} {delta['bytes_in'] + delta['bytes_out']:>11} {rss:7.1f}MB{status}")
+                    phases = last_run_phases(os.path.join(tmp, "metrics.jsonl"))
+                    if phases:
+                        print(f"  {'':>9}  {'':<15} {phases}")
+            finally:
+                smtp.stop()
+                imap.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the outreach hot paths.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    build = sub.add_parser("build", help="Per-message MIME build time, before/after the attachment cache.")
+    build.add_argument("-n", type=int, default=500, help="Messages to build.")
+
+    render = sub.add_parser("render", help="Per-message template rendering, before/after the variant table.")
+    render.add_argument("-n", type=int, default=100_000, help="Messages to render.")
+
+    followups = sub.add_parser("followups", help="Follow-up selection time at increasing list sizes.")
+    followups.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Contact counts to test.")
+
+    stats_parser = sub.add_parser("stats", help="Full stats build vs. an incremental update from the checkpoint.")
+    stats_parser.add_argument("-n", type=int, default=200_000, help="Sends in the synthetic log.")
+    stats_parser.add_argument("--appended", type=int, default=1_000, help="Sends appended before the update.")
+
+    startup = sub.add_parser("startup", help="Cold-start import time of each script, checked against a budget.")
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="Per-script import budget.")
+
+    bounces = sub.add_parser("bounces", help="Bounce parsing speed and accuracy on bounce_samples/.")
+    bounces.add_argument("--repeat", type=int, default=200, help="Passes over the sample corpus.")
+
+    e2e = sub.add_parser("e2e", help="Run the scripts against local SMTP/IMAP stand-ins on synthetic lists.")
+    e2e.add_argument("--contacts", type=int, nargs="+", default=[10_000, 100_000], help="Contact list sizes to test.")
+    e2e.add_argument("--sends", type=int, default=500, help="Send limit for each sender run.")
+    e2e.add_argument("--replies", type=int, default=500, help="Replies in the synthetic mailbox.")
+    e2e.add_argument("--bounces", type=int, default=500, help="Bounces in the synthetic mailbox.")
+    e2e.add_argument("--latency", type=float, default=0.0, help="Seconds the servers wait before each reply.")
+    e2e.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth recipient with 421 4.7.0.")
+    e2e.add_argument("--reject-every", type=int, default=0, help="Answer every Nth recipient with 550 5.1.1.")
+    e2e.add_argument("--workers", type=int, default=email_config.SEND_WORKERS, help="Send workers per sender.")
+
+    args = parser.parse_args()
+    if args.bench == "build":
+        bench_build(args.n)
+    elif args.bench == "render":
+        bench_render(args.n)
+    elif args.bench == "followups":
+        bench_followups(args.sizes)
+    elif args.bench == "stats":
+        bench_stats(args.n, args.appended)
+    elif args.bench == "startup":
+        bench_startup(args.budget_ms)
+    elif args.bench == "bounces":
+        bench_bounces(args.repeat)
+    elif args.bench == "e2e":
+        bench_e2e(args.contacts, args.sends, args.replies, args.bounces, args.latency,
+                  args.throttle_every, args.reject_every, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,57 @@
-import imaplib
-import email
 import os
-import re
-import csv
+import accounts
+import csv_state
 import email_config
+import dsn_parser
+import imap_utils
 import mailer
+import metrics
+from state_journal import StateJournal
+from sync_state import SyncState
 from datetime import datetime, timedelta
 
 # ---------------- CONFIG ----------------
-IMAP_HOST = "imap.gmail.com"
-EMAIL_USER = email_config.EMAIL_ADDRESS
-EMAIL_PASS = email_config.EMAIL_PASSWORD
+IMAP_HOST = email_config.IMAP_HOST
 
 SENT_LOG_CSV = "sent_log.csv"
 BOUNCED_CSV = "bounced_emails.csv"
 
 DAYS_BACK = email_config.CHECK_DAYS_BACK
+
+# Server-side pre-filter mirroring is_bounce(); IMAP SEARCH matches are
+# case-insensitive substrings, so this is a superset of what is_bounce accepts.
+BOUNCE_SEARCH = (
+    'OR OR FROM "mailer-daemon" SUBJECT "Delivery Status Notification" '
+    'OR SUBJECT "undelivered" HEADER Content-Type "multipart/report"'
+)
+BOUNCE_HEADER_FIELDS = ("FROM", "SUBJECT", "CONTENT-TYPE")
 # ----------------------------------------
 
 logger = mailer.logger
 
-def load_sent_emails():
-    if not os.path.exists(SENT_LOG_CSV):
+def load_sent_emails(sender_accounts):
+    """
+    {account name: addresses it emailed} for the accounts that sent anything.
+    """
+    sent = {
+        account.name: csv_state.read_emails(account.path(SENT_LOG_CSV))
+        for account in sender_accounts if os.path.exists(account.path(SENT_LOG_CSV))
+    }
+    if not sent:
         raise FileNotFoundError("sent_log.csv not found")
-
-    with open(SENT_LOG_CSV, newline="") as f:
-        reader = csv.DictReader(f)
-        return {row["email"].strip().lower() for row in reader}
+    return sent
 
 def load_existing_bounces():
-    if not os.path.exists(BOUNCED_CSV):
-        return set()
-
-    with open(BOUNCED_CSV, newline="") as f:
-        reader = csv.DictReader(f)
-        return {row["email"].strip().lower() for row in reader}
-
-def append_bounce(email_id, bounce_type):
-    file_exists = os.path.exists(BOUNCED_CSV)
-
-    with open(BOUNCED_CSV, "a", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["email", "bounce_type", "detected_on"])
-
-        writer.writerow([
-            email_id,
-            bounce_type,
-            datetime.utcnow().strftime("%Y-%m-%d")
-        ])
-
-def extract_failed_email(text):
-    patterns = [
-        r"Final-Recipient: rfc822;(.+)",
-        r"Original-Recipient: rfc822;(.+)",
-        r"Your message wasn't delivered to\s+(\S+@\S+)"
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group(1).strip().lower()
-
-    return None
-
-def detect_bounce_type(text):
-    text = text.lower()
-    if re.search(r"5\.\d\.\d|address not found|user unknown|no such user", text):
-        return "hard"
-    if re.search(r"4\.\d\.\d|mailbox full|temporarily|try again later", text):
-        return "soft"
-    return "unknown"
+    # bounced_emails.csv has no header row in practice, so don't rely on one
+    return csv_state.read_emails(BOUNCED_CSV)
+
+def append_bounce(email_id, bounce_type, journal):
+    metrics.count("bounces_recorded")
+    journal.append(
+        BOUNCED_CSV,
+        [email_id, bounce_type, datetime.utcnow().strftime("%Y-%m-%d")],
+        header=["email", "bounce_type", "detected_on"]
+    )
 
 def is_bounce(msg):
     from_addr = (msg.get("From") or "").lower()
@@ -84,37 +65,68 @@ def is_bounce(msg):
         or "multipart/report" in content_type
     )
 
-def process_folder(mail, folder_name, since_date, sent_emails, existing_bounces):
-    logger.info(f"Scanning folder: {folder_name}")
-    mail.select(f'"{folder_name}"')
-    
-    status, messages = mail.search(None, f'(SINCE "{since_date}")')
-    new_bounces = 0
-
-    if status != "OK":
-        logger.warning(f"Could not search folder {folder_name}")
-        return 0
-
-    for num in messages[0].split():
-        _, data = mail.fetch(num, "(RFC822)")
-        msg = email.message_from_bytes(data[0][1])
-
-        if not is_bounce(msg):
-            continue
-
-        body = msg.as_string()
-        failed_email = extract_failed_email(body)
-
-        if not failed_email or failed_email not in sent_emails or failed_email in existing_bounces:
-            continue
-
-        bounce_type = detect_bounce_type(body)
-        append_bounce(failed_email, bounce_type)
-        existing_bounces.add(failed_email)
-        new_bounces += 1
-        logger.info(f"Bounce detected: {failed_email} ({bounce_type})")
+def plan_bounce_fetch(result, dsn_sections, full_fetch):
+    """
+    Routes a header + BODYSTRUCTURE fetch result that looks like a bounce:
+    to its delivery-status section when it has one, otherwise to a full fetch.
+    Returns False if the message isn't a bounce.
+    """
+    if not is_bounce(imap_utils.LazyHeaders(result.section("HEADER") or b"")):
+        return False
+    structure = imap_utils.parse_bodystructure(result.text)
+    section = imap_utils.find_part(structure, dsn_parser.DSN_CONTENT_TYPES)
+    if section:
+        dsn_sections.setdefault(section, []).append(result.uid)
+    else:
+        full_fetch.append(result.uid)
+    return True
+
+def fetch_bounce_infos(mail, dsn_sections, full_fetch, stats=None):
+    """
+    Fetches only the delivery-status parts, falling back to the full message
+    for bounces that don't carry a machine-readable report. Yields BounceInfo
+    (or None for messages that name no recipient).
+    """
+    for uid, data in imap_utils.fetch_sections(mail, dsn_sections, stats=stats):
+        with metrics.timer("bounce_parse"):
+            info = dsn_parser.parse_delivery_status(data)
+        yield info
+    for uid in full_fetch:
+        msg = imap_utils.fetch_message(mail, uid, stats=stats)
+        if msg is not None:
+            with metrics.timer("bounce_parse"):
+                info = dsn_parser.parse_bounce(msg)
+            yield info
+
+def process_folder(mail, account, folder_name, since_date, sent_emails, sync):
+    """
+    Scans one of an account's folders on its own connection and returns the
+    bounces of addresses that account emailed. Writing them out is left to
+    the caller.
+    """
+    logger.info(f"Scanning folder: {folder_name} ({account.name})")
+
+    uids = sync.search_new(mail, account.address, folder_name, f'SINCE "{since_date}" {BOUNCE_SEARCH}')
+    if uids is None:
+        raise RuntimeError(f"Could not search folder {folder_name}")
+
+    # Pass 1: headers + structure for the server-filtered candidates only
+    stats = imap_utils.FetchStats()
+    dsn_sections = {}
+    full_fetch = []
+    items = f"(UID BODYSTRUCTURE {imap_utils.header_items(BOUNCE_HEADER_FIELDS)})"
+    for result in imap_utils.fetch(mail, uids, items, stats=stats):
+        plan_bounce_fetch(result, dsn_sections, full_fetch)
+
+    # Pass 2: the delivery-status parts (or whole messages) of the bounces
+    bounces = [
+        info for info in fetch_bounce_infos(mail, dsn_sections, full_fetch, stats)
+        if info and info.recipient in sent_emails
+    ]
 
-    return new_bounces
+    sync.hold_back(account.address, folder_name, stats.failed)
+    logger.info(f"Fetched {folder_name} ({account.name}): {stats}")
+    return bounces
 
 def main():
     if not mailer.should_run(email_config.RUN_BOUNCE_CHECK_AUTO):
@@ -124,29 +136,48 @@ def main():
     logger.info(f"Checking bounces since {since_date}")
 
     try:
-        sent_emails = load_sent_emails()
+        journal = StateJournal("bounce_checker")
+        journal.replay()
+
+        sender_accounts = accounts.load_accounts()
+        sent_emails = load_sent_emails(sender_accounts)
         existing_bounces = load_existing_bounces()
+        sync = SyncState()
 
-        mail = imaplib.IMAP4_SSL(IMAP_HOST)
-        mail.login(EMAIL_USER, EMAIL_PASS)
+        def scan(mail, account, folder):
+            return process_folder(mail, account, folder, since_date, sent_emails[account.name], sync)
 
-        folders_to_scan = ['[Gmail]/All Mail', '[Gmail]/Spam']
+        # Every account's folders are scanned in parallel; results are written here, on one thread
         total_new_bounces = 0
-
-        for folder in folders_to_scan:
-            try:
-                total_new_bounces += process_folder(mail, folder, since_date, sent_emails, existing_bounces)
-            except Exception as e:
-                logger.error(f"Error scanning {folder}: {e}")
+        for account, folder, bounces, error in imap_utils.scan_accounts(
+            [account for account in sender_accounts if account.name in sent_emails],
+            email_config.CHECK_FOLDERS, scan, IMAP_HOST,
+            max_connections=email_config.IMAP_MAX_CONNECTIONS
+        ):
+            if error:
+                logger.error(f"Error scanning {folder} ({account.name}): {error}")
+                continue
+
+            for info in bounces:
+                if info.recipient in existing_bounces:
+                    continue
+                append_bounce(info.recipient, info.bounce_type, journal)
+                existing_bounces.add(info.recipient)
+                total_new_bounces += 1
+                logger.info(f"Bounce detected: {info.recipient} ({info.bounce_type}, status {info.status or 'n/a'})")
+            sync.commit(account.address, folder)
 
         if total_new_bounces == 0:
             logger.info("No new bounces found.")
         else:
             logger.info(f"Finished! Total new bounces detected: {total_new_bounces}")
 
-        mail.logout()
+        # The CSVs must hold every result before the marks move past them
+        journal.compact()
+        sync.save()
     except Exception as e:
         logger.error(f"Bounce check failed: {e}")
 
 if __name__ == "__main__":
-    main()
+    with metrics.run("bounce_checker"):
+        main()
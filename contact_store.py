@@ -0,0 +1,266 @@
+import argparse
+import csv
+import os
+import sqlite3
+import mailer
+from csv_state import account_files, line_ending, normalize, read_rows, today
+
+# ---------------- CONFIG ----------------
+CONTACT_DB = "contacts.db"
+
+EMAILS_CSV = "emails.csv"
+SENT_LOG_CSV = "sent_log.csv"
+FOLLOWUP_CSV = "followup_sent.csv"
+REPLIED_CSV = "replied.csv"
+BOUNCED_CSV = "bounced_emails.csv"
+# ----------------------------------------
+
+logger = mailer.logger
+
+# Bumped whenever the table changes; an older database is dropped and has to be imported again
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    address        TEXT PRIMARY KEY,  -- normalized (stripped, lowercased) lookup key
+    email          TEXT NOT NULL,     -- address as first seen, written back to the CSVs
+    first_name     TEXT,
+    position       INTEGER,           -- row order in emails.csv
+    sent_log       TEXT,              -- the sending account's sent_log*.csv
+    sent_order     INTEGER,           -- row order in that log, set once sent
+    sent_on        TEXT,              -- NULL for sends logged before dates were recorded
+    followup_log   TEXT,
+    followup_order INTEGER,
+    followup_on    TEXT,
+    replied_order  INTEGER,           -- row order in replied.csv
+    replied_on     TEXT,
+    replied_to     TEXT,              -- "initial" or "followup", when known
+    reply_latency  TEXT,              -- seconds, as written to replied.csv
+    bounce_order   INTEGER,           -- row order in bounced_emails.csv
+    bounce_type    TEXT,
+    bounced_on     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sent_order ON contacts(sent_log, sent_order);
+CREATE INDEX IF NOT EXISTS idx_followup_order ON contacts(followup_log, followup_order);
+CREATE INDEX IF NOT EXISTS idx_pending_outreach
+    ON contacts(position) WHERE sent_order IS NULL AND bounce_order IS NULL;
+CREATE INDEX IF NOT EXISTS idx_pending_followup
+    ON contacts(sent_order)
+    WHERE sent_order IS NOT NULL AND followup_order IS NULL AND replied_order IS NULL AND bounce_order IS NULL;
+"""
+
+def _field(row, i):
+    # Missing and empty cells are both stored as NULL
+    return row[i] if len(row) > i and row[i] else None
+
+def _csv_row(values):
+    # Trailing empty cells aren't written, so one-column legacy rows stay one column
+    row = ["" if value is None else str(value) for value in values]
+    while len(row) > 1 and not row[-1]:
+        row.pop()
+    return row
+
+def _first_rows(rows):
+    # The store keeps an address's first row; later repeats of it don't count as a change
+    seen = set()
+    for row in rows:
+        key = normalize(row[0])
+        if key not in seen:
+            seen.add(key)
+            yield _csv_row(row)
+
+class ContactStore:
+    """
+    SQLite-backed campaign state with one row per address.
+
+    An indexed local copy of the campaign CSVs for lookups and pending-set
+    queries; the sending and checking scripts don't use it, and the CSVs
+    stay the git-committed source of truth. import_csvs() loads them with
+    every column, and export_csvs() writes back only the files whose rows
+    changed, keeping their header rows and line endings.
+    """
+
+    def __init__(self, path=CONTACT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Only ever a copy of the CSVs, so an old layout is simply rebuilt
+            self.conn.execute("DROP TABLE IF EXISTS contacts")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Import / Export ---
+
+    def _upsert(self, columns, rows):
+        """
+        Inserts rows of (address, email, *columns), filling in only the
+        columns an existing contact doesn't have yet.
+        """
+        self.conn.executemany(f"""
+            INSERT INTO contacts (address, email, {", ".join(columns)}) VALUES (?, ?{", ?" * len(columns)})
+            ON CONFLICT(address) DO UPDATE SET
+                {", ".join(f"{c} = COALESCE(contacts.{c}, excluded.{c})" for c in columns)}
+        """, ((normalize(row[0]), row[0], *values) for row, values in rows))
+
+    def import_csvs(self):
+        """
+        Merges all state CSVs, every account's logs included, into the
+        database. Re-importing is idempotent: existing values are kept and
+        only missing facts are filled in. Dates the CSVs don't have stay NULL.
+        """
+        with self.conn:
+            self._upsert(["first_name", "position"], (
+                (row, (row[1] if len(row) > 1 else "", i)) for i, row in enumerate(read_rows(EMAILS_CSV))
+            ))
+            for path, step in ((SENT_LOG_CSV, "sent"), (FOLLOWUP_CSV, "followup")):
+                for log in account_files(path):
+                    self._upsert([f"{step}_log", f"{step}_order", f"{step}_on"], (
+                        (row, (log, i, _field(row, 1))) for i, row in enumerate(read_rows(log))
+                    ))
+            self._upsert(["replied_order", "replied_on", "replied_to", "reply_latency"], (
+                (row, (i, _field(row, 1), _field(row, 2), _field(row, 3)))
+                for i, row in enumerate(read_rows(REPLIED_CSV))
+            ))
+            self._upsert(["bounce_order", "bounce_type", "bounced_on"], (
+                (row, (i, _field(row, 1), _field(row, 2))) for i, row in enumerate(read_rows(BOUNCED_CSV))
+            ))
+
+        logger.info(f"Imported campaign CSVs into {self.path}: {self.count()} contacts.")
+
+    def _export(self, path, header, sql, params=()):
+        """
+        Rewrites one CSV from the database if its rows changed. An existing
+        file keeps its header row (or blank first line), line endings and
+        the spelling of its addresses. Returns True if the file was written.
+        """
+        existing = list(read_rows(path))
+        spelling = {}
+        for row in existing:
+            spelling.setdefault(normalize(row[0]), row[0])
+        rows = [_csv_row([spelling.get(normalize(row[0]), row[0]), *row[1:]]) for row in self.conn.execute(sql, params)]
+        if rows == list(_first_rows(existing)):
+            return False
+        lineterminator = line_ending(path)
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                first = next(csv.reader(f), None)
+            if first is not None:
+                # Headerless files stay headerless
+                header = first if not first or first[0].strip().lower() in ("", "email") else None
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator=lineterminator)
+            if header is not None:
+                writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+        return True
+
+    def export_csvs(self):
+        """
+        Writes the database back to the CSVs it was imported from.
+        """
+        written = [self._export(
+            EMAILS_CSV, ["email", "first_name"],
+            "SELECT email, first_name FROM contacts WHERE position IS NOT NULL ORDER BY position"
+        )]
+        for path, step in ((SENT_LOG_CSV, "sent"), (FOLLOWUP_CSV, "followup")):
+            logs = {row[0] for row in self.conn.execute(f"SELECT DISTINCT {step}_log FROM contacts WHERE {step}_log IS NOT NULL")}
+            for log in sorted(logs | {path}):
+                written.append(self._export(
+                    log, ["email", "sent_on"],
+                    f"SELECT email, {step}_on FROM contacts WHERE {step}_log = ? ORDER BY {step}_order", (log,)
+                ))
+        written.append(self._export(
+            REPLIED_CSV, ["email", "detected_on", "replied_to", "latency_seconds"],
+            """SELECT email, replied_on, replied_to, reply_latency FROM contacts
+               WHERE replied_order IS NOT NULL ORDER BY replied_order"""
+        ))
+        written.append(self._export(
+            BOUNCED_CSV, ["email", "bounce_type", "detected_on"],
+            "SELECT email, bounce_type, bounced_on FROM contacts WHERE bounce_order IS NOT NULL ORDER BY bounce_order"
+        ))
+        logger.info(f"Exported {self.path} back to the campaign CSVs ({sum(written)} file(s) changed).")
+
+    # --- Queries ---
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+    def get(self, address):
+        return self.conn.execute("SELECT * FROM contacts WHERE address = ?", (normalize(address),)).fetchone()
+
+    def pending_outreach(self, limit):
+        return self.conn.execute("""
+            SELECT email, first_name FROM contacts INDEXED BY idx_pending_outreach
+            WHERE sent_order IS NULL AND bounce_order IS NULL
+            ORDER BY position LIMIT ?
+        """, (limit,)).fetchall()
+
+    def pending_followups(self, limit):
+        return self.conn.execute("""
+            SELECT email, first_name FROM contacts INDEXED BY idx_pending_followup
+            WHERE sent_order IS NOT NULL AND followup_order IS NULL AND replied_order IS NULL AND bounce_order IS NULL
+            ORDER BY sent_order LIMIT ?
+        """, (limit,)).fetchall()
+
+    # --- Updates ---
+
+    def _mark(self, address, **values):
+        columns = list(values)
+        with self.conn:
+            self.conn.execute(f"""
+                INSERT INTO contacts (address, email, {", ".join(columns)}) VALUES (?, ?{", ?" * len(columns)})
+                ON CONFLICT(address) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in columns)}
+            """, [normalize(address), str(address).strip(), *values.values()])
+
+    def _next_order(self, column):
+        return self.conn.execute(f"SELECT COALESCE(MAX({column}), -1) + 1 FROM contacts").fetchone()[0]
+
+    def mark_sent(self, address, when=None, log=SENT_LOG_CSV):
+        self._mark(address, sent_log=log, sent_on=when or today(), sent_order=self._next_order("sent_order"))
+
+    def mark_followup(self, address, when=None, log=FOLLOWUP_CSV):
+        self._mark(address, followup_log=log, followup_on=when or today(),
+                   followup_order=self._next_order("followup_order"))
+
+    def mark_replied(self, address, when=None, replied_to=None, latency=None):
+        self._mark(address, replied_on=when or today(), replied_to=replied_to,
+                   reply_latency=None if latency is None else str(latency),
+                   replied_order=self._next_order("replied_order"))
+
+    def mark_bounced(self, address, bounce_type, when=None):
+        self._mark(address, bounced_on=when or today(), bounce_type=bounce_type,
+                   bounce_order=self._next_order("bounce_order"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the SQLite contact-state store.")
+    parser.add_argument("command", choices=["import", "export", "status"],
+                        help="import the CSVs, export back to them, or print pending counts.")
+    parser.add_argument("--db", default=CONTACT_DB, help="Path to the SQLite database.")
+    args = parser.parse_args()
+
+    with ContactStore(args.db) as store:
+        if args.command == "import":
+            store.import_csvs()
+        elif args.command == "export":
+            store.export_csvs()
+        else:
+            print(f"Contacts:           {store.count()}")
+            print(f"Pending outreach:   {len(store.pending_outreach(-1))}")
+            print(f"Pending follow-ups: {len(store.pending_followups(-1))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import csv
+import glob
+import os
+from datetime import datetime
+import email_config
+import metrics
+
+# ---------------- CONFIG ----------------
+# Files at least this large are read through pandas' C parser when pandas is
+# installed. Everything smaller (i.e. every normal run) uses the csv module,
+# so pandas is never imported on the send and check paths.
+PANDAS_MIN_BYTES = 64 * 1024 * 1024
+# ----------------------------------------
+
+def normalize(address):
+    return str(address).strip().lower()
+
+def today():
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+def _pandas():
+    try:
+        import pandas
+    except ImportError:
+        return None
+    return pandas
+
+def read_rows(path):
+    """
+    Yields the data rows of one of the state CSVs as lists of stripped fields.
+    Tolerates blank lines, missing headers and rows with extra columns.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].lower() == "email":
+                continue
+            yield row
+
+def iter_column(path, index=0):
+    """
+    Yields one column of a state CSV, with the same tolerance as read_rows().
+    """
+    if not os.path.exists(path):
+        return
+
+    pd = _pandas() if os.path.getsize(path) >= PANDAS_MIN_BYTES else None
+    if pd is None:
+        for row in read_rows(path):
+            if len(row) > index:
+                yield row[index]
+        return
+
+    for chunk in pd.read_csv(path, header=None, usecols=[index], dtype=str, keep_default_na=False,
+                             chunksize=email_config.CSV_CHUNK_SIZE):
+        for value in chunk[index]:
+            value = value.strip()
+            if value and value.lower() != "email":
+                yield value
+
+def read_emails(path):
+    """
+    The set of normalized addresses in the first column of a state CSV.
+    """
+    with metrics.timer("csv_load"):
+        return {normalize(value) for value in iter_column(path)}
+
+def iter_contacts(path):
+    """
+    Streams (email, first_name) pairs from a contact list, as far as the caller consumes.
+    """
+    for row in read_rows(path):
+        yield row[0], row[1] if len(row) > 1 else ""
+
+def account_files(path):
+    """
+    `path` plus the copies other sending accounts keep next to it
+    (e.g. sent_log.work.csv), for reads that must cover every account.
+    """
+    root, ext = os.path.splitext(path)
+    return [path] + sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+def line_ending(path):
+    """
+    The line ending an existing file uses ("\r\n" or "\n"), so rewrites and
+    appends don't mix the two.
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.readline().endswith(b"\r\n"):
+                return "\r\n"
+    return "\n"
+
+def ensure_file(path, header):
+    if not os.path.exists(path):
+        with open(path, "w", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerow(header)
+
+def append_rows(path, rows, header=None, fsync=False, lineterminator="\n"):
+    """
+    Appends rows to a state CSV, writing `header` first if the file is new.
+    Also terminates a last line left without a newline, so rows never merge.
+    """
+    exists = os.path.exists(path) and os.path.getsize(path) > 0
+    needs_newline = False
+    if exists:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) not in (b"\n", b"\r")
+
+    with open(path, "a", newline="") as f:
+        if needs_newline:
+            f.write(lineterminator)
+        writer = csv.writer(f, lineterminator=lineterminator)
+        if not exists and header:
+            writer.writerow(header)
+        writer.writerows(rows)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+def append_row(path, row, header=None):
+    append_rows(path, [row], header)
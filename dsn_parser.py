@@ -0,0 +1,137 @@
+import re
+from collections import namedtuple
+
+# ---------------- CONFIG ----------------
+DSN_CONTENT_TYPES = {"message/delivery-status", "message/global-delivery-status"}
+
+# Upper bound on the human-readable text scanned when a bounce has no DSN part
+TEXT_SCAN_LIMIT = 64 * 1024
+# ----------------------------------------
+
+BounceInfo = namedtuple("BounceInfo", ["recipient", "bounce_type", "status", "diagnostic"])
+
+# Fields of a message/delivery-status body (RFC 3464)
+_FINAL_RECIPIENT_RE = re.compile(rb"^Final-Recipient:[ \t]*rfc822;[ \t]*<?([^\s<>]+@[^\s<>]+)>?", re.I | re.M)
+_ORIGINAL_RECIPIENT_RE = re.compile(rb"^Original-Recipient:[ \t]*rfc822;[ \t]*<?([^\s<>]+@[^\s<>]+)>?", re.I | re.M)
+_STATUS_RE = re.compile(rb"^Status:[ \t]*([245]\.\d{1,3}\.\d{1,3})", re.I | re.M)
+_DIAGNOSTIC_RE = re.compile(rb"^Diagnostic-Code:[ \t]*(?:[\w-]+;)?[ \t]*(.*(?:\r?\n[ \t].*)*)", re.I | re.M)
+
+# Fallback patterns for free-text bounce notices
+_TEXT_RECIPIENT_RE = re.compile(
+    r"(?:wasn't delivered to|could not be delivered to|delivery to the following recipients? failed[^\n]*\n)"
+    r"\s*<?([\w.+'-]+@[\w-]+(?:\.[\w-]+)+)>?",
+    re.I
+)
+_ENHANCED_STATUS_RE = re.compile(r"(?<![\d.])([245]\.\d{1,3}\.\d{1,3})(?![\d.])")
+_SMTP_CODE_RE = re.compile(r"(?<!\d)([45])\d\d(?!\d)")
+_HARD_TEXT_RE = re.compile(r"address not found|couldn.t be found|user unknown|no such user|does not exist|unknown recipient|recipient address rejected", re.I)
+_SOFT_TEXT_RE = re.compile(r"mailbox full|over quota|temporar|try again later|deferred", re.I)
+
+# Permanent failures that reject the message (size, content, policy or the
+# sender's reputation) rather than the address: "policy", not "hard".
+# 5.7.13 is a disabled recipient account, and 5.7.1 ("delivery not
+# authorized") is used for both, so it counts as policy only when the
+# diagnostic blames the message or the sender
+_POLICY_STATUS_RE = re.compile(r"^5\.(?:3\.4|6\.\d{1,3}|7\.(?!1$|13$)\d{1,3})$")
+_POLICY_TEXT_RE = re.compile(r"spam|content|reputation|blocked|blacklist|blocklist|dmarc|spf|dkim|policy", re.I)
+
+def _type_from_status(status, diagnostic=""):
+    if _POLICY_STATUS_RE.match(status):
+        return "policy"
+    if status == "5.7.1" and _POLICY_TEXT_RE.search(diagnostic):
+        return "policy"
+    if status.startswith("5"):
+        return "hard"
+    if status.startswith("4"):
+        return "soft"
+    return None
+
+def _classify(status, diagnostic, text):
+    """
+    The enhanced status code decides when present; otherwise fall back to the
+    basic SMTP code in the diagnostic and finally to wording in the text.
+    """
+    if status:
+        return _type_from_status(status, diagnostic or text)
+    if diagnostic:
+        code = _SMTP_CODE_RE.search(diagnostic)
+        if code:
+            return "hard" if code.group(1) == "5" else "soft"
+    if _HARD_TEXT_RE.search(text):
+        return "hard"
+    if _SOFT_TEXT_RE.search(text):
+        return "soft"
+    return "unknown"
+
+def parse_delivery_status(data):
+    """
+    Parses the body of a message/delivery-status part.
+    Returns a BounceInfo, or None if it names no recipient or reports success.
+    """
+    match = _FINAL_RECIPIENT_RE.search(data) or _ORIGINAL_RECIPIENT_RE.search(data)
+    if not match:
+        return None
+    recipient = match.group(1).decode("utf-8", "replace").strip().lower()
+
+    status_match = _STATUS_RE.search(data)
+    status = status_match.group(1).decode("ascii") if status_match else None
+    if status and status.startswith("2"):
+        return None
+
+    diag_match = _DIAGNOSTIC_RE.search(data)
+    diagnostic = " ".join(diag_match.group(1).decode("utf-8", "replace").split()) if diag_match else None
+
+    return BounceInfo(recipient, _classify(status, diagnostic, diagnostic or ""), status, diagnostic)
+
+def parse_bounce_text(text):
+    """
+    Bounded free-text scan for bounces without a machine-readable report.
+    """
+    text = text[:TEXT_SCAN_LIMIT]
+    match = _TEXT_RECIPIENT_RE.search(text)
+    if not match:
+        return None
+    status_match = _ENHANCED_STATUS_RE.search(text)
+    status = status_match.group(1) if status_match else None
+    if status and status.startswith("2"):
+        status = None
+    return BounceInfo(match.group(1).lower(), _classify(status, None, text), status, None)
+
+def _iter_parts(msg):
+    """
+    Walks the MIME tree without descending into attached (returned) messages.
+    """
+    yield msg
+    if msg.is_multipart():
+        for part in msg.get_payload():
+            if part.get_content_type() == "message/rfc822":
+                continue
+            yield from _iter_parts(part)
+
+def _part_bytes(part):
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        # The stdlib parses delivery-status bodies into one header block per recipient
+        return b"\n".join(block.as_bytes() for block in payload)
+    return part.get_payload(decode=True) or b""
+
+def parse_bounce(msg):
+    """
+    Extracts the failed recipient and bounce type from a parsed bounce message.
+    Reads only the delivery-status part when there is one, otherwise scans
+    the message's own text parts.
+    """
+    texts = []
+    size = 0
+    for part in _iter_parts(msg):
+        content_type = part.get_content_type()
+        if content_type in DSN_CONTENT_TYPES:
+            info = parse_delivery_status(_part_bytes(part))
+            if info:
+                return info
+        elif part.get_content_maintype() == "text" and size < TEXT_SCAN_LIMIT:
+            payload = part.get_payload(decode=True) or b""
+            text = payload.decode(part.get_content_charset() or "utf-8", "replace")
+            texts.append(text)
+            size += len(text)
+    return parse_bounce_text("\n".join(texts))
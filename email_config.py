@@ -1,3 +1,4 @@
+import json
 import os
 
 # --- Automation & Depth Settings ---
@@ -5,6 +6,7 @@ RUN_OUTREACH_AUTO = True
 RUN_FOLLOWUP_AUTO = False
 RUN_BOUNCE_CHECK_AUTO = False
 RUN_REPLY_CHECK_AUTO = False
+RUN_MAIL_CHECK_AUTO = False
 CHECK_DAYS_BACK = 40
 
 # --- General Configuration ---
@@ -12,8 +14,97 @@ EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 
 ATTACHMENT_PATH = "resume.pdf"
+
+# --- Sender Accounts ---
+# More mailboxes to spread the sends over, as a JSON list in the SENDER_ACCOUNTS environment
+# variable, e.g. [{"name": "work", "address": "me@work.com", "password": "...", "limit": 80}].
+# EMAIL_ADDRESS is always the first ("main") account. Each recipient belongs to one account
+# for good (by a stable hash of the address); "limit" and "followup_limit" are that account's
+# per-run quotas and default to INITIAL_LIMIT / FOLLOWUP_LIMIT.
+SENDER_ACCOUNTS = json.loads(os.environ.get("SENDER_ACCOUNTS") or "[]")
+
+# --- Server Settings ---
+# Gmail by default; the environment can point the scripts elsewhere (e.g. the local
+# stand-ins started by `benchmark.py e2e`)
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") != "0"
+IMAP_HOST = os.environ.get("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.environ.get("IMAP_PORT", 993))
+IMAP_SSL = os.environ.get("IMAP_SSL", "1") != "0"
+
+# Large contact lists are streamed in chunks of this many rows
+CSV_CHUNK_SIZE = 10_000
+
+# --- SMTP Connection Settings ---
+# Authenticated connections are reused across sends and recycled after this many messages
+SMTP_MAX_MESSAGES_PER_CONNECTION = 20
+# Seeds the per-recipient template variant; change it to reshuffle who gets which variant
+TEMPLATE_SEED = "outreach"
 LINKS = "\nhttps://warriorwhocodes.com\nhttps://www.linkedin.com/in/ankushsinghgandhi"
 
+# --- Suppression Settings ---
+# Hard-bounced addresses in bounced_emails.csv and those in replied.csv and unsubscribed.csv are
+# never emailed again. A domain is suppressed entirely once this many distinct addresses on it
+# hard-bounced (soft bounces and "policy" rejects of the message itself don't count).
+SUPPRESS_DOMAIN_AFTER_HARD_BOUNCES = 5
+SUPPRESSION_EXEMPT_DOMAINS = {"gmail.com", "yahoo.com", "outlook.com", "hotmail.com"}
+
+# --- Ingest Settings ---
+# ingest.py normalizes and dedupes emails.csv; with MX checks on, addresses on domains
+# that can't receive mail are suppressed before any send is attempted
+INGEST_CHECK_MX = False
+MX_CACHE_DAYS = 30
+MX_LOOKUP_WORKERS = 16
+MX_LOOKUP_TIMEOUT = 3
+# extract_contacts.py reads new contacts from the PDFs in "email collections/". Files with at
+# least this many new pages are split across PDF_WORKERS processes (None = one per CPU)
+PDF_POOL_MIN_PAGES = 8
+PDF_WORKERS = None
+# "builtin" reads plain PDF exports (like Google Sheets') without any dependency, falling back
+# to pypdf when it's installed; "pypdf" always reads with pypdf (pip install pypdf)
+PDF_READER = "builtin"
+
+# --- Inbox Check Settings ---
+# Folders scanned by the checkers, each on its own IMAP connection in parallel
+CHECK_FOLDERS = ["[Gmail]/All Mail", "[Gmail]/Spam"]
+IMAP_MAX_CONNECTIONS = 4
+
+# --- Scheduler Settings ---
+# Sends run on SEND_WORKERS threads; each keeps its own MIN..MAX delay between messages
+SEND_WORKERS = 4
+MAX_SENDS_PER_MINUTE = 4        # Global cap across all workers (0 = no cap)
+DOMAIN_MIN_INTERVAL = 300       # Seconds between two sends to the same domain
+RUN_BUDGET_SECONDS = 5 * 60 * 60  # Stop starting new sends after this long (None = no budget)
+SEND_FAILURE_DELAY = 5          # Seconds a worker waits after a failed send
+# Pending recipients are interleaved by domain, looking this many ahead in the list
+DOMAIN_LOOKAHEAD = 1000
+DOMAIN_MAX_PER_RUN = 10         # Per-domain cap on successful sends per run (0 = no cap)
+# A throttling SMTP reply (421/45x) pauses all senders and doubles this backoff; each success halves it
+RATE_INITIAL_BACKOFF = 30
+RATE_MAX_BACKOFF = 30 * 60
+
+# --- Outbox Settings ---
+# Both senders drain outbox.db. Once fewer jobs are ready than a run's limit, it walks the
+# contact lists again and enqueues up to this many more
+OUTBOX_REFILL_SIZE = 1000
+OUTBOX_CLAIM_BATCH = 50         # Jobs a sender takes from the outbox at a time
+OUTBOX_MAX_ATTEMPTS = 3         # Failed sends are retried until they've been tried this often
+OUTBOX_RETRY_DELAY = 6 * 60 * 60  # Seconds before a failed send may be retried
+OUTBOX_LEASE_SECONDS = 60 * 60  # Claimed jobs of a sender that died go back to the queue after this long
+
+# --- Metrics Settings ---
+# Every run records per-phase timings and counters: "jsonl" appends one line per run to
+# METRICS_FILE, "prometheus" replaces it with a node_exporter textfile, None turns it off
+# (METRICS_FORMAT=none, off or empty in the environment). {script} in the file name is replaced
+# by the script's name.
+METRICS_FORMAT = os.environ.get("METRICS_FORMAT", "jsonl").strip().lower()
+if METRICS_FORMAT in ("", "none", "off"):
+    METRICS_FORMAT = None
+METRICS_FILE = os.environ.get("METRICS_FILE", "metrics.jsonl")
+# OUTREACH_PROFILE=1 also saves a cProfile capture of each run to <script>.pstats
+PROFILE_RUNS = os.environ.get("OUTREACH_PROFILE") == "1"
+
 # --- Initial Outreach Settings ---
 INITIAL_LIMIT = 100
 INITIAL_MIN_DELAY = 60
@@ -0,0 +1,766 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import csv_state
+import email_config
+import mailer
+import metrics
+from ingest import clean_address
+
+# ---------------- CONFIG ----------------
+COLLECTIONS_DIR = "email collections"
+EMAILS_CSV = "emails.csv"
+PDF_CACHE = ".pdf_cache.json"
+
+# Used as first_name for role addresses (careers@, jobs@, ...), as in emails.csv
+ROLE_NAME = "Team"
+ROLE_WORDS = {
+    "admin", "admissions", "apply", "campus", "career", "careers", "contact", "cv", "enquiry",
+    "freshers", "hello", "hiring", "india", "info", "job", "jobs", "join", "joinus", "mail",
+    "marketing", "office", "opportunities", "people", "placement", "placements", "recruiter",
+    "recruiters", "recruiting", "recruitment", "resume", "resumes", "sales", "support", "talent",
+    "team", "work",
+}
+# Text units below a cut-off address that its wrapped remainder may sit
+WRAP_DISTANCE = 30
+# Bumped whenever a page's extracted contacts change, so cached pages are read again
+CACHE_VERSION = 2
+# ----------------------------------------
+
+logger = mailer.logger
+
+# An address glued to the text before it (e.g. a "@Company" mention in the cell next to it) isn't one
+_EMAIL_RE = re.compile(r"(?<![A-Za-z0-9._%+'@-])[A-Za-z0-9._%+'-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}")
+_LOCAL_WORD_RE = re.compile(r"[a-z]+")
+_NAME_WORD_RE = re.compile(r"[A-Za-z]{2,}")
+_SEPARATOR_RE = re.compile(r"[\s,;/]+")
+_LOCAL_PART_RE = re.compile(r"[A-Za-z0-9._%+'-]+")
+_DOMAIN_PART_RE = re.compile(r"@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}")
+
+PageText = namedtuple("PageText", ["lines", "links"])
+ExtractReport = namedtuple("ExtractReport", ["files", "pages", "extracted", "contacts", "invalid", "added"])
+
+# --- Contacts from text ---
+
+def first_name_for(address, context=""):
+    """
+    The first name to greet `address` with: the word in `context` (the text
+    before it on its row, usually a Name column) that its local part starts
+    with, else the local part's first word capitalized, or ROLE_NAME for
+    role addresses.
+    """
+    words = _LOCAL_WORD_RE.findall(address.split("@", 1)[0].lower())
+    words = [word for word in words if len(word) > 1] or words
+    if not words or words[0] in ROLE_WORDS:
+        return ROLE_NAME
+    local = "".join(words)
+    for word in _NAME_WORD_RE.findall(context):
+        if len(word) > 2 and local.startswith(word.lower()):
+            return word.capitalize()
+    return words[0].capitalize()
+
+def _join_wrapped(lines):
+    # A cell too narrow for its address wraps it onto the next line, right after the @
+    joined = []
+    for line in lines:
+        if joined and joined[-1].endswith("@") and not line.startswith("@"):
+            head, _, rest = line.partition(" ")
+            joined[-1] += head
+            line = rest
+            if not line:
+                continue
+        joined.append(line)
+    return joined
+
+def contacts_from_page(page):
+    """
+    Returns [(address, first_name, reason)] for every address on a page,
+    in order, with `reason` set when clean_address() rejects it. Addresses
+    behind mailto: links count too, which catches ones the layout cut off.
+    """
+    contacts = []
+    seen = set()
+    for line in _join_wrapped(page.lines):
+        for match in _EMAIL_RE.finditer(line):
+            address, reason = clean_address(match.group(0).strip(".'-"))
+            if address not in seen:
+                seen.add(address)
+                contacts.append((address, first_name_for(address, line[:match.start()]), reason))
+    for link in page.links:
+        address, reason = clean_address(link)
+        if address not in seen:
+            seen.add(address)
+            contacts.append((address, first_name_for(address), reason))
+    return contacts
+
+# --- Built-in PDF reader ---
+
+class UnsupportedPDF(Exception):
+    pass
+
+# What the reader trips over in a damaged file: reported like an unsupported file
+_MALFORMED_ERRORS = (ValueError, IndexError, KeyError, TypeError, AttributeError, zlib.error)
+
+@contextmanager
+def _malformed():
+    try:
+        yield
+    except _MALFORMED_ERRORS as e:
+        raise UnsupportedPDF(f"malformed PDF ({type(e).__name__}: {e})") from e
+
+Ref = namedtuple("Ref", ["num"])
+Stream = namedtuple("Stream", ["attrs", "raw"])
+
+_TOKEN_RE = re.compile(rb"""
+    \s*(?:
+      %[^\r\n]*
+    | (?P<open><<|\[)
+    | (?P<close>>>|\])
+    | /(?P<name>[^\s/<>\[\]()%{}]*)
+    | \((?P<string>(?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*)\)
+    | <(?P<hex>[0-9A-Fa-f\s]*)>
+    | (?P<word>[^\s/<>\[\]()%{}]+)
+    )""", re.S | re.X)
+_NUMBER_RE = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)$")
+_ESCAPE_RE = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.S)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"\n": b"", b"\r": b"", b"\r\n": b""}
+_NUMBER_START = frozenset(b"+-.0123456789")
+_TEXT_BLOCK_RE = re.compile(rb"\bBT\b(.*?)\bET\b", re.S)
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+
+def _unescape(raw):
+    def replace(match):
+        char = match.group(1)
+        if char[:1].isdigit():
+            return bytes([int(char, 8) & 0xFF])
+        return _ESCAPES.get(char, char)
+    return _ESCAPE_RE.sub(replace, raw)
+
+def _number(word):
+    return float(word) if b"." in word else int(word)
+
+class BuiltinDocument:
+    """
+    Just enough of a PDF reader for text-only exports such as the Google
+    Sheets lists in email collections/: a classic cross-reference table,
+    FlateDecode streams and fonts with ToUnicode maps. Files it can't read,
+    damaged ones included, raise UnsupportedPDF; pypdf, if installed, takes
+    those.
+
+    It exists because everything else here runs on the standard library
+    alone (neither the setup nor the workflows install a package), so
+    reading the lists shouldn't be the one step that needs one.
+
+    Text comes out as lines of cells: every run is placed by its text
+    matrix and runs on the same baseline form a line. An address wrapped
+    inside its cell is joined back up first.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.offsets = {}
+        self._objects = {}
+        self._fonts = {}
+        self.pages = []
+        with _malformed():
+            self.trailer = self._read_xref()
+            if "Encrypt" in self.trailer:
+                raise UnsupportedPDF("encrypted")
+            self._collect_pages((self.resolve(self.trailer.get("Root")) or {}).get("Pages"), {}, set())
+
+    # Objects
+
+    def _read_xref(self):
+        start = self.data.rfind(b"startxref")
+        if start < 0:
+            raise UnsupportedPDF("no startxref")
+        offset = int(self.data[start + 9:start + 40].split()[0])
+        trailer = None
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            if not self.data.startswith(b"xref", offset):
+                raise UnsupportedPDF("cross-reference stream")
+            end = self.data.index(b"trailer", offset)
+            number = 0
+            for line in self.data[offset + 4:end].splitlines():
+                fields = line.split()
+                if len(fields) == 2:
+                    number = int(fields[0])
+                    continue
+                match = _XREF_ENTRY_RE.match(line.strip())
+                if match:
+                    # Newer sections (read first) win over the ones they update
+                    if match.group(3) == b"n" and number not in self.offsets:
+                        self.offsets[number] = int(match.group(1))
+                    number += 1
+            section, _ = self._parse(self.data, end + len(b"trailer"))
+            trailer = trailer or section
+            if "XRefStm" in section:
+                raise UnsupportedPDF("hybrid cross-reference")
+            offset = section.get("Prev")
+        return trailer
+
+    def _parse(self, data, pos):
+        match = _TOKEN_RE.match(data, pos)
+        while match and match.lastgroup is None:
+            # Skipped a comment
+            pos = match.end()
+            match = _TOKEN_RE.match(data, pos)
+        if not match:
+            raise UnsupportedPDF(f"unreadable object at {pos}")
+        kind, pos = match.lastgroup, match.end()
+        if kind == "open":
+            if match.group("open") == b"[":
+                items = []
+                while True:
+                    close = _TOKEN_RE.match(data, pos)
+                    if close and close.lastgroup == "close":
+                        return items, close.end()
+                    item, pos = self._parse(data, pos)
+                    items.append(item)
+            attrs = {}
+            while True:
+                close = _TOKEN_RE.match(data, pos)
+                if close and close.lastgroup == "close":
+                    return attrs, close.end()
+                key, pos = self._parse(data, pos)
+                attrs[key], pos = self._parse(data, pos)
+        if kind == "name":
+            return match.group("name").decode("latin-1"), pos
+        if kind == "string":
+            return _unescape(match.group("string")), pos
+        if kind == "hex":
+            digits = re.sub(rb"\s", b"", match.group("hex"))
+            return bytes.fromhex((digits + b"0" * (len(digits) % 2)).decode("ascii")), pos
+        word = match.group("word")
+        if _NUMBER_RE.match(word):
+            # "12 0 R" is a reference, not two numbers
+            ref = re.compile(rb"\s+(\d+)\s+R\b").match(data, pos)
+            if ref and word.isdigit():
+                return Ref(int(word)), ref.end()
+            return _number(word), pos
+        return {b"true": True, b"false": False, b"null": None}.get(word, word.decode("latin-1")), pos
+
+    def resolve(self, value):
+        if not isinstance(value, Ref):
+            return value
+        if value.num in self._objects:
+            return self._objects[value.num]
+        offset = self.offsets.get(value.num)
+        if offset is None:
+            raise UnsupportedPDF(f"object {value.num} not in the cross-reference table (object streams need pypdf)")
+        header = re.compile(rb"\s*\d+\s+\d+\s+obj\b").match(self.data, offset)
+        if not header:
+            raise UnsupportedPDF(f"bad offset for object {value.num}")
+        obj, pos = self._parse(self.data, header.end())
+        stream = re.compile(rb"\s*stream\r?\n").match(self.data, pos)
+        if stream and isinstance(obj, dict):
+            length = self.resolve(obj.get("Length"))
+            obj = Stream(obj, self.data[stream.end():stream.end() + length])
+        self._objects[value.num] = obj
+        return obj
+
+    def stream_data(self, stream):
+        stream = self.resolve(stream)
+        filters = self.resolve(stream.attrs.get("Filter"))
+        filters = filters if isinstance(filters, list) else [filters] if filters else []
+        data = stream.raw
+        for name in filters:
+            if name != "FlateDecode":
+                raise UnsupportedPDF(f"{name} streams")
+            inflate = zlib.decompressobj()
+            data = inflate.decompress(data)
+            if not inflate.eof:
+                # Text would silently go missing; pypdf is more forgiving
+                raise UnsupportedPDF("truncated FlateDecode stream")
+        return data
+
+    # Pages
+
+    def _collect_pages(self, node, inherited, seen):
+        if isinstance(node, Ref):
+            if node.num in seen:
+                raise UnsupportedPDF(f"page tree loops back to object {node.num}")
+            seen.add(node.num)
+        node = self.resolve(node)
+        inherited = dict(inherited, **{key: node[key] for key in ("Resources",) if key in node})
+        if node.get("Type") == "Pages" or "Kids" in node:
+            for kid in self.resolve(node.get("Kids", [])):
+                self._collect_pages(kid, inherited, seen)
+        else:
+            self.pages.append(dict(inherited, **node))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def _contents(self, page):
+        contents = self.resolve(page.get("Contents"))
+        return contents if isinstance(contents, list) else [contents] if contents else []
+
+    def _page_fonts(self, page):
+        resources = self.resolve(page.get("Resources")) or {}
+        return self.resolve(resources.get("Font")) or {}
+
+    def _links(self, page):
+        links = []
+        for annot in self.resolve(page.get("Annots")) or []:
+            action = self.resolve(self.resolve(annot).get("A")) or {}
+            uri = self.resolve(action.get("URI"))
+            if isinstance(uri, bytes) and uri.lower().startswith(b"mailto:"):
+                links.append(uri[7:].split(b"?")[0].decode("latin-1"))
+        return links
+
+    def page_key(self, index):
+        """
+        Hash of everything that decides a page's text: its content streams
+        (still compressed), the character maps of its fonts and its links.
+        """
+        page = self.pages[index]
+        digest = hashlib.sha1()
+        with _malformed():
+            for stream in self._contents(page):
+                digest.update(self.resolve(stream).raw)
+            for name, font in sorted(self._page_fonts(page).items()):
+                to_unicode = self.resolve(font).get("ToUnicode")
+                digest.update(name.encode() + (self.resolve(to_unicode).raw if to_unicode else b""))
+            digest.update("\n".join(self._links(page)).encode())
+        return digest.hexdigest()
+
+    # Text
+
+    def _font(self, ref):
+        """
+        (code width in bytes, {code: text}) for a font. Codes missing from
+        its ToUnicode map (or all of them, without one) are read as Latin-1
+        for single-byte fonts and as their code point otherwise.
+        """
+        key = ref.num if isinstance(ref, Ref) else id(ref)
+        if key in self._fonts:
+            return self._fonts[key]
+        font = self.resolve(ref)
+        width = 2 if font.get("Subtype") == "Type0" else 1
+        # {code: text}, usable as a str.translate() table
+        mapping = {}
+        if font.get("ToUnicode"):
+            cmap = self.stream_data(font["ToUnicode"])
+            for block in re.findall(rb"beginbfchar(.*?)endbfchar", cmap, re.S):
+                for src, dst in re.findall(rb"<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]*)>", block):
+                    mapping[int(src, 16)] = bytes.fromhex(dst.decode()).decode("utf-16-be", "replace")
+            for block in re.findall(rb"beginbfrange(.*?)endbfrange", cmap, re.S):
+                for lo, hi, dst in re.findall(rb"<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*(<[0-9A-Fa-f]*>|\[[^\]]*\])", block):
+                    lo, hi = int(lo, 16), int(hi, 16)
+                    if dst.startswith(b"["):
+                        for code, item in zip(range(lo, hi + 1), re.findall(rb"<([0-9A-Fa-f]*)>", dst)):
+                            mapping[code] = bytes.fromhex(item.decode()).decode("utf-16-be", "replace")
+                    else:
+                        base = bytes.fromhex(dst[1:-1].decode())
+                        for code in range(lo, hi + 1):
+                            char = base[:-2] + (int.from_bytes(base[-2:], "big") + code - lo).to_bytes(2, "big")
+                            mapping[code] = char.decode("utf-16-be", "replace")
+        self._fonts[key] = (width, mapping)
+        return self._fonts[key]
+
+    def _decode(self, font, raw):
+        # Codes become the ordinals of a str, which str.translate() maps in C
+        width, mapping = font
+        if width == 2:
+            return raw[:len(raw) & ~1].decode("utf-16-be", "surrogatepass").translate(mapping)
+        return raw.decode("latin-1").translate(mapping)
+
+    def _runs(self, page):
+        """
+        [y downwards, x, text] for each run of text on the page.
+        """
+        fonts = self._page_fonts(page)
+        font = (1, {})
+        runs = []
+        for stream in self._contents(page):
+            for block in _TEXT_BLOCK_RE.finditer(self.stream_data(stream)):
+                # Strings are decoded as they're read; numbers stay bytes until an operator uses them
+                operands = []
+                array = None
+                x = y = line_x = line_y = 0.0
+                down = False
+                leading = 0.0
+                run = None
+                for match in _TOKEN_RE.finditer(block.group(1)):
+                    kind = match.lastgroup
+                    if kind == "word":
+                        word = match.group("word")
+                        if word[0] in _NUMBER_START:
+                            (operands if array is None else array).append(word)
+                            continue
+                    elif kind == "string" or kind == "hex":
+                        raw = _unescape(match.group("string")) if kind == "string" else \
+                            bytes.fromhex(re.sub(rb"\s", b"", match.group("hex")).decode())
+                        (operands if array is None else array).append(self._decode(font, raw))
+                        continue
+                    elif kind == "name":
+                        operands.append(match.group("name").decode("latin-1"))
+                        continue
+                    elif kind == "open":
+                        if match.group("open") == b"[":
+                            array = []
+                        continue
+                    elif kind == "close":
+                        if array is not None and match.group("close") == b"]":
+                            operands.append(array)
+                            array = None
+                        continue
+                    else:
+                        continue
+
+                    text = None
+                    if word == b"Tf" and len(operands) >= 2 and operands[-2] in fonts:
+                        font = self._font(fonts[operands[-2]])
+                    elif word == b"Tm" and len(operands) >= 6:
+                        down = float(operands[-3]) < 0
+                        x = line_x = float(operands[-2])
+                        y = line_y = float(operands[-1])
+                        run = None
+                    elif word in (b"Td", b"TD") and len(operands) >= 2:
+                        ty = float(operands[-1])
+                        line_x += float(operands[-2])
+                        line_y += -ty if down else ty
+                        x, y = line_x, line_y
+                        if word == b"TD":
+                            leading = -ty
+                        run = None
+                    elif word == b"TL" and operands:
+                        leading = float(operands[-1])
+                    elif word in (b"T*", b"'", b'"'):
+                        line_y += leading if down else -leading
+                        x, y = line_x, line_y
+                        run = None
+                        if word != b"T*" and operands and isinstance(operands[-1], str):
+                            text = operands[-1]
+                    elif word == b"Tj" and operands and isinstance(operands[-1], str):
+                        text = operands[-1]
+                    elif word == b"TJ" and operands and isinstance(operands[-1], list):
+                        # A wide negative kern is a word gap
+                        text = "".join(item if isinstance(item, str) else " " if float(item) < -200 else ""
+                                       for item in operands[-1])
+                    operands = []
+
+                    if text:
+                        if run is None:
+                            run = [y if down else -y, x, ""]
+                            runs.append(run)
+                        run[2] += text
+        return runs
+
+    def page_text(self, index):
+        page = self.pages[index]
+        with _malformed():
+            runs = sorted([y, x, text.strip()] for y, x, text in self._runs(page) if text.strip())
+
+        # Glue wrapped addresses back together: the rest of the cell is the
+        # closest single word within about a row below (centered cells
+        # don't line up their wrapped lines)
+        for i, run in enumerate(runs):
+            if not _is_cut_address(run[2]):
+                continue
+            below = [other for other in runs[i + 1:] if other[0] - run[0] < WRAP_DISTANCE]
+            below = [
+                other for other in below
+                if other[0] > run[0] and other[2] and " " not in other[2] and "@" not in other[2]
+            ]
+            if below:
+                rest = min(below, key=lambda other: abs(other[1] - run[1]))
+                run[2] += rest[2]
+                rest[2] = ""
+
+        # Cells also wrap just before the @, leaving "@domain" under a bare
+        # local part. "@Company" mentions look the same, so only runs in a
+        # column that holds addresses count
+        address_columns = {x for _, x, text in runs if _EMAIL_RE.search(text)}
+        for i, run in enumerate(runs):
+            if not _DOMAIN_PART_RE.fullmatch(run[2]):
+                continue
+            if not any(abs(x - run[1]) < WRAP_DISTANCE for x in address_columns):
+                continue
+            above = [
+                other for other in runs[:i]
+                if 0 < run[0] - other[0] < WRAP_DISTANCE and abs(other[1] - run[1]) < WRAP_DISTANCE
+            ]
+            if above:
+                head = min(above, key=lambda other: run[0] - other[0])
+                if _LOCAL_PART_RE.fullmatch(head[2]):
+                    head[2] += run[2]
+                    run[2] = ""
+
+        rows = []
+        for y, x, text in runs:
+            if not text:
+                continue
+            if rows and y - rows[-1][0] < 2:
+                rows[-1][1].append((x, text))
+            else:
+                rows.append((y, [(x, text)]))
+        lines = [" ".join(text for _, text in sorted(cells)) for _, cells in rows]
+        return PageText(lines, self._links(page))
+
+def _is_cut_address(text):
+    # "@Company" mentions in the company column start with the @ and are never addresses
+    tail = _SEPARATOR_RE.split(text)[-1]
+    return not tail.startswith("@") and (tail.endswith("@") or ("@" in tail and not _EMAIL_RE.fullmatch(tail)))
+
+# --- pypdf ---
+
+def _pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        return None
+    return pypdf
+
+class PypdfDocument:
+    """
+    The same interface over pypdf, for PDFs the built-in reader can't parse.
+    """
+
+    def __init__(self, path):
+        self.reader = _pypdf().PdfReader(path)
+
+    def __len__(self):
+        return len(self.reader.pages)
+
+    def _links(self, page):
+        links = []
+        for annot in page.get("/Annots") or []:
+            uri = (annot.get_object().get("/A") or {}).get("/URI")
+            if isinstance(uri, str) and uri.lower().startswith("mailto:"):
+                links.append(uri[7:].split("?")[0])
+        return links
+
+    def page_key(self, index):
+        page = self.reader.pages[index]
+        digest = hashlib.sha1()
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        fonts = (page.get("/Resources") or {}).get("/Font") or {}
+        for name in sorted(fonts):
+            to_unicode = fonts[name].get_object().get("/ToUnicode")
+            digest.update(name.encode() + (to_unicode.get_object().get_data() if to_unicode else b""))
+        digest.update("\n".join(self._links(page)).encode())
+        return digest.hexdigest()
+
+    def page_text(self, index):
+        page = self.reader.pages[index]
+        return PageText((page.extract_text() or "").splitlines(), self._links(page))
+
+def open_document(path):
+    """
+    Opens a PDF with the built-in reader, or with pypdf when the built-in
+    reader can't handle the file and pypdf is installed. PDF_READER =
+    "pypdf" skips the built-in reader.
+    """
+    if email_config.PDF_READER == "pypdf":
+        if _pypdf() is None:
+            raise UnsupportedPDF("PDF_READER is \"pypdf\" but pypdf isn't installed")
+        return PypdfDocument(path)
+    try:
+        return BuiltinDocument(path)
+    except UnsupportedPDF as e:
+        if _pypdf() is None:
+            raise UnsupportedPDF(f"{e}; install pypdf to read this file") from e
+        return PypdfDocument(path)
+
+# Pages extracted in a worker process reopen the document once per process
+_worker_document = {}
+
+def _extract_page(path, index):
+    if _worker_document.get("path") != path:
+        _worker_document.update(path=path, document=open_document(path))
+    return contacts_from_page(_worker_document["document"].page_text(index))
+
+# --- Cache ---
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ExtractCache:
+    """
+    What earlier runs extracted, in .pdf_cache.json: per file its size,
+    mtime, SHA-256 and page keys, and per page key its contacts. A file
+    whose size and mtime match is skipped without being read; a changed
+    file only has its new or changed pages extracted.
+
+    A cache from another CACHE_VERSION or PDF_READER is read again from
+    scratch; `previous` keeps the addresses it had per file, so only the
+    ones the old extraction missed count as new.
+    """
+
+    def __init__(self, path=PDF_CACHE):
+        self.path = path
+        self.version = f"{CACHE_VERSION}:{email_config.PDF_READER}"
+        self.files = {}
+        self.pages = {}
+        self.previous = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get("version") == self.version:
+                    self.files, self.pages = data["files"], data["pages"]
+                else:
+                    self.previous = {
+                        name: {contact[0] for key in entry["pages"] for contact in data["pages"].get(key, ())}
+                        for name, entry in data["files"].items()
+                    }
+            except (OSError, ValueError, KeyError):
+                logger.warning(f"Ignoring unreadable {path}.")
+
+    def save(self):
+        if not self.path:
+            return
+        # Drop pages no file refers to any more
+        used = {key for entry in self.files.values() for key in entry["pages"]}
+        self.pages = {key: contacts for key, contacts in self.pages.items() if key in used}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "files": self.files, "pages": self.pages}, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def contacts(self):
+        for entry in self.files.values():
+            for key in entry["pages"]:
+                yield from self.pages.get(key, ())
+
+# --- Extraction ---
+
+def extract_file(path, cache, pool_factory):
+    """
+    Brings the cache up to date for one PDF. Returns (pages, pages extracted
+    now, their contacts); nothing is extracted if the file is unchanged.
+    Large extractions go to the process pool `pool_factory` returns, if any.
+    """
+    stat = os.stat(path)
+    entry = cache.files.get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return len(entry["pages"]), 0, []
+    digest = file_digest(path)
+    if entry and entry["sha256"] == digest:
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        return len(entry["pages"]), 0, []
+
+    with metrics.timer("pdf_extract"):
+        document = open_document(path)
+        keys = [document.page_key(index) for index in range(len(document))]
+        missing = [index for index, key in enumerate(keys) if key not in cache.pages]
+        pool = pool_factory() if len(missing) >= email_config.PDF_POOL_MIN_PAGES else None
+        if pool is not None:
+            results = pool.map(_extract_page, repeat(path), missing)
+        else:
+            results = (contacts_from_page(document.page_text(index)) for index in missing)
+        previous = cache.previous.get(path, ())
+        extracted = []
+        for index, contacts in zip(missing, results):
+            cache.pages[keys[index]] = [list(contact) for contact in contacts]
+            extracted.extend(contact for contact in contacts if contact[0] not in previous)
+
+    metrics.count("pdf_pages_extracted", len(missing))
+    cache.files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest, "pages": keys}
+    logger.info(f"{path}: {len(keys)} page(s), {len(missing)} extracted, {len(extracted)} address(es) found.")
+    return len(keys), len(missing), extracted
+
+def merge_contacts(contacts, contacts_path=EMAILS_CSV, write=True):
+    """
+    Appends the valid (address, first_name, reason) contacts that aren't in
+    the contact list yet. Returns the number added.
+    """
+    existing = csv_state.read_emails(contacts_path)
+    rows = []
+    for address, first_name, reason in contacts:
+        if reason or address in existing:
+            continue
+        existing.add(address)
+        rows.append([address, first_name])
+    if rows and write:
+        csv_state.append_rows(contacts_path, rows, header=["email", "first_name"],
+                              lineterminator=csv_state.line_ending(contacts_path))
+    return len(rows)
+
+def extract(folder=COLLECTIONS_DIR, contacts_path=EMAILS_CSV, cache_path=PDF_CACHE,
+            workers=None, remerge=False, write=True):
+    """
+    Extracts contacts from every PDF in `folder` and adds the new ones to
+    the contact list. Only pages no earlier run has seen are extracted and
+    merged, so contacts you removed from the list stay removed; `remerge`
+    merges every cached contact again.
+    """
+    cache = ExtractCache(cache_path)
+    workers = workers or email_config.PDF_WORKERS or os.cpu_count() or 1
+    pool = None
+
+    def pool_factory():
+        # Started on first use, and never on a single CPU
+        nonlocal pool
+        if pool is None and workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+    paths = sorted(glob.glob(os.path.join(folder, "*.pdf")))
+    total_pages = 0
+    extracted_pages = 0
+    found = []
+    try:
+        for path in paths:
+            try:
+                pages, extracted, contacts = extract_file(path, cache, pool_factory)
+            except (UnsupportedPDF, OSError, ValueError, zlib.error) as e:
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+            total_pages += pages
+            extracted_pages += extracted
+            found.extend(contacts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if remerge:
+        found = [tuple(contact) for contact in cache.contacts()]
+    invalid = sum(1 for contact in found if contact[2])
+    added = merge_contacts(found, contacts_path, write)
+    if write:
+        cache.save()
+
+    report = ExtractReport(len(paths), total_pages, extracted_pages, len(found), invalid, added)
+    logger.info(
+        f"Extracted {report.contacts} address(es) from {report.extracted} new page(s) "
+        f"({report.pages} page(s) in {report.files} file(s)); {report.invalid} invalid, "
+        f"{report.added} added to {contacts_path}."
+    )
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add the contacts in the 'email collections' PDFs to emails.csv.")
+    parser.add_argument("--folder", default=COLLECTIONS_DIR, help="Folder of PDFs to read.")
+    parser.add_argument("--workers", type=int, help="Processes for large files (default: one per CPU).")
+    parser.add_argument("--remerge", action="store_true",
+                        help="Merge every cached contact again, not only those from new pages.")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing emails.csv, the cache or run metrics.")
+    return parser.parse_args()
+
+def main(args):
+    extract(args.folder, workers=args.workers, remerge=args.remerge, write=not args.dry_run)
+
+if __name__ == "__main__":
+    args = parse_args()
+    with metrics.run("extract_contacts", write=not args.dry_run):
+        main(args)
@@ -0,0 +1,412 @@
+import email
+import re
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email.mime.text import MIMEText
+from email.utils import getaddresses
+
+# --- Accounting ---
+
+class _CountingHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Replies go out in several writes; don't let Nagle hold them for the client's ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count("connections")
+
+    def send(self, data):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.count("bytes_out", len(data))
+        self.wfile.write(data)
+
+    def read_line(self):
+        line = self.rfile.readline()
+        self.server.count("bytes_in", len(line))
+        return line
+
+class _Server(socketserver.ThreadingTCPServer):
+    """
+    Base for the local SMTP/IMAP stand-ins used by `benchmark.py e2e`.
+    They speak just enough of their protocol for the scripts in this repo
+    (plain TCP, no TLS), wait `latency` seconds before every reply and
+    count connections, commands and bytes in each direction.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, handler, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.counters = {"connections": 0, "commands": 0, "bytes_in": 0, "bytes_out": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+# --- SMTP ---
+
+class _SMTPHandler(_CountingHandler):
+    def handle(self):
+        server = self.server
+        self.send(b"220 localhost fake ESMTP ready\r\n")
+        while True:
+            line = self.read_line()
+            if not line:
+                return
+            server.count("commands")
+            command = line.strip().upper()
+
+            if command.startswith((b"EHLO", b"HELO")):
+                self.send(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 36700160\r\n")
+            elif command.startswith(b"AUTH"):
+                self.send(b"235 2.7.0 Accepted\r\n")
+            elif command.startswith(b"RCPT"):
+                self.send(server.rcpt_reply() + b"\r\n")
+            elif command == b"DATA":
+                self.send(b"354 Go ahead\r\n")
+                size = 0
+                while True:
+                    data = self.read_line()
+                    if not data or data == b".\r\n":
+                        break
+                    size += len(data)
+                server.count("messages")
+                server.count("message_bytes", size)
+                self.send(b"250 2.0.0 OK queued\r\n")
+            elif command == b"QUIT":
+                self.send(b"221 2.0.0 Bye\r\n")
+                return
+            else:
+                # MAIL, RSET, NOOP
+                self.send(b"250 2.0.0 OK\r\n")
+
+class FakeSMTPServer(_Server):
+    """
+    Accepts every message, except that every `throttle_every`-th recipient
+    gets a 421 4.7.0 throttling reply and every `reject_every`-th a 550
+    5.1.1 "no such user".
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, throttle_every=0, reject_every=0):
+        super().__init__(_SMTPHandler, host, port, latency)
+        self.throttle_every = throttle_every
+        self.reject_every = reject_every
+        self.counters.update(messages=0, message_bytes=0, throttled=0, rejected=0)
+        self._recipients = 0
+
+    def rcpt_reply(self):
+        with self._lock:
+            self._recipients += 1
+            n = self._recipients
+        if self.throttle_every and n % self.throttle_every == 0:
+            self.count("throttled")
+            return b"421 4.7.0 Try again later, closing connection."
+        if self.reject_every and n % self.reject_every == 0:
+            self.count("rejected")
+            return b"550 5.1.1 The email account that you tried to reach does not exist."
+        return b"250 2.1.5 OK"
+
+# --- IMAP ---
+
+def _quote(value):
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _body_bytes(part):
+    # A part's content without its MIME headers, with CRLF line endings
+    data = part.as_bytes(policy=part.policy.clone(linesep="\r\n", mangle_from_=False))
+    if data.startswith(b"\r\n"):
+        return data[2:]
+    return data.partition(b"\r\n\r\n")[2]
+
+def _addresses(msg, name):
+    values = msg.get_all(name)
+    if not values:
+        return "NIL"
+    addresses = []
+    for display, address in getaddresses([str(value) for value in values]):
+        mailbox, _, host = address.partition("@")
+        addresses.append(f"({_quote(display or None)} NIL {_quote(mailbox)} {_quote(host or None)})")
+    return "(" + "".join(addresses) + ")"
+
+def _envelope(msg):
+    # RFC 3501 7.4.2; Sender and Reply-To default to From
+    sender = "Sender" if msg.get("Sender") else "From"
+    reply_to = "Reply-To" if msg.get("Reply-To") else "From"
+    fields = [
+        _quote(msg.get("Date")), _quote(msg.get("Subject")), _addresses(msg, "From"),
+        _addresses(msg, sender), _addresses(msg, reply_to), _addresses(msg, "To"),
+        _addresses(msg, "Cc"), _addresses(msg, "Bcc"), _quote(msg.get("In-Reply-To")),
+        _quote(msg.get("Message-ID")),
+    ]
+    return "(" + " ".join(fields) + ")"
+
+def _bodystructure(msg):
+    """
+    The RFC 3501 BODYSTRUCTURE of a message or part, without extension data.
+    """
+    # The email package treats message/* parts as multipart too; IMAP doesn't
+    if msg.get_content_maintype() == "multipart":
+        parts = "".join(_bodystructure(part) for part in msg.get_payload())
+        return f"({parts} {_quote(msg.get_content_subtype())})"
+    maintype, subtype = msg.get_content_maintype(), msg.get_content_subtype()
+    params = (msg.get_params() or [])[1:]
+    params = "(" + " ".join(f"{_quote(k)} {_quote(v)}" for k, v in params) + ")" if params else "NIL"
+    body = _body_bytes(msg)
+    lines = body.count(b"\n")
+    fields = (
+        f"{_quote(maintype)} {_quote(subtype)} {params} {_quote(msg.get('Content-ID'))} "
+        f"{_quote(msg.get('Content-Description'))} {_quote(msg.get('Content-Transfer-Encoding', '7bit'))} {len(body)}"
+    )
+    if msg.get_content_type() == "message/rfc822":
+        inner = msg.get_payload()[0]
+        fields += f" {_envelope(inner)} {_bodystructure(inner)} {lines}"
+    elif maintype == "text":
+        fields += f" {lines}"
+    return f"({fields})"
+
+def _section_part(msg, section):
+    part = msg
+    for n in section.split("."):
+        if part.get_content_type() == "message/rfc822":
+            # Parts of an attached message are numbered within it
+            part = part.get_payload()[0]
+        if part.get_content_maintype() == "multipart":
+            part = part.get_payload()[int(n) - 1]
+        elif n != "1":
+            raise IndexError(f"no section {section}")
+    return part
+
+def _part_bytes(msg, section, raw):
+    """
+    BODY[section] as RFC 3501 defines it: the part's content without its
+    MIME headers (for message/rfc822, the whole attached message).
+    """
+    if not section:
+        return raw
+    return _body_bytes(_section_part(msg, section))
+
+def _in_set(uid, spec, max_uid):
+    for piece in spec.split(","):
+        if ":" in piece:
+            low, high = (max_uid if x == "*" else int(x) for x in piece.split(":"))
+            if min(low, high) <= uid <= max(low, high):
+                return True
+        elif (max_uid if piece == "*" else int(piece)) == uid:
+            return True
+    return False
+
+_TOKEN_RE = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+
+def _unquote(token):
+    return token[1:-1] if token.startswith('"') else token
+
+def _search_key(tokens, i, box):
+    """
+    Parses one search key at tokens[i] into a predicate over stored messages.
+    """
+    key = tokens[i].upper()
+    if key == "(":
+        predicates = []
+        i += 1
+        while tokens[i] != ")":
+            predicate, i = _search_key(tokens, i, box)
+            predicates.append(predicate)
+        return (lambda m: all(p(m) for p in predicates)), i + 1
+    if key == "OR":
+        left, i = _search_key(tokens, i + 1, box)
+        right, i = _search_key(tokens, i, box)
+        return (lambda m: left(m) or right(m)), i
+    if key == "ALL":
+        return (lambda m: True), i + 1
+    if key in ("FROM", "TO", "SUBJECT"):
+        value, header = _unquote(tokens[i + 1]).lower(), key.capitalize()
+        return (lambda m: value in (m.msg.get(header) or "").lower()), i + 2
+    if key == "HEADER":
+        header, value = _unquote(tokens[i + 1]), _unquote(tokens[i + 2]).lower()
+        return (lambda m: value in (m.msg.get(header) or "").lower()), i + 3
+    if key == "SINCE":
+        since = datetime.strptime(_unquote(tokens[i + 1]), "%d-%b-%Y")
+        return (lambda m: m.date >= since), i + 2
+    if key == "UID":
+        spec = tokens[i + 1]
+        return (lambda m: _in_set(m.uid, spec, box.next_uid - 1)), i + 2
+    raise ValueError(f"unsupported search key {key}")
+
+class StoredMessage:
+    def __init__(self, uid, raw, date):
+        self.uid = uid
+        self.raw = raw
+        self.msg = email.message_from_bytes(raw)
+        self.date = date
+
+class Mailbox:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self.next_uid = 1
+
+    def add(self, raw, date=None):
+        self.messages.append(StoredMessage(self.next_uid, raw, date or datetime.utcnow()))
+        self.next_uid += 1
+
+class _IMAPHandler(_CountingHandler):
+    def ok(self, tag, text="done"):
+        self.send(f"{tag} OK {text}\r\n".encode())
+
+    def handle(self):
+        self.send(b"* OK [CAPABILITY IMAP4rev1] fake IMAP ready\r\n")
+        box = None
+        while True:
+            line = self.read_line()
+            if not line:
+                return
+            self.server.count("commands")
+            tag, _, rest = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+
+            if command == "CAPABILITY":
+                self.send(b"* CAPABILITY IMAP4rev1\r\n")
+                self.ok(tag)
+            elif command == "LOGIN":
+                self.ok(tag, "logged in")
+            elif command in ("SELECT", "EXAMINE"):
+                box = self.server.mailboxes.get(_unquote(args.strip()))
+                if box is None:
+                    self.send(f"{tag} NO no such mailbox\r\n".encode())
+                    continue
+                self.send((
+                    f"* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n* OK [UIDNEXT {box.next_uid}] next UID\r\n"
+                ).encode())
+                self.ok(tag, "[READ-ONLY] done" if command == "EXAMINE" else "[READ-WRITE] done")
+            elif command == "LOGOUT":
+                self.send(b"* BYE logging out\r\n")
+                self.ok(tag)
+                return
+            elif command == "UID" and box is not None:
+                self.uid_command(tag, args, box)
+            else:
+                # NOOP, CLOSE and anything else harmless
+                self.ok(tag)
+
+    def uid_command(self, tag, args, box):
+        subcommand, _, args = args.partition(" ")
+        subcommand = subcommand.upper()
+        if subcommand == "SEARCH":
+            tokens = _TOKEN_RE.findall(args)
+            if tokens and tokens[0].upper() == "CHARSET":
+                tokens = tokens[2:]
+            predicates = []
+            i = 0
+            while i < len(tokens):
+                predicate, i = _search_key(tokens, i, box)
+                predicates.append(predicate)
+            uids = " ".join(str(m.uid) for m in box.messages if all(p(m) for p in predicates))
+            self.send(f"* SEARCH {uids}\r\n".encode())
+            self.ok(tag)
+        elif subcommand == "FETCH":
+            spec, _, items = args.partition(" ")
+            max_uid = box.next_uid - 1
+            header_fields = re.findall(r"BODY\.PEEK\[HEADER\.FIELDS \(([^)]*)\)\]", items, re.IGNORECASE)
+            sections = re.findall(r"BODY\.PEEK\[([\d.]*)\]", items, re.IGNORECASE)
+            structure = "BODYSTRUCTURE" in items.upper()
+            for seq, m in enumerate(box.messages, 1):
+                if not _in_set(m.uid, spec, max_uid):
+                    continue
+                response = f"* {seq} FETCH (UID {m.uid}".encode()
+                if structure:
+                    response += b" BODYSTRUCTURE " + _bodystructure(m.msg).encode()
+                for fields in header_fields:
+                    names = fields.upper().split()
+                    data = b"".join(f"{k}: {v}\r\n".encode() for k, v in m.msg.items() if k.upper() in names) + b"\r\n"
+                    response += f" BODY[HEADER.FIELDS ({fields})] {{{len(data)}}}\r\n".encode() + data
+                for section in sections:
+                    data = _part_bytes(m.msg, section, m.raw)
+                    response += f" BODY[{section}] {{{len(data)}}}\r\n".encode() + data
+                self.send(response + b")\r\n")
+            self.ok(tag)
+        else:
+            self.send(f"{tag} BAD unsupported\r\n".encode())
+
+class FakeIMAPServer(_Server):
+    """
+    Serves {folder name: Mailbox} to any login.
+    """
+
+    def __init__(self, mailboxes, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__(_IMAPHandler, host, port, latency)
+        self.mailboxes = mailboxes
+
+# --- Synthetic mail ---
+
+def synthetic_reply(sender, to="me@example.com"):
+    msg = MIMEText("Thanks for reaching out, let's set up a call next week.")
+    msg["From"] = f"Recruiter <{sender}>"
+    msg["To"] = to
+    msg["Subject"] = "Re: Application for Python/Backend Developer Role"
+    msg["In-Reply-To"] = f"<{sender.replace('@', '.')}@outreach.example.com>"
+    return msg.as_bytes()
+
+def synthetic_bounce(recipient, to="me@example.com", hard=True):
+    status, diagnostic = ("5.1.1", "550 5.1.1 The email account that you tried to reach does not exist.") if hard \
+        else ("4.2.2", "452 4.2.2 Mailbox full, try again later")
+    raw = (
+        "From: Mail Delivery Subsystem <mailer-daemon@googlemail.com>\n"
+        f"To: {to}\n"
+        "Subject: Delivery Status Notification (Failure)\n"
+        "MIME-Version: 1.0\n"
+        'Content-Type: multipart/report; report-type=delivery-status; boundary="BOUNDARY"\n'
+        "\n--BOUNDARY\n"
+        'Content-Type: text/plain; charset="us-ascii"\n'
+        f"\nYour message wasn't delivered to {recipient}.\n"
+        "\n--BOUNDARY\n"
+        "Content-Type: message/delivery-status\n"
+        "\nReporting-MTA: dns; googlemail.com\n"
+        f"\nFinal-Recipient: rfc822; {recipient}\n"
+        "Action: failed\n"
+        f"Status: {status}\n"
+        f"Diagnostic-Code: smtp; {diagnostic}\n"
+        "\n--BOUNDARY\n"
+        "Content-Type: message/rfc822\n"
+        f"\nFrom: {to}\nTo: {recipient}\nSubject: Application\n\nHi there\n"
+        "\n--BOUNDARY--\n"
+    )
+    return raw.replace("\n", "\r\n").encode("utf-8")
+
+def synthetic_mailboxes(sent, replies=0, bounces=0, noise=0):
+    """
+    Gmail-like folders holding `replies` replies from and `bounces`
+    bounces for addresses in `sent`, plus `noise` unrelated messages.
+    INBOX and "[Gmail]/All Mail" share one mailbox, as they do on Gmail.
+    """
+    inbox = Mailbox(uidvalidity=1)
+    sent = list(sent)
+    for i in range(replies):
+        inbox.add(synthetic_reply(sent[i % len(sent)]))
+    for i in range(bounces):
+        inbox.add(synthetic_bounce(sent[-(i % len(sent)) - 1], hard=i % 4 != 3))
+    for i in range(noise):
+        inbox.add(synthetic_reply(f"newsletter{i}@news.example.org"))
+    return {"INBOX": inbox, "[Gmail]/All Mail": inbox, "[Gmail]/Spam": Mailbox(uidvalidity=2)}
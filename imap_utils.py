@@ -0,0 +1,273 @@
+import imaplib
+import email
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.parser import BytesHeaderParser
+import email_config
+import mailer
+import metrics
+
+# ---------------- CONFIG ----------------
+FETCH_BATCH_SIZE = 500
+# ----------------------------------------
+
+logger = mailer.logger
+
+_UID_RE = re.compile(rb"\bUID (\d+)")
+_header_parser = BytesHeaderParser()
+
+def connect(host, user, password, port=None, use_ssl=None):
+    """
+    Opens an authenticated IMAP connection; port and SSL default to the
+    IMAP_PORT / IMAP_SSL settings.
+    """
+    use_ssl = email_config.IMAP_SSL if use_ssl is None else use_ssl
+    port = port or email_config.IMAP_PORT
+    with metrics.timer("imap_connect"):
+        mail = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
+        mail.login(user, password)
+    return mail
+
+def scan_accounts(accounts, folders, scan, host, max_connections=None):
+    """
+    Runs scan(mail, account, folder) for every folder of every account in
+    parallel, each on its own connection authenticated as that account
+    (at most max_connections per account at once).
+    Yields (account, folder, result, error) in the order the scans finish.
+    """
+    max_connections = max(1, min(len(folders), max_connections or len(folders)))
+    slots = {account.name: threading.BoundedSemaphore(max_connections) for account in accounts}
+
+    def run(account, folder):
+        with slots[account.name]:
+            mail = connect(host, account.address, account.password)
+            try:
+                return scan(mail, account, folder)
+            finally:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+
+    tasks = [(account, folder) for account in accounts for folder in folders]
+    if not tasks:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(tasks), max_connections * len(accounts))) as pool:
+        futures = {pool.submit(run, *task): task for task in tasks}
+        for future in as_completed(futures):
+            account, folder = futures[future]
+            try:
+                yield account, folder, future.result(), None
+            except Exception as e:
+                yield account, folder, None, e
+
+def compress_ids(ids):
+    """
+    Turns a list of message ids into an IMAP sequence set, e.g. 1:5,8,10:12.
+    """
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    start = prev = None
+    for n in numbers:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            ranges.append(f"{start}:{prev}" if start != prev else str(start))
+            start = prev = n
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+class LazyHeaders:
+    """
+    Raw header bytes from a FETCH response, parsed on first access.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._msg = None
+
+    def get(self, name, default=None):
+        if self._msg is None:
+            self._msg = _header_parser.parsebytes(self.raw)
+        return self._msg.get(name, default)
+
+class FetchStats:
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes = 0
+        self.messages = 0
+        # UIDs whose fetch failed; callers must not move their sync mark past these
+        self.failed = []
+
+    def __str__(self):
+        text = f"{self.messages} message(s) in {self.round_trips} round trip(s), {self.bytes} bytes"
+        if self.failed:
+            text += f", {len(self.failed)} failed"
+        return text
+
+class FetchResult:
+    """
+    One message from a UID FETCH response: the response text (without
+    literals) and the literal payloads keyed by their BODY[...] section.
+    """
+
+    def __init__(self, uid, text, sections):
+        self.uid = uid
+        self.text = text
+        self.sections = sections
+
+    def section(self, prefix):
+        for name, data in self.sections.items():
+            if name.startswith(prefix):
+                return data
+        return None
+
+_MSG_START_RE = re.compile(rb"^\d+ \(")
+_SECTION_RE = re.compile(rb"BODY\[([^\]]*)\](?:<\d+>)? \{\d+\}$")
+
+def _iter_fetch_responses(data):
+    """
+    Regroups imaplib's flat FETCH data list into one FetchResult per message.
+    """
+    text, sections = None, {}
+    for part in data:
+        head = part[0] if isinstance(part, tuple) else part
+        if not head:
+            continue
+        if _MSG_START_RE.match(head):
+            if text is not None:
+                yield text, sections
+            text, sections = b"", {}
+        if text is None:
+            continue
+        text += head
+        if isinstance(part, tuple):
+            match = _SECTION_RE.search(head)
+            if match:
+                sections[match.group(1).decode("ascii", "replace")] = part[1]
+    if text is not None:
+        yield text, sections
+
+def fetch(mail, uids, items, batch_size=FETCH_BATCH_SIZE, stats=None):
+    """
+    Yields a FetchResult for each of the given UIDs. Each batch of UIDs is
+    requested in a single UID FETCH round trip for compressed UID ranges.
+    """
+    uids = sorted({int(u) for u in uids})
+
+    for i in range(0, len(uids), batch_size):
+        with metrics.timer("imap_fetch"):
+            status, data = mail.uid("FETCH", compress_ids(uids[i:i + batch_size]), items)
+        if stats is not None:
+            stats.round_trips += 1
+        if status != "OK":
+            logger.warning(f"Fetch failed for batch starting at UID {uids[i]}")
+            if stats is not None:
+                stats.failed.extend(uids[i:i + batch_size])
+            continue
+
+        for text, sections in _iter_fetch_responses(data):
+            match = _UID_RE.search(text)
+            if not match:
+                continue
+            size = len(text) + sum(len(v) for v in sections.values())
+            metrics.count("imap_messages")
+            metrics.count("imap_bytes", size)
+            if stats is not None:
+                stats.messages += 1
+                stats.bytes += size
+            yield FetchResult(int(match.group(1)), text, sections)
+
+def header_items(fields):
+    return f"BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})]"
+
+def fetch_headers(mail, uids, fields, batch_size=FETCH_BATCH_SIZE, stats=None):
+    """
+    Yields (uid, LazyHeaders) for the given UIDs, fetching only the named
+    header fields. BODY.PEEK leaves the \\Seen flag untouched.
+    """
+    for result in fetch(mail, uids, f"(UID {header_items(fields)})", batch_size, stats):
+        yield result.uid, LazyHeaders(result.section("HEADER") or b"")
+
+def fetch_sections(mail, uids_by_section, batch_size=FETCH_BATCH_SIZE, stats=None):
+    """
+    Yields (uid, bytes) for single body sections, e.g. {"2": [uid, ...]}.
+    UIDs that share a section number are fetched together in batches.
+    """
+    for section, uids in uids_by_section.items():
+        for result in fetch(mail, uids, f"(UID BODY.PEEK[{section}])", batch_size, stats):
+            yield result.uid, result.sections.get(section, b"")
+
+# --- BODYSTRUCTURE ---
+_BS_TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}|[^\s()"]+')
+
+def parse_bodystructure(text):
+    """
+    Parses the BODYSTRUCTURE item of a FETCH response into nested lists of
+    strings (NIL becomes None). Literal strings are replaced by "".
+    """
+    idx = text.find(b"BODYSTRUCTURE (")
+    if idx < 0:
+        return None
+
+    stack = []
+    for match in _BS_TOKEN_RE.finditer(text, idx + len(b"BODYSTRUCTURE ")):
+        token = match.group(0)
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            node = stack.pop()
+            if not stack:
+                return node
+            stack[-1].append(node)
+        elif not stack:
+            break
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb"\1", token[1:-1]).decode("utf-8", "replace"))
+        elif token.upper() == b"NIL":
+            stack[-1].append(None)
+        elif token.startswith(b"{"):
+            stack[-1].append("")
+        else:
+            stack[-1].append(token.decode("utf-8", "replace"))
+    return None
+
+def find_part(structure, content_types, prefix=""):
+    """
+    Returns the IMAP section number (e.g. "2" or "1.2") of the first body
+    part whose type is in `content_types`. Attached messages are not entered.
+    """
+    if not structure:
+        return None
+    if isinstance(structure[0], list):
+        for i, child in enumerate(c for c in structure if isinstance(c, list)):
+            number = f"{prefix}.{i + 1}" if prefix else str(i + 1)
+            found = find_part(child, content_types, number)
+            if found:
+                return found
+        return None
+    content_type = f"{structure[0]}/{structure[1]}".lower()
+    return (prefix or "1") if content_type in content_types else None
+
+def fetch_message(mail, uid, stats=None):
+    """
+    Fetches and parses one full message. Use only when headers are not enough.
+    """
+    with metrics.timer("imap_fetch"):
+        status, data = mail.uid("FETCH", str(uid), "(BODY.PEEK[])")
+    if stats is not None:
+        stats.round_trips += 1
+    if status != "OK" or not data or not isinstance(data[0], tuple):
+        if stats is not None:
+            stats.failed.append(int(uid))
+        return None
+    metrics.count("imap_messages")
+    metrics.count("imap_bytes", len(data[0][1]))
+    if stats is not None:
+        stats.messages += 1
+        stats.bytes += len(data[0][1])
+    return email.message_from_bytes(data[0][1])
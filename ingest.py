@@ -0,0 +1,337 @@
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import socket
+import struct
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import email_config
+import mailer
+from csv_state import line_ending, normalize, read_rows, today
+
+# ---------------- CONFIG ----------------
+EMAILS_CSV = "emails.csv"
+INVALID_CSV = "invalid_emails.csv"
+MX_CACHE = ".mx_cache.json"
+# ----------------------------------------
+
+logger = mailer.logger
+
+# Dot-atom local part (quoted local parts aren't accepted) and an LDH domain with an alphabetic or IDNA TLD
+_LOCAL_RE = re.compile(r"^[a-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*$")
+_DOMAIN_RE = re.compile(r"^([a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?\.)+([a-z]{2,63}|xn--[a-z0-9-]{1,59})$")
+# Words glued onto the TLD when the list was scraped, e.g. "…@nttdata.comSenior": a
+# lowercase TLD running into a capitalized word, or .com/.net/.org plus letters that
+# don't make up one of the real TLDs starting with those
+_GLUED_CASE_RE = re.compile(r"\.[a-z]+[A-Z][A-Za-z]*$")
+_GLUED_TLD_RE = re.compile(r"^(?:com(?!munity$|pany$|puter$|pare$|cast$|mbank$|sec$)|net(?!work$|bank$|flix$)|org(?!anic$))[a-z]+$")
+
+IngestReport = namedtuple("IngestReport", ["contacts", "duplicates", "invalid", "rewritten"])
+
+def clean_address(raw):
+    """
+    Returns (address, reason): the canonical form of `raw` and why it can't
+    be emailed, or None if it looks deliverable. The canonical form is
+    csv_state.normalize()'s lookup key, minus stray angle brackets, a
+    mailto: prefix or a trailing dot, with an internationalized domain in
+    its ASCII (IDNA) form.
+    """
+    address = normalize(raw).strip("<>").strip()
+    if address.startswith("mailto:"):
+        address = address[len("mailto:"):]
+    if address.count("@") != 1:
+        return address, "not an address"
+
+    local, domain = address.split("@")
+    domain = domain.rstrip(".")
+    try:
+        domain = domain.encode("idna").decode("ascii")
+    except UnicodeError:
+        return address, "bad domain"
+    address = f"{local}@{domain}"
+
+    if not local or len(local) > 64 or len(address) > 254:
+        return address, "bad length"
+    if not _LOCAL_RE.match(local):
+        return address, "bad local part"
+    if len(domain) > 253 or not _DOMAIN_RE.match(domain):
+        return address, "bad domain"
+    raw_domain = str(raw).strip().strip("<>").rstrip(".").rsplit("@", 1)[-1]
+    if _GLUED_CASE_RE.search(raw_domain) or _GLUED_TLD_RE.match(domain.rsplit(".", 1)[-1]):
+        return address, "text after domain"
+    return address, None
+
+# --- MX lookups ---
+
+def _dnspython():
+    try:
+        import dns.resolver
+    except ImportError:
+        return None
+    return dns.resolver
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+
+class DnsResolver:
+    """
+    Answers "can this domain receive mail?" with True, False (the domain
+    doesn't exist, has no mail host or publishes a null MX) or None when
+    the lookup failed and nothing can be said.
+
+    Uses dnspython when it's installed; otherwise sends a plain MX query to
+    the first nameserver in /etc/resolv.conf. A domain without MX records
+    falls back to its address records, as SMTP itself does.
+    """
+
+    def __init__(self, timeout=None, nameserver=None):
+        self.timeout = timeout or email_config.MX_LOOKUP_TIMEOUT
+        self.nameserver = nameserver or self._system_nameserver()
+
+    @staticmethod
+    def _system_nameserver():
+        try:
+            with open("/etc/resolv.conf") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 2 and fields[0] == "nameserver":
+                        return fields[1]
+        except OSError:
+            pass
+        return None
+
+    def _query_dnspython(self, resolver, domain):
+        try:
+            answer = resolver.resolve(domain, "MX", lifetime=self.timeout)
+        except resolver.NXDOMAIN:
+            return False
+        except resolver.NoAnswer:
+            return None
+        except Exception:
+            return "error"
+        return any(str(record.exchange) != "." for record in answer)
+
+    def _query_socket(self, domain):
+        if not self.nameserver:
+            return "error"
+        query_id = random.getrandbits(16)
+        qname = b"".join(bytes([len(label)]) + label for label in domain.encode("ascii").split(b".")) + b"\0"
+        packet = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack(">HH", 15, 1)
+
+        family = socket.AF_INET6 if ":" in self.nameserver else socket.AF_INET
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.sendto(packet, (self.nameserver, 53))
+                data = sock.recv(4096)
+            reply_id, flags, questions, answers = struct.unpack(">HHHH", data[:8])
+            if reply_id != query_id:
+                return "error"
+            rcode = flags & 0x000F
+            if rcode == 3:
+                return False
+            if rcode != 0:
+                return "error"
+
+            offset = 12
+            for _ in range(questions):
+                offset = _skip_name(data, offset) + 4
+            exchanges = []
+            for _ in range(answers):
+                offset = _skip_name(data, offset)
+                rtype, _, _, length = struct.unpack(">HHIH", data[offset:offset + 10])
+                offset += 10
+                if rtype == 15:
+                    # A null MX (RFC 7505) has the root as its exchange
+                    exchanges.append(data[offset + 2] != 0)
+                offset += length
+        except (OSError, struct.error, IndexError):
+            return "error"
+        if exchanges:
+            return any(exchanges)
+        return None
+
+    def has_mail_host(self, domain):
+        resolver = _dnspython()
+        result = self._query_dnspython(resolver, domain) if resolver else self._query_socket(domain)
+        if result == "error":
+            return None
+        if result is not None:
+            return result
+        # No MX records: mail goes to the domain's own address, if it has one
+        try:
+            socket.getaddrinfo(domain, 25, proto=socket.IPPROTO_TCP)
+            return True
+        except socket.gaierror as e:
+            return False if e.errno in (socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)) else None
+
+class StaticResolver:
+    """
+    Resolver over a fixed {domain: True/False/None} table, for offline
+    runs and tests. Unknown domains resolve to `default`.
+    """
+
+    def __init__(self, records, default=True):
+        self.records = {domain.lower(): value for domain, value in records.items()}
+        self.default = default
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def has_mail_host(self, domain):
+        return self.records.get(domain, self.default)
+
+class MXCache:
+    """
+    Per-domain lookup results in .mx_cache.json, reused for MX_CACHE_DAYS.
+    Failed lookups (None) aren't cached, so they're retried next time.
+    With path=None the cache only lives for the run.
+    """
+
+    def __init__(self, resolver, path=MX_CACHE, max_age_days=None):
+        self.resolver = resolver
+        self.path = path
+        self.max_age = (max_age_days or email_config.MX_CACHE_DAYS) * 86400
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                logger.warning(f"Ignoring unreadable {path}.")
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def check(self, domains, workers=None):
+        """
+        Returns {domain: True/False/None}, looking up only the domains
+        missing from the cache or expired, on `workers` threads.
+        """
+        now = time.time()
+        results = {}
+        missing = []
+        for domain in set(domains):
+            entry = self.entries.get(domain)
+            if entry and now - entry[1] < self.max_age:
+                results[domain] = entry[0]
+            else:
+                missing.append(domain)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=workers or email_config.MX_LOOKUP_WORKERS) as pool:
+                for domain, ok in zip(missing, pool.map(self.resolver.has_mail_host, missing)):
+                    results[domain] = ok
+                    if ok is not None:
+                        self.entries[domain] = [ok, now]
+            failed = sum(1 for domain in missing if results[domain] is None)
+            logger.info(f"MX lookups: {len(missing)} domain(s), {failed} failed; {len(results) - len(missing)} cached.")
+        return results
+
+# --- Ingest ---
+
+def _write_csv(path, header, rows):
+    # Keeps the file's line endings, so a rewrite only shows the rows that changed
+    tmp_path = f"{path}.tmp"
+    terminator = line_ending(path)
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator=terminator)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+def ingest(contacts_path=EMAILS_CSV, invalid_path=INVALID_CSV, mx_cache=None, write=True):
+    """
+    Normalizes and dedupes the contact list, and records every address
+    that can't be delivered in invalid_emails.csv, which the suppression
+    index reads. With an MXCache, addresses on domains that can't receive
+    mail count as invalid too.
+
+    emails.csv is rewritten only if something changed; invalid addresses
+    stay in it, so the list remains yours to fix. Without `write` nothing
+    is written at all.
+    """
+    contacts = []
+    seen = set()
+    duplicates = 0
+    invalid = {}
+    changed = False
+
+    for row in read_rows(contacts_path):
+        address, reason = clean_address(row[0])
+        if address in seen:
+            duplicates += 1
+            changed = True
+            continue
+        seen.add(address)
+        first_name = row[1] if len(row) > 1 else ""
+        changed = changed or address != row[0]
+        contacts.append((address, first_name))
+        if reason:
+            invalid[address] = reason
+
+    previous = {normalize(row[0]): row[1:] for row in read_rows(invalid_path)}
+    if mx_cache is None:
+        # Keep earlier MX findings on runs that don't look them up
+        for address, (reason, *_) in previous.items():
+            if reason == "no mail server" and address in seen:
+                invalid.setdefault(address, reason)
+    else:
+        valid_domains = {address.rsplit("@", 1)[1] for address in seen if address not in invalid}
+        results = mx_cache.check(valid_domains)
+        for address in seen:
+            if address not in invalid and results.get(address.rsplit("@", 1)[1]) is False:
+                invalid[address] = "no mail server"
+        if write:
+            mx_cache.save()
+
+    if write:
+        if changed:
+            _write_csv(contacts_path, ["email", "first_name"], contacts)
+        _write_csv(invalid_path, ["email", "reason", "checked_on"], (
+            (address, reason, previous[address][1] if len(previous.get(address, ())) > 1 else today())
+            for address, reason in sorted(invalid.items())
+        ))
+
+    report = IngestReport(len(contacts), duplicates, len(invalid), write and changed)
+    logger.info(
+        f"Ingested {contacts_path}: {report.contacts} contacts, {report.duplicates} duplicate(s) removed, "
+        f"{report.invalid} undeliverable{' (list rewritten)' if report.rewritten else ''}."
+    )
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize, dedupe and validate the contact list.")
+    parser.add_argument("--mx", action="store_true", default=email_config.INGEST_CHECK_MX,
+                        help="Also check that each domain can receive mail (cached in .mx_cache.json).")
+    parser.add_argument("--mx-stub", metavar="FILE",
+                        help="Answer MX checks from a JSON {domain: true/false} file instead of DNS.")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing any files.")
+    args = parser.parse_args()
+
+    mx_cache = None
+    if args.mx or args.mx_stub:
+        resolver = StaticResolver.from_file(args.mx_stub) if args.mx_stub else DnsResolver()
+        mx_cache = MXCache(resolver, path=None if args.mx_stub else MX_CACHE)
+
+    ingest(mx_cache=mx_cache, write=not args.dry_run)
+
+if __name__ == "__main__":
+    main()
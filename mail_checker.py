@@ -0,0 +1,134 @@
+import threading
+import accounts
+import email_config
+import bounce_checker
+import imap_utils
+import mailer
+import metrics
+import reply_checker
+from state_journal import StateJournal
+from sync_state import SyncState
+from datetime import datetime, timedelta
+
+# ---------------- CONFIG ----------------
+IMAP_HOST = email_config.IMAP_HOST
+
+DAYS_BACK = email_config.CHECK_DAYS_BACK
+
+# Kept apart from imap_sync_state.json: this pass reads every new message in a
+# folder, so it can't share high-water marks with the bounce-only checker.
+MAIL_CHECK_STATE_FILE = "mail_check_state.json"
+
+# One header fetch classifies a message as either a bounce or a reply
+CHECK_HEADER_FIELDS = tuple(dict.fromkeys(bounce_checker.BOUNCE_HEADER_FIELDS + reply_checker.REPLY_HEADER_FIELDS))
+# ----------------------------------------
+
+logger = mailer.logger
+
+class ResultWriter:
+    """
+    The only place replies and bounces get written. Folder scans report to it
+    from their own threads; it drops addresses already recorded (in the CSVs
+    or by another folder this run) and journals the rest.
+    """
+
+    def __init__(self, journal, existing_replies, existing_bounces):
+        self.journal = journal
+        self.replies = set(existing_replies)
+        self.bounces = set(existing_bounces)
+        self.new_replies = 0
+        self.new_bounces = 0
+        self._lock = threading.Lock()
+
+    def add_reply(self, reply):
+        with self._lock:
+            if reply.address in self.replies:
+                return
+            reply_checker.append_reply(reply.address, self.journal, reply.replied_to, reply.latency)
+            self.replies.add(reply.address)
+            self.new_replies += 1
+        logger.info(f"New reply detected from: {reply_checker.describe_reply(reply)}")
+
+    def add_bounce(self, info):
+        with self._lock:
+            if info.recipient in self.bounces:
+                return
+            bounce_checker.append_bounce(info.recipient, info.bounce_type, self.journal)
+            self.bounces.add(info.recipient)
+            self.new_bounces += 1
+        logger.info(f"Bounce detected: {info.recipient} ({info.bounce_type}, status {info.status or 'n/a'})")
+
+def scan_folder(mail, account, folder, since_date, sent_emails, sync, writer, index=None):
+    """
+    Classifies every new message in one of an account's folders from a
+    single header + BODYSTRUCTURE fetch, then downloads only the
+    delivery-status parts of the bounces. Replies never need anything
+    beyond that first pass. `sent_emails` are the account's own sends;
+    `index` is the senders' Message-ID index, if there is one.
+    """
+    logger.info(f"Scanning folder: {folder} ({account.name})")
+
+    uids = sync.search_new(mail, account.address, folder, f'SINCE "{since_date}"')
+    if uids is None:
+        raise RuntimeError(f"Could not search folder {folder}")
+
+    stats = imap_utils.FetchStats()
+    dsn_sections = {}
+    full_fetch = []
+    items = f"(UID BODYSTRUCTURE {imap_utils.header_items(CHECK_HEADER_FIELDS)})"
+    for result in imap_utils.fetch(mail, uids, items, stats=stats):
+        if bounce_checker.plan_bounce_fetch(result, dsn_sections, full_fetch):
+            continue
+        reply = reply_checker.match_reply(imap_utils.LazyHeaders(result.section("HEADER") or b""), sent_emails, index)
+        if reply is not None:
+            writer.add_reply(reply)
+
+    for info in bounce_checker.fetch_bounce_infos(mail, dsn_sections, full_fetch, stats):
+        if info and info.recipient in sent_emails:
+            writer.add_bounce(info)
+
+    sync.hold_back(account.address, folder, stats.failed)
+    logger.info(f"Fetched {folder} ({account.name}): {stats}")
+
+def main():
+    if not mailer.should_run(email_config.RUN_MAIL_CHECK_AUTO):
+        return
+
+    since_date = (datetime.utcnow() - timedelta(days=DAYS_BACK)).strftime("%d-%b-%Y")
+    logger.info(f"Checking replies and bounces since {since_date}")
+
+    try:
+        journal = StateJournal("mail_checker")
+        journal.replay()
+
+        sender_accounts = accounts.load_accounts()
+        sent_emails = bounce_checker.load_sent_emails(sender_accounts)
+        writer = ResultWriter(journal, reply_checker.load_existing_replies(), bounce_checker.load_existing_bounces())
+        sync = SyncState(MAIL_CHECK_STATE_FILE)
+        index = reply_checker.load_message_index()
+
+        def scan(mail, account, folder):
+            scan_folder(mail, account, folder, since_date, sent_emails[account.name], sync, writer, index)
+
+        for account, folder, _, error in imap_utils.scan_accounts(
+            [account for account in sender_accounts if account.name in sent_emails],
+            email_config.CHECK_FOLDERS, scan, IMAP_HOST,
+            max_connections=email_config.IMAP_MAX_CONNECTIONS
+        ):
+            if error:
+                logger.error(f"Error scanning {folder} ({account.name}): {error}")
+            else:
+                sync.commit(account.address, folder)
+
+        # The CSVs must hold every result before the marks move past them
+        journal.compact()
+        sync.save()
+        if index is not None:
+            index.close()
+        logger.info(f"Mail check finished. {writer.new_replies} new replies, {writer.new_bounces} new bounces.")
+    except Exception as e:
+        logger.error(f"Mail check failed: {e}")
+
+if __name__ == "__main__":
+    with metrics.run("mail_checker"):
+        main()
@@ -1,11 +1,21 @@
 import smtplib
 import logging
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import queue
+import re
+import threading
+import uuid
+import base64
+from contextlib import contextmanager
+from email import policy
 from email.mime.application import MIMEApplication
 from datetime import datetime
 import email_config
+import metrics
+
+# --- SMTP Settings ---
+SMTP_HOST = email_config.SMTP_HOST
+SMTP_PORT = email_config.SMTP_PORT
 
 # --- Logging Setup ---
 LOG_FILE = "outreach.log"
@@ -15,7 +25,8 @@ def setup_logging():
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(message)s",
         handlers=[
-            logging.FileHandler(LOG_FILE),
+            # Opened on the first record, so importing mailer creates no file
+            logging.FileHandler(LOG_FILE, delay=True),
             logging.StreamHandler()
         ]
     )
@@ -23,6 +34,17 @@ def setup_logging():
 
 logger = setup_logging()
 
+def log_for_account(name):
+    """
+    Tags this process's log lines with the sending account and also writes
+    them to outreach.<name>.log, for runs that send from several accounts.
+    """
+    root = logging.getLogger()
+    root.addHandler(logging.FileHandler(f"{os.path.splitext(LOG_FILE)[0]}.{name}.log"))
+    formatter = logging.Formatter(f"%(asctime)s [%(levelname)s] [{name}] %(message)s")
+    for handler in root.handlers:
+        handler.setFormatter(formatter)
+
 def should_run(auto_flag):
     """
     Determines if the script should run based on the automation flag
@@ -42,38 +64,374 @@ def should_run(auto_flag):
     # Manual workflow_dispatch or other events are allowed
     return True
 
-def send_smtp_email(to_email, subject, body, attachment_path=None, dry_run=False):
+class SMTPSession:
+    """
+    A reusable, authenticated SMTP connection.
+    Connects lazily, reconnects transparently if the server drops the
+    connection and recycles itself after `max_messages` sends.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=None, password=None,
+                 max_messages=None, use_tls=True, timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages or email_config.SMTP_MAX_MESSAGES_PER_CONNECTION
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.server = None
+        self.sent_on_connection = 0
+        self.handshakes = 0
+
+    def connect(self):
+        self.close()
+        server = None
+        try:
+            with metrics.timer("smtp_connect"):
+                server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.use_tls:
+                    server.starttls()
+            if self.username:
+                with metrics.timer("smtp_auth"):
+                    server.login(self.username, self.password)
+        except BaseException:
+            # A failed STARTTLS or login would otherwise leak the socket
+            if server is not None:
+                server.close()
+            raise
+        self.server = server
+        self.sent_on_connection = 0
+        self.handshakes += 1
+        metrics.count("smtp_handshakes")
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.server is None or self.sent_on_connection >= self.max_messages:
+            self.connect()
+        try:
+            with metrics.timer("smtp_send"):
+                self.server.sendmail(from_addr, to_addrs, msg)
+        except smtplib.SMTPServerDisconnected:
+            logger.info("SMTP connection was closed by the server, reconnecting...")
+            metrics.count("smtp_reconnects")
+            self.connect()
+            with metrics.timer("smtp_send"):
+                self.server.sendmail(from_addr, to_addrs, msg)
+        self.sent_on_connection += 1
+        metrics.count("smtp_bytes", len(msg))
+
+def _transaction_reset(exc):
+    """
+    True for refusals after which smtplib has already reset the transaction
+    (RSET), so the connection can carry the next message.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code != 421 for code, _ in exc.recipients.values())
+    return isinstance(exc, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)) and exc.smtp_code != 421
+
+class SMTPPool:
+    """
+    A small pool of SMTPSession objects shared by the senders.
+    Sessions are created on demand up to `size` and handed out one at a time.
+    """
+
+    def __init__(self, size=1, **session_kwargs):
+        self.size = size
+        self.session_kwargs = session_kwargs
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @property
+    def handshakes(self):
+        return sum(s.handshakes for s in self._sessions)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._sessions) < self.size:
+                session = SMTPSession(**self.session_kwargs)
+                self._sessions.append(session)
+                return session
+        return self._idle.get()
+
+    @contextmanager
+    def session(self):
+        session = self._acquire()
+        try:
+            yield session
+        except Exception as e:
+            # Leave no half-finished transaction behind for the next caller
+            if not _transaction_reset(e):
+                session.close()
+            raise
+        finally:
+            self._idle.put(session)
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+
+# --- Send Outcomes ---
+# Enhanced status codes for the sender's own quota/auth problems: retrying
+# other recipients is pointless, so these stop the run.
+_SENDER_BLOCKED_RE = re.compile(rb"\b5\.4\.5\b|\b5\.7\.0 authentication|sending (?:limit|quota)", re.I)
+_ENHANCED_CODE_RE = re.compile(rb"\b([245])\.(\d{1,3})\.\d{1,3}\b")
+
+class SendResult:
+    """
+    Outcome of one send. Truthy only when the message was accepted.
+    """
+    OK = "ok"
+    THROTTLED = "throttled"    # server asked us to slow down (421, 450-452, 4.7.x)
+    TRANSIENT = "transient"    # network error or other temporary failure
+    REJECTED = "rejected"      # the recipient doesn't exist (5xx at RCPT, or 5.1.x): a hard bounce
+    FAILED = "failed"          # permanent failure for this message, e.g. content (5.7.1) or size (552)
+    FATAL = "fatal"            # the account itself is blocked (auth, sending quota)
+
+    def __init__(self, status, code=None, message="", message_id=None):
+        self.status = status
+        self.code = code
+        self.message = message
+        self.message_id = message_id    # of the accepted message
+
+    def __bool__(self):
+        return self.status == SendResult.OK
+
+    def __repr__(self):
+        return f"SendResult({self.status}, {self.code})"
+
+def classify_smtp_error(exc, to_email=None):
+    """
+    Maps an exception from an SMTP send to a SendResult.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        refusals = exc.recipients
+        code, reply = refusals.get(to_email) or next(iter(refusals.values()), (None, b""))
+    elif isinstance(exc, smtplib.SMTPResponseException):
+        code, reply = exc.smtp_code, exc.smtp_error
+    else:
+        # Dropped connections, timeouts and other socket errors
+        return SendResult(SendResult.TRANSIENT, message=str(exc))
+
+    reply = reply if isinstance(reply, bytes) else str(reply).encode("utf-8", "replace")
+    message = reply.decode("utf-8", "replace")
+    enhanced = _ENHANCED_CODE_RE.search(reply)
+
+    if isinstance(exc, smtplib.SMTPAuthenticationError) or _SENDER_BLOCKED_RE.search(reply):
+        status = SendResult.FATAL
+    elif code in (421, 450, 451, 452) or (enhanced and enhanced.group(1) == b"4" and enhanced.group(2) == b"7"):
+        status = SendResult.THROTTLED
+    elif code is not None and 400 <= code < 500:
+        status = SendResult.TRANSIENT
+    elif isinstance(exc, smtplib.SMTPSenderRefused):
+        status = SendResult.FATAL
+    elif code is not None and 500 <= code < 600:
+        # Only a refused recipient is a bounce; a rejected message says nothing about the address
+        recipient_refused = isinstance(exc, smtplib.SMTPRecipientsRefused)
+        bad_mailbox = enhanced and enhanced.group(1) == b"5" and enhanced.group(2) == b"1"
+        status = SendResult.REJECTED if recipient_refused or bad_mailbox else SendResult.FAILED
+    else:
+        status = SendResult.TRANSIENT
+    return SendResult(status, code, message)
+
+class RateController:
+    """
+    Adapts the spacing between sends to the server's replies.
+
+    A throttling reply pauses every sender for the current backoff, which
+    doubles on each throttle (up to max_backoff). While a backoff is active
+    it is also the minimum spacing between sends; each accepted message
+    halves it, so the rate climbs back to normal within a few sends.
+    A fatal result (auth failure, sending quota exhausted) stops the run.
+    """
+
+    def __init__(self, initial_backoff=None, max_backoff=None):
+        self.initial_backoff = email_config.RATE_INITIAL_BACKOFF if initial_backoff is None else initial_backoff
+        self.max_backoff = email_config.RATE_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.backoff = 0.0
+        self.peak_backoff = 0.0
+        self.counts = {}
+        self.stopped = False
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        """
+        Takes the result of a send (a SendResult or a plain bool) and returns
+        how long all senders should pause before the next send.
+        """
+        if not isinstance(result, SendResult):
+            result = SendResult(SendResult.OK if result else SendResult.TRANSIENT)
+        with self._lock:
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+            if result.status == SendResult.OK:
+                self.backoff /= 2
+                if self.backoff < self.initial_backoff:
+                    self.backoff = 0.0
+                return 0.0
+            if result.status == SendResult.THROTTLED:
+                self.backoff = min(self.max_backoff, max(self.initial_backoff, self.backoff * 2))
+                self.peak_backoff = max(self.peak_backoff, self.backoff)
+                logger.warning(f"Server is throttling ({result.code}), backing off {self.backoff:.0f}s.")
+                return self.backoff
+            if result.status == SendResult.FATAL and not self.stopped:
+                self.stopped = True
+                logger.error(f"Sending account blocked ({result.code} {result.message.strip()}), stopping the run.")
+            return 0.0
+
+    def summary(self):
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(self.counts.items()))
+        return f"{counts or 'no sends'}; peak backoff {self.peak_backoff:.0f}s"
+
+_smtp_pool = None
+
+def get_smtp_pool(size=1, username=None, password=None):
+    """
+    Returns the process-wide SMTP pool, creating it on first use.
+    The pool grows to `size` sessions if a caller needs more.
+    It logs in as EMAIL_ADDRESS unless created with other credentials.
+    """
+    global _smtp_pool
+    if _smtp_pool is None:
+        _smtp_pool = SMTPPool(
+            size=size,
+            host=SMTP_HOST,
+            port=SMTP_PORT,
+            use_tls=email_config.SMTP_STARTTLS,
+            username=username or email_config.EMAIL_ADDRESS,
+            password=password or email_config.EMAIL_PASSWORD,
+        )
+    elif size > _smtp_pool.size:
+        _smtp_pool.size = size
+    return _smtp_pool
+
+def close_smtp_pool():
+    global _smtp_pool
+    if _smtp_pool is not None:
+        _smtp_pool.close()
+        logger.info(f"Closed SMTP pool after {_smtp_pool.handshakes} connection(s).")
+        _smtp_pool = None
+
+# --- Message Building ---
+_attachment_cache = {}
+
+def get_attachment_part(attachment_path):
+    """
+    Returns the fully encoded MIME part for an attachment.
+    The part is built once per run and cached by path, size and mtime,
+    so an updated file is picked up without re-encoding it per recipient.
+    """
+    stat = os.stat(attachment_path)
+    key = (os.path.abspath(attachment_path), stat.st_size, stat.st_mtime_ns)
+    part = _attachment_cache.get(key)
+    if part is None:
+        with open(attachment_path, "rb") as f:
+            attach = MIMEApplication(f.read(), _subtype="pdf")
+        attach.add_header("Content-Disposition", "attachment", filename=os.path.basename(attachment_path))
+        part = attach.as_bytes(policy=policy.SMTP)
+        _attachment_cache[key] = part
+    return part
+
+def _encode_header(name, value):
+    line = f"{name}: {value}"
+    if line.isascii() and len(line) <= 78:
+        return line.encode("ascii") + b"\r\n"
+    # Non-ASCII or long values go through the full RFC 2047 folding machinery
+    return policy.SMTP.fold_binary(name, policy.SMTP.header_factory(name, value))
+
+def _encode_text_part(body):
+    """
+    Encodes a text/plain part the way MIMEText(body, "plain") does:
+    7bit us-ascii when possible, base64 utf-8 otherwise.
+    """
+    if body.isascii():
+        headers = b'Content-Type: text/plain; charset="us-ascii"\r\nMIME-Version: 1.0\r\nContent-Transfer-Encoding: 7bit\r\n\r\n'
+        payload = body.replace("\r\n", "\n").replace("\n", "\r\n").encode("ascii")
+    else:
+        headers = b'Content-Type: text/plain; charset="utf-8"\r\nMIME-Version: 1.0\r\nContent-Transfer-Encoding: base64\r\n\r\n'
+        payload = base64.encodebytes(body.encode("utf-8")).rstrip(b"\n").replace(b"\n", b"\r\n")
+    return headers + payload
+
+def make_message_id(from_addr):
+    """
+    A new globally unique Message-ID on the sender's domain.
+    """
+    return f"<{uuid.uuid4().hex}@{str(from_addr or '').rpartition('@')[2] or 'localhost'}>"
+
+def iter_message_bytes(from_addr, to_email, subject, body, attachment_path=None, message_id=None):
+    """
+    Yields a multipart/mixed message as CRLF-terminated byte chunks.
+    Only the headers and the text part are encoded per call; the
+    attachment part is spliced in from the cache.
+    """
+    boundary = f"=============={uuid.uuid4().hex}=="
+    headers = [
+        ("Content-Type", f'multipart/mixed; boundary="{boundary}"'),
+        ("MIME-Version", "1.0"),
+        ("From", from_addr),
+        ("To", to_email),
+        ("Subject", subject),
+    ]
+    if message_id:
+        headers.append(("Message-ID", message_id))
+    for name, value in headers:
+        yield _encode_header(name, value)
+    yield b"\r\n"
+
+    delimiter = f"--{boundary}\r\n".encode("ascii")
+    yield delimiter
+    yield _encode_text_part(body)
+
+    if attachment_path and os.path.exists(attachment_path):
+        yield b"\r\n" + delimiter
+        yield get_attachment_part(attachment_path)
+
+    yield f"\r\n--{boundary}--\r\n".encode("ascii")
+
+def build_message(from_addr, to_email, subject, body, attachment_path=None, message_id=None):
+    return b"".join(iter_message_bytes(from_addr, to_email, subject, body, attachment_path, message_id))
+
+def send_smtp_email(to_email, subject, body, attachment_path=None, dry_run=False, pool=None, from_addr=None):
     """
     Common function to send an email via SMTP.
     Supports attachments and dry-run mode.
+    Connections are reused through the shared SMTP pool unless `pool` is given.
+    Sends from EMAIL_ADDRESS unless `from_addr` is given.
+    Returns a SendResult, truthy on success, carrying the Message-ID the
+    message went out with.
     """
     if dry_run:
         logger.info(f"[DRY-RUN] Would send email to: {to_email}")
         logger.info(f"[DRY-RUN] Subject: {subject}")
         # logger.info(f"[DRY-RUN] Body: {body}") # Optional: noise reduction
-        return True
+        return SendResult(SendResult.OK)
 
+    from_addr = from_addr or email_config.EMAIL_ADDRESS
+    message_id = make_message_id(from_addr)
     try:
-        msg = MIMEMultipart()
-        msg["From"] = email_config.EMAIL_ADDRESS
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        if attachment_path and os.path.exists(attachment_path):
-            with open(attachment_path, "rb") as f:
-                attach = MIMEApplication(f.read(), _subtype="pdf")
-                attach.add_header("Content-Disposition", "attachment", filename=os.path.basename(attachment_path))
-                msg.attach(attach)
-
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(email_config.EMAIL_ADDRESS, email_config.EMAIL_PASSWORD)
-        server.sendmail(email_config.EMAIL_ADDRESS, to_email, msg.as_string())
-        server.quit()
+        with metrics.timer("message_build"):
+            msg = build_message(from_addr, to_email, subject, body, attachment_path, message_id)
+
+        with (pool or get_smtp_pool()).session() as session:
+            session.sendmail(from_addr, to_email, msg)
         
         logger.info(f"Successfully sent email to: {to_email}")
-        return True
+        metrics.count("send_ok")
+        return SendResult(SendResult.OK, message_id=message_id)
     except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {e}")
-        return False
+        result = classify_smtp_error(e, to_email)
+        logger.error(f"Failed to send email to {to_email} ({result.status}): {e}")
+        metrics.count(f"send_{result.status}")
+        return result
@@ -0,0 +1,99 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+import metrics
+from csv_state import normalize
+
+# ---------------- CONFIG ----------------
+MESSAGE_INDEX_DB = "message_ids.db"
+# ----------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id_key      INTEGER PRIMARY KEY,  -- 64-bit hash of the Message-ID
+    address     TEXT NOT NULL,        -- normalized recipient
+    campaign    TEXT NOT NULL,        -- "initial" or "followup"
+    sent_at     REAL NOT NULL
+);
+"""
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+
+SentMessage = namedtuple("SentMessage", "address campaign sent_at")
+
+def id_key(message_id):
+    """
+    Signed 64-bit hash of a Message-ID (angle brackets included), the
+    index's primary key.
+    """
+    return int.from_bytes(hashlib.blake2b(message_id.strip().encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def referenced_ids(in_reply_to, references):
+    """
+    The Message-IDs a message answers, most likely first: In-Reply-To,
+    then References from the newest (last) to the oldest.
+    """
+    ids = _MESSAGE_ID_RE.findall(str(in_reply_to or ""))
+    ids += reversed(_MESSAGE_ID_RE.findall(str(references or "")))
+    return list(dict.fromkeys(ids))
+
+class MessageIndex:
+    """
+    Every sent message's Message-ID with its recipient, campaign step and
+    send time, so a reply can be tied to the exact message it answers from
+    its In-Reply-To/References headers with one primary-key lookup.
+
+    Rows are keyed by a 64-bit hash of the ID rather than the ID itself,
+    which keeps the file small enough to commit alongside the CSVs.
+    """
+
+    def __init__(self, path=MESSAGE_INDEX_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # A row lost to a power cut only means that reply is matched by its From address
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Sender threads share the connection
+        self._lock = threading.Lock()
+
+    def close(self):
+        # Folds the WAL back in, so message_ids.db alone can be committed
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, message_id, address, campaign, sent_at=None):
+        with metrics.timer("index_write"), self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO messages (id_key, address, campaign, sent_at) VALUES (?, ?, ?, ?)",
+                (id_key(message_id), normalize(address), campaign, time.time() if sent_at is None else sent_at)
+            )
+
+    def lookup(self, message_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT address, campaign, sent_at FROM messages WHERE id_key = ?", (id_key(message_id),)
+            ).fetchone()
+        return SentMessage(*row) if row else None
+
+    def match(self, in_reply_to, references):
+        """
+        The sent message a reply answers, or None if it references none of ours.
+        """
+        for message_id in referenced_ids(in_reply_to, references):
+            sent = self.lookup(message_id)
+            if sent is not None:
+                return sent
+        return None
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
@@ -0,0 +1,204 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import email_config
+
+# ---------------- CONFIG ----------------
+# Upper bounds, in seconds, of the phase-duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+# ----------------------------------------
+
+# mailer imports this module, so the logger is looked up by name
+logger = logging.getLogger("mailer")
+
+class Histogram:
+    def __init__(self, bounds=DURATION_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        """
+        [(upper bound, observations <= bound)], ending with +Inf.
+        """
+        total = 0
+        result = []
+        for bound, n in zip(list(self.bounds) + [float("inf")], self.buckets):
+            total += n
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+            "count": self.count, "sum": round(self.sum, 6),
+            "min": round(self.min or 0, 6), "max": round(self.max or 0, 6),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): n for bound, n in self.cumulative()},
+        }
+
+class Metrics:
+    """
+    Per-run counters and phase-duration histograms, shared by all threads.
+
+    timer("smtp_send") around a block records its duration under that
+    phase; count("smtp_bytes", n) adds to a counter. Both cost a lock and
+    a dict lookup, so they're always on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, script=None):
+        with self._lock:
+            self.script = script
+            self.started = time.time()
+            self._start = time.perf_counter()
+            self.counters = {}
+            self.phases = {}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def wall_seconds(self):
+        return time.perf_counter() - self._start
+
+    # --- Export ---
+
+    def as_record(self):
+        with self._lock:
+            return {
+                "script": self.script,
+                "started": datetime.utcfromtimestamp(self.started).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "wall_seconds": round(self.wall_seconds(), 6),
+                "counters": dict(sorted(self.counters.items())),
+                "phases": {name: h.as_dict() for name, h in sorted(self.phases.items())},
+            }
+
+    def as_prometheus(self):
+        """
+        The run in Prometheus text exposition format, for node_exporter's
+        textfile collector.
+        """
+        script = f'script="{self.script}"'
+        lines = [
+            "# HELP outreach_run_wall_seconds Wall-clock duration of the last run.",
+            "# TYPE outreach_run_wall_seconds gauge",
+            f"outreach_run_wall_seconds{{{script}}} {self.wall_seconds():.6f}",
+            "# HELP outreach_run_timestamp_seconds Start time of the last run.",
+            "# TYPE outreach_run_timestamp_seconds gauge",
+            f"outreach_run_timestamp_seconds{{{script}}} {self.started:.0f}",
+            "# HELP outreach_events_total Events counted during the last run.",
+            "# TYPE outreach_events_total counter",
+        ]
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'outreach_events_total{{{script},event="{name}"}} {value}')
+            lines += [
+                "# HELP outreach_phase_seconds Time spent per phase during the last run.",
+                "# TYPE outreach_phase_seconds histogram",
+            ]
+            for name, histogram in sorted(self.phases.items()):
+                labels = f'{script},phase="{name}"'
+                for bound, n in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f'outreach_phase_seconds_bucket{{{labels},le="{le}"}} {n}')
+                lines.append(f"outreach_phase_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"outreach_phase_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None, fmt=None):
+        """
+        Appends the run as one JSON line, or replaces a Prometheus textfile.
+        `{script}` in the path is replaced by the script name.
+        """
+        fmt = fmt or email_config.METRICS_FORMAT
+        if not fmt:
+            return None
+        if fmt not in ("jsonl", "prometheus"):
+            logger.warning(f"Unknown METRICS_FORMAT {fmt!r} (use jsonl, prometheus or none); not writing run metrics.")
+            return None
+        path = (path or email_config.METRICS_FILE).format(script=self.script or "run")
+        if fmt == "prometheus":
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.as_prometheus())
+            # The collector may read at any time; never let it see half a file
+            os.replace(tmp_path, path)
+        else:
+            with open(path, "a") as f:
+                f.write(json.dumps(self.as_record(), separators=(",", ":")) + "\n")
+        return path
+
+    def summary(self, top=6):
+        """
+        One line naming the phases that took the most time.
+        """
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: -item[1].sum)[:top]
+        parts = ", ".join(f"{name} {h.sum:.2f}s/{h.count}" for name, h in phases)
+        return f"wall {self.wall_seconds():.2f}s; {parts or 'no timed phases'}"
+
+registry = Metrics()
+count = registry.count
+observe = registry.observe
+timer = registry.timer
+
+@contextmanager
+def run(script, write=True):
+    """
+    Wraps a script's main(): starts a fresh set of metrics, optionally
+    captures a cProfile of the whole run (PROFILE_RUNS) and writes both
+    out when the run ends, however it ends. With `write` off (dry runs)
+    only the summary is logged.
+    """
+    registry.reset(script)
+    profiler = None
+    if email_config.PROFILE_RUNS and write:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield registry
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = f"{script}.pstats"
+            profiler.dump_stats(profile_path)
+            logger.info(f"Saved a cProfile capture to {profile_path} (view with: python -m pstats {profile_path}).")
+        try:
+            path = registry.write() if write else None
+        except OSError as e:
+            logger.warning(f"Could not write run metrics: {e}")
+            path = None
+        logger.info(f"Run metrics: {registry.summary()}" + (f" (written to {path})" if path else ""))
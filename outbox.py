@@ -0,0 +1,359 @@
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import bounce_checker
+import email_config
+import mailer
+import metrics
+from csv_state import normalize, today
+
+# ---------------- CONFIG ----------------
+OUTBOX_DB = "outbox.db"
+# ----------------------------------------
+
+logger = mailer.logger
+
+ENQUEUED = "enqueued"
+RENDERING = "rendering"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,  -- enqueue order
+    campaign    TEXT NOT NULL,        -- "initial" or "followup"
+    address     TEXT NOT NULL,        -- normalized lookup key
+    email       TEXT NOT NULL,
+    first_name  TEXT,
+    state       TEXT NOT NULL DEFAULT 'enqueued',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    owner       TEXT,                 -- host:pid of the process holding the job
+    claimed_at  REAL,
+    not_before  REAL NOT NULL DEFAULT 0,
+    updated_at  REAL,
+    last_error  TEXT,
+    UNIQUE (campaign, address)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(campaign, state, id);
+"""
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class Outbox:
+    """
+    Durable outbound queue shared by send_email.py and send_followup.py.
+
+    Every job moves enqueued → rendering → sending → sent/failed. claim()
+    hands jobs to one process at a time (SQLite's write lock makes the
+    claim atomic), so several senders can drain the same outbox. A job is
+    marked sending before the SMTP call; if the process dies there, the
+    job is settled as sent, never retried, the same way the state journal
+    treats a send with no recorded outcome. Jobs claimed but not yet sent
+    go back to enqueued when the run ends or, after a crash, once their
+    lease runs out.
+    """
+
+    def __init__(self, path=OUTBOX_DB, owner=None):
+        self.path = path
+        self.owner = owner or worker_id()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(SCHEMA)
+        # Sender threads share the connection; one transaction at a time
+        self._lock = threading.RLock()
+
+    def close(self):
+        # Folds the WAL back in, so outbox.db alone can be committed
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes
+        # can't both read the same jobs as ready
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql, params=()):
+        with metrics.timer("outbox_write"), self._transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    # --- Filling ---
+
+    def enqueue(self, campaign, recipients, limit=None):
+        """
+        Adds (email, first_name) pairs not already in the outbox for this
+        campaign, up to `limit` new jobs. Returns the number added.
+        """
+        added = 0
+        now = time.time()
+        with self._transaction() as conn:
+            for email, first_name in recipients:
+                if limit is not None and added >= limit:
+                    break
+                added += conn.execute("""
+                    INSERT OR IGNORE INTO jobs (campaign, address, email, first_name, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (campaign, normalize(email), str(email).strip(), first_name, now)).rowcount
+        return added
+
+    def ready(self, campaign):
+        """
+        Jobs a sender could claim right now.
+        """
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE campaign = ? AND state = 'enqueued' AND not_before <= ?",
+            (campaign, time.time())
+        ).fetchone()[0]
+
+    def fill(self, campaign, recipients, low_water):
+        """
+        Adds up to OUTBOX_REFILL_SIZE jobs from `recipients` once fewer than
+        `low_water` are ready, so most runs never walk the contact list.
+        """
+        if self.ready(campaign) >= low_water:
+            return 0
+        added = self.enqueue(campaign, recipients, limit=email_config.OUTBOX_REFILL_SIZE)
+        logger.info(f"Outbox: enqueued {added} new {campaign} job(s).")
+        return added
+
+    # --- Draining ---
+
+    def recover(self, lease=None):
+        """
+        Settles jobs left behind by processes that stopped without
+        releasing them. Returns (jobs requeued, sends settled as sent).
+        """
+        cutoff = time.time() - (email_config.OUTBOX_LEASE_SECONDS if lease is None else lease)
+        requeued = self._write("""
+            UPDATE jobs SET state = 'enqueued', owner = NULL, claimed_at = NULL
+            WHERE state = 'rendering' AND claimed_at < ?
+        """, (cutoff,))
+        settled = self._write("""
+            UPDATE jobs SET state = 'sent', owner = NULL, last_error = 'outcome unknown'
+            WHERE state = 'sending' AND claimed_at < ?
+        """, (cutoff,))
+        if requeued or settled:
+            logger.warning(f"Outbox: requeued {requeued} abandoned job(s); {settled} interrupted send(s) counted as sent.")
+        return requeued, settled
+
+    def claim(self, campaign, count, after=0):
+        """
+        Atomically takes up to `count` ready jobs with ids above `after` for
+        this process, oldest first. Returns their rows (id, email, first_name).
+        """
+        now = time.time()
+        with metrics.timer("outbox_claim"), self._transaction() as conn:
+            rows = conn.execute("""
+                SELECT id, email, first_name FROM jobs
+                WHERE campaign = ? AND state = 'enqueued' AND not_before <= ? AND id > ?
+                ORDER BY id LIMIT ?
+            """, (campaign, now, after, count)).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = 'rendering', owner = ?, claimed_at = ?, updated_at = ? WHERE id = ?",
+                [(self.owner, now, now, row["id"]) for row in rows]
+            )
+        return rows
+
+    def drain(self, campaign, batch_size=None):
+        """
+        Yields this process's jobs as (email, first_name), claiming them a
+        batch at a time as the caller consumes. Jobs handed back with
+        unclaim() aren't claimed again by the same drain.
+        """
+        batch_size = batch_size or email_config.OUTBOX_CLAIM_BATCH
+        last_id = 0
+        while True:
+            batch = self.claim(campaign, batch_size, after=last_id)
+            if not batch:
+                return
+            last_id = batch[-1]["id"]
+            for row in batch:
+                yield row["email"], row["first_name"] or ""
+
+    def _transition(self, campaign, email, sql, params=(), state=None):
+        """
+        Updates one of this process's jobs, optionally only from `state`.
+        Returns the number of rows changed (0 or 1).
+        """
+        return self._write(
+            f"UPDATE jobs SET {sql}, updated_at = ? WHERE campaign = ? AND address = ? AND owner = ? AND state = COALESCE(?, state)",
+            (*params, time.time(), campaign, normalize(email), self.owner, state)
+        )
+
+    def start_send(self, campaign, email):
+        """
+        Durably marks a job as being sent; call right before the SMTP
+        transaction. Returns False if the job is no longer this process's
+        (its lease ran out and another sender took it), in which case it
+        must not be sent. Also renews the lease on the other claims.
+        """
+        now = time.time()
+        self._write("UPDATE jobs SET claimed_at = ? WHERE owner = ? AND state = 'rendering'", (now, self.owner))
+        return bool(self._transition(
+            campaign, email, "state = 'sending', attempts = attempts + 1, claimed_at = ?", (now,),
+            state=RENDERING
+        ))
+
+    def finish_send(self, campaign, email, result):
+        """
+        Settles a send from its mailer.SendResult. Permanent rejections (of
+        the recipient or of the message) are final; other failures are
+        retried later until OUTBOX_MAX_ATTEMPTS.
+        """
+        if result:
+            self._transition(campaign, email, "state = 'sent', owner = NULL, last_error = NULL")
+            return
+        error = f"{result.status} {result.code or ''}".strip()
+        if result.status in (mailer.SendResult.REJECTED, mailer.SendResult.FAILED):
+            self._transition(campaign, email, "state = 'failed', owner = NULL, last_error = ?", (error,))
+            return
+        self._transition(campaign, email, """
+            state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'enqueued' END,
+            owner = NULL, claimed_at = NULL, not_before = ?, last_error = ?
+        """, (email_config.OUTBOX_MAX_ATTEMPTS, time.time() + email_config.OUTBOX_RETRY_DELAY, error))
+
+    def unclaim(self, campaign, email):
+        """
+        Hands a claimed job back to the queue unsent, for another sender
+        (or the next run) to take.
+        """
+        return self._transition(campaign, email, "state = 'enqueued', owner = NULL, claimed_at = NULL", state=RENDERING)
+
+    def skip(self, campaign, email, reason):
+        """
+        Drops a claimed job without sending it, e.g. because it got suppressed.
+        """
+        self._transition(campaign, email, "state = 'failed', owner = NULL, last_error = ?", (reason,))
+
+    def drop(self, campaign, email):
+        """
+        Removes a claimed job from the outbox, e.g. because another account
+        sends to the address now; it can be enqueued again if that changes back.
+        """
+        return self._write(
+            "DELETE FROM jobs WHERE campaign = ? AND address = ? AND owner = ?",
+            (campaign, normalize(email), self.owner)
+        )
+
+    def release(self):
+        """
+        Returns every job this process claimed but didn't send to the queue.
+        """
+        released = self._write(
+            "UPDATE jobs SET state = 'enqueued', owner = NULL, claimed_at = NULL WHERE owner = ? AND state = 'rendering'",
+            (self.owner,)
+        )
+        if released:
+            logger.info(f"Outbox: released {released} unsent job(s) for the next run.")
+        return released
+
+    # --- Reporting ---
+
+    def counts(self):
+        """
+        {campaign: {state: jobs}}
+        """
+        counts = {}
+        for row in self.conn.execute("SELECT campaign, state, COUNT(*) AS n FROM jobs GROUP BY campaign, state"):
+            counts.setdefault(row["campaign"], {})[row["state"]] = row["n"]
+        return counts
+
+    def retry_failed(self, campaign=None):
+        return self._write("""
+            UPDATE jobs SET state = 'enqueued', attempts = 0, not_before = 0, last_error = NULL
+            WHERE state = 'failed' AND (? IS NULL OR campaign = ?)
+        """, (campaign, campaign))
+
+class CampaignSender:
+    """
+    The send_fn both senders hand to the scheduler: sends one rendered
+    message and does the bookkeeping around it. The send is journaled to
+    `log_path`, its outbox job (if any) is settled, the Message-ID is
+    indexed for the reply checkers, and a permanent reject is recorded as
+    a hard bounce. On a dry run only the send itself happens.
+    """
+
+    def __init__(self, campaign, log_path, journal, outbox=None, message_index=None,
+                 from_addr=None, attachment_path=None, dry_run=False, pool=None):
+        self.campaign = campaign
+        self.log_path = log_path
+        self.journal = journal
+        self.outbox = outbox
+        self.message_index = message_index
+        self.from_addr = from_addr
+        self.attachment_path = attachment_path
+        self.dry_run = dry_run
+        self.pool = pool
+
+    def send(self, to_email, message):
+        """
+        Returns the mailer.SendResult, or None if the job was no longer
+        this process's to send.
+        """
+        if self.outbox is not None and not self.outbox.start_send(self.campaign, to_email):
+            logger.warning(f"Skipping {to_email}: another sender took over the job.")
+            return None
+        seq = None if self.dry_run else self.journal.begin(self.log_path, [to_email, today()], header=["email", "sent_on"])
+        result = mailer.send_smtp_email(
+            to_email=to_email,
+            subject=message.subject,
+            body=message.body,
+            attachment_path=self.attachment_path,
+            dry_run=self.dry_run,
+            pool=self.pool,
+            from_addr=self.from_addr
+        )
+        if seq is None:
+            return result
+        (self.journal.commit if result else self.journal.abort)(seq)
+        if result and self.message_index is not None:
+            # Lets the reply checkers tie a reply to this exact message
+            self.message_index.record(result.message_id, to_email, self.campaign)
+        if result.status == mailer.SendResult.REJECTED:
+            # A permanent reject won't succeed later; stop retrying it
+            bounce_checker.append_bounce(to_email, "hard", self.journal)
+        if self.outbox is not None:
+            self.outbox.finish_send(self.campaign, to_email, result)
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the outbound queue.")
+    parser.add_argument("command", choices=["status", "recover", "retry-failed"],
+                        help="print job counts, requeue abandoned jobs, or requeue failed jobs.")
+    parser.add_argument("--campaign", choices=["initial", "followup"], help="Limit retry-failed to one campaign.")
+    parser.add_argument("--db", default=OUTBOX_DB, help="Path to the outbox database.")
+    args = parser.parse_args()
+
+    with Outbox(args.db) as outbox:
+        if args.command == "recover":
+            outbox.recover()
+        elif args.command == "retry-failed":
+            print(f"Requeued {outbox.retry_failed(args.campaign)} failed job(s).")
+        else:
+            for campaign, states in sorted(outbox.counts().items()):
+                line = ", ".join(f"{states.get(state, 0)} {state}" for state in (ENQUEUED, RENDERING, SENDING, SENT, FAILED))
+                print(f"{campaign:<10} {line}")
+
+if __name__ == "__main__":
+    main()
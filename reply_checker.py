@@ -1,44 +1,133 @@
-import imaplib
 import email
 import os
-import pandas as pd
+import accounts
+import bounce_checker
+import csv_state
 import email_config
+import imap_utils
 import mailer
-from datetime import datetime, timedelta
+import metrics
+from collections import namedtuple
+from message_index import MESSAGE_INDEX_DB, MessageIndex
+from state_journal import StateJournal
+from sync_state import SyncState
+from datetime import datetime, timedelta, timezone
 
 # ---------------- CONFIG ----------------
-IMAP_HOST = "imap.gmail.com"
-EMAIL_USER = email_config.EMAIL_ADDRESS
-EMAIL_PASS = email_config.EMAIL_PASSWORD
+IMAP_HOST = email_config.IMAP_HOST
 
 REPLIED_CSV = "replied.csv"
 SENT_LOG_CSV = "sent_log.csv"
 
 DAYS_BACK = email_config.CHECK_DAYS_BACK
+
+# Replies are classified from these headers alone; bodies are never downloaded.
+# SUBJECT and CONTENT-TYPE tell bounces (which quote our Message-ID) apart.
+REPLY_HEADER_FIELDS = ("FROM", "DATE", "IN-REPLY-TO", "REFERENCES", "SUBJECT", "CONTENT-TYPE")
 # ----------------------------------------
 
 logger = mailer.logger
 
-def load_sent_emails():
-    if not os.path.exists(SENT_LOG_CSV):
-        return set()
-    df = pd.read_csv(SENT_LOG_CSV)
-    if df.empty:
-        return set()
-    return {str(e).strip().lower() for e in df["email"].tolist()}
+# `replied_to` is the campaign step ("initial"/"followup") and `latency` the
+# seconds since it was sent; both None unless the reply named our Message-ID
+Reply = namedtuple("Reply", "address replied_to latency")
+
+def load_sent_emails(sender_accounts):
+    """
+    {account name: addresses it emailed}.
+    """
+    return {account.name: csv_state.read_emails(account.path(SENT_LOG_CSV)) for account in sender_accounts}
 
 def load_existing_replies():
-    if not os.path.exists(REPLIED_CSV):
-        return set()
-    df = pd.read_csv(REPLIED_CSV)
-    if df.empty:
-        return set()
-    return {str(e).strip().lower() for e in df["email"].tolist()}
-
-def append_reply(email_addr):
-    file_exists = os.path.exists(REPLIED_CSV)
-    df = pd.DataFrame([[email_addr, datetime.utcnow().strftime("%Y-%m-%d")]], columns=["email", "detected_on"])
-    df.to_csv(REPLIED_CSV, mode="a", header=not file_exists, index=False)
+    return csv_state.read_emails(REPLIED_CSV)
+
+def load_message_index():
+    """
+    The senders' Message-ID index, or None before anything was sent with one.
+    """
+    return MessageIndex() if os.path.exists(MESSAGE_INDEX_DB) else None
+
+def append_reply(email_addr, journal, replied_to=None, latency=None):
+    metrics.count("replies_recorded")
+    row = [email_addr, datetime.utcnow().strftime("%Y-%m-%d")]
+    if replied_to:
+        row += [replied_to, "" if latency is None else f"{latency:.0f}"]
+    journal.append(
+        REPLIED_CSV,
+        row,
+        header=["email", "detected_on", "replied_to", "latency_seconds"]
+    )
+
+def same_company(address, other):
+    """
+    True if both addresses are on the same domain, or one on a subdomain of the other's.
+    """
+    domain = address.rpartition("@")[2].lower()
+    other = other.rpartition("@")[2].lower()
+    return bool(domain) and (domain == other or domain.endswith(f".{other}") or other.endswith(f".{domain}"))
+
+def reply_latency(date_header, sent_at):
+    """
+    Seconds between a send and the Date of the reply to it, or None if the date can't be read.
+    """
+    try:
+        replied = email.utils.parsedate_to_datetime(date_header)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if replied.tzinfo is None:
+        replied = replied.replace(tzinfo=timezone.utc)
+    return max(0.0, replied.timestamp() - sent_at)
+
+def match_reply(headers, sent_emails, index):
+    """
+    Ties a message to one of our sends from its headers. A message whose
+    In-Reply-To/References names one of our Message-IDs is a reply to
+    that exact message, even from a colleague at the same company, and
+    gets its latency. Otherwise it counts when it comes from an address
+    in `sent_emails`. Bounces never count, even from the recipient's own
+    server. Returns a Reply or None.
+    """
+    if bounce_checker.is_bounce(headers):
+        return None
+    from_addr = email.utils.parseaddr(headers.get("From") or "")[1].lower()
+    sent = index.match(headers.get("In-Reply-To"), headers.get("References")) if index else None
+    if sent is not None and same_company(from_addr, sent.address):
+        return Reply(sent.address, sent.campaign, reply_latency(headers.get("Date"), sent.sent_at))
+    if from_addr in sent_emails:
+        # Basic check: Is it actually a reply? 
+        # Usually has Re: or In-Reply-To header, but for simple outreach, 
+        # ANY email from them is likely a reply.
+        return Reply(from_addr, None, None)
+    return None
+
+def describe_reply(reply):
+    if reply.replied_to is None:
+        return reply.address
+    after = "" if reply.latency is None else f" after {reply.latency / 3600:.1f}h"
+    return f"{reply.address} (to the {reply.replied_to} email{after})"
+
+def scan_inbox(mail, account, since_date, sent_emails, sync, index):
+    """
+    Returns the replies to the account's emails that reached its INBOX
+    since the last run. Writing them out is left to the caller.
+    """
+    # Search for messages since date that arrived after the last run, then fetch
+    # only the headers we need in batched UID FETCH round trips and filter in Python.
+    uids = sync.search_new(mail, account.address, "INBOX", f'SINCE "{since_date}"')
+
+    if uids is None:
+        raise RuntimeError("Could not search INBOX")
+
+    replies = []
+    stats = imap_utils.FetchStats()
+    for uid, headers in imap_utils.fetch_headers(mail, uids, REPLY_HEADER_FIELDS, stats=stats):
+        reply = match_reply(headers, sent_emails, index)
+        if reply is not None:
+            replies.append(reply)
+
+    sync.hold_back(account.address, "INBOX", stats.failed)
+    logger.info(f"Fetched headers for {stats} ({account.name})")
+    return replies
 
 def check_for_replies():
     if not mailer.should_run(email_config.RUN_REPLY_CHECK_AUTO):
@@ -47,50 +136,53 @@ def check_for_replies():
     since_date = (datetime.utcnow() - timedelta(days=DAYS_BACK)).strftime("%d-%b-%Y")
     logger.info(f"Checking for replies since {since_date}...")
 
-    sent_emails = load_sent_emails()
+    journal = StateJournal("reply_checker")
+    journal.replay()
+
+    sender_accounts = accounts.load_accounts()
+    sent_emails = load_sent_emails(sender_accounts)
     existing_replies = load_existing_replies()
 
-    if not sent_emails:
+    if not any(sent_emails.values()):
         logger.info("No sent emails found in log. Skipping reply check.")
         return
 
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_HOST)
-        mail.login(EMAIL_USER, EMAIL_PASS)
-        mail.select("INBOX")
+        sync = SyncState()
+        index = load_message_index()
+
+        def scan(mail, account, folder):
+            return scan_inbox(mail, account, since_date, sent_emails[account.name], sync, index)
 
-        # Search for all messages from sent emails
+        # Every account's INBOX is checked in parallel; replies are written here, on one thread
         new_replies = 0
-        
-        # Optimization: Instead of searching for EACH email, we search for all messages since date
-        # and then filter in Python, or we could construct a complex search query.
-        # Given potential Gmail search limits, let's search for messages since_date.
-        status, messages = mail.search(None, f'(SINCE "{since_date}")')
-        
-        if status != "OK":
-            logger.error("Could not search INBOX")
-            return
-
-        for num in messages[0].split():
-            _, data = mail.fetch(num, "(RFC822)")
-            msg = email.message_from_bytes(data[0][1])
-            
-            from_addr = email.utils.parseaddr(msg.get("From"))[1].lower()
-            
-            if from_addr in sent_emails and from_addr not in existing_replies:
-                # Basic check: Is it actually a reply? 
-                # Usually has Re: or In-Reply-To header, but for simple outreach, 
-                # ANY email from them is likely a reply.
-                logger.info(f"New reply detected from: {from_addr}")
-                append_reply(from_addr)
-                existing_replies.add(from_addr)
+        for account, folder, replies, error in imap_utils.scan_accounts(
+            [account for account in sender_accounts if sent_emails[account.name]],
+            ["INBOX"], scan, IMAP_HOST
+        ):
+            if error:
+                logger.error(f"Error checking replies for {account.name}: {error}")
+                continue
+
+            for reply in replies:
+                if reply.address in existing_replies:
+                    continue
+                logger.info(f"New reply detected from: {describe_reply(reply)}")
+                append_reply(reply.address, journal, reply.replied_to, reply.latency)
+                existing_replies.add(reply.address)
                 new_replies += 1
+            sync.commit(account.address, folder)
 
-        mail.logout()
+        # The CSVs must hold every result before the marks move past them
+        journal.compact()
+        sync.save()
+        if index is not None:
+            index.close()
         logger.info(f"Reply check finished. Detected {new_replies} new replies.")
 
     except Exception as e:
         logger.error(f"Error checking replies: {e}")
 
 if __name__ == "__main__":
-    check_for_replies()
+    with metrics.run("reply_checker"):
+        check_for_replies()
@@ -0,0 +1,402 @@
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+import email_config
+import mailer
+import metrics
+
+logger = mailer.logger
+
+def domain_of(address):
+    return str(address).rsplit("@", 1)[-1].strip().lower()
+
+class DomainQueue:
+    """
+    Interleaves a stream of (to_email, context) jobs by recipient domain.
+
+    Jobs are read through a bounded lookahead window into one FIFO queue per
+    domain. pop() serves the domain that can be sent to soonest, rotating
+    through domains round-robin on ties, so consecutive sends rarely hit the
+    same receiving server. Once a domain's successful sends, plus its jobs
+    in flight and queued, reach `max_per_domain`, its further jobs are
+    skipped; they stay pending for the next run. Up to `max_per_domain` of
+    them are held back instead, and callers report each popped job through
+    finish(), so a failed send hands its slot to a held job. The others are
+    passed to `on_deferred(to_email)`, e.g. to hand them back to the outbox.
+    """
+
+    def __init__(self, jobs, max_per_domain=0, lookahead=None, on_deferred=None):
+        self._source = iter(jobs)
+        self.max_per_domain = max_per_domain
+        self.lookahead = lookahead or email_config.DOMAIN_LOOKAHEAD
+        self.on_deferred = on_deferred
+        self._queues = OrderedDict()
+        self._buffered = 0
+        self._drained = False
+        self._held = {}
+        self.in_flight = Counter()
+        self.sent = Counter()
+        self.deferred = Counter()
+        # _lock guards the queues and counters for a moment at a time;
+        # _source_lock lets one thread at a time read from the (possibly slow) source
+        self._lock = threading.Lock()
+        self._source_lock = threading.Lock()
+
+    @property
+    def drained(self):
+        """
+        True once the source is exhausted and nothing is queued.
+        """
+        with self._lock:
+            return self._drained and not self._buffered
+
+    def _capped(self, domain):
+        if not self.max_per_domain:
+            return False
+        queued = len(self._queues.get(domain, ()))
+        return self.sent[domain] + self.in_flight[domain] + queued >= self.max_per_domain
+
+    def _place(self, job):
+        """
+        Queues a job read from the source, or holds it back if its domain is
+        capped. Returns True if the job was deferred without being held.
+        """
+        domain = domain_of(job[0])
+        if not self._capped(domain):
+            self._queues.setdefault(domain, deque()).append(job)
+            self._buffered += 1
+            return False
+        self.deferred[domain] += 1
+        held = self._held.setdefault(domain, deque())
+        if len(held) < self.max_per_domain:
+            held.append(job)
+            return False
+        return True
+
+    def fill(self):
+        """
+        Reads from the source until the lookahead window is full. Reading
+        happens outside _lock, so pop() and finish() aren't held up by it.
+        """
+        with self._source_lock:
+            while True:
+                with self._lock:
+                    if self._drained or self._buffered >= self.lookahead:
+                        return
+                job = next(self._source, None)
+                with self._lock:
+                    if job is None:
+                        self._drained = True
+                        return
+                    deferred = self._place(job)
+                if deferred and self.on_deferred:
+                    self.on_deferred(job[0])
+
+    def depths(self):
+        """
+        Jobs currently queued per domain, deepest first.
+        """
+        with self._lock:
+            return dict(sorted(((d, len(q)) for d, q in self._queues.items()), key=lambda item: -item[1]))
+
+    def pop(self, ready_at=None, fill=True):
+        """
+        Returns the next job, or None if none is queued (with `fill`, once
+        the stream is drained). `ready_at(domain)` gives the earliest time a
+        domain may be sent to; without it domains are simply served in rotation.
+        """
+        if fill:
+            self.fill()
+        with self._lock:
+            if not self._queues:
+                return None
+            if ready_at is None:
+                domain = next(iter(self._queues))
+            else:
+                # min() keeps the first of equally ready domains, i.e. rotation order
+                domain = min(self._queues, key=ready_at)
+
+            queue = self._queues.pop(domain)
+            job = queue.popleft()
+            if queue:
+                # Re-inserting moves the domain to the back of the rotation
+                self._queues[domain] = queue
+            self._buffered -= 1
+            self.in_flight[domain] += 1
+            return job
+
+    def finish(self, to_email, success):
+        """
+        Settles a job returned by pop(). Only successful sends count
+        towards the domain's cap.
+        """
+        domain = domain_of(to_email)
+        with self._lock:
+            self.in_flight[domain] -= 1
+            if success:
+                self.sent[domain] += 1
+            elif self._held.get(domain):
+                self._queues.setdefault(domain, deque()).append(self._held[domain].popleft())
+                self._buffered += 1
+                self.deferred[domain] -= 1
+
+    def waiting(self):
+        """
+        True if held jobs may still be released by sends in flight.
+        """
+        with self._lock:
+            return any(held and self.in_flight[domain] for domain, held in self._held.items())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        job = self.pop()
+        if job is None:
+            raise StopIteration
+        return job
+
+class SendScheduler:
+    """
+    Runs sends on a small pool of worker threads.
+
+    Each worker keeps the per-recipient jitter of the old serial loop
+    (sleeping min_delay..max_delay after every successful send), while a
+    shared pacer enforces a global rate cap and a minimum spacing between
+    two sends to the same domain. Jobs are drawn through a DomainQueue, so
+    the next send always goes to the domain whose spacing window opens
+    first, and no domain gets more than `domain_cap` successful sends per run.
+    Message building and SMTP I/O of one worker overlap with the pacing
+    windows of the others. The queue reads at most `lookahead` jobs ahead,
+    and never more than the sends still missing to reach the limit.
+
+    `send_fn(to_email, context)` returns something truthy on success, or
+    None if it decided not to send after all (the job then doesn't count
+    towards the limit and no delay follows). When it returns a
+    mailer.SendResult, the `rate` controller (if given) widens the global
+    spacing on throttling and stops the run on fatal errors.
+    """
+
+    def __init__(self, send_fn, limit, min_delay, max_delay, workers=1,
+                 max_per_minute=0, domain_interval=0, domain_cap=0,
+                 budget=None, failure_delay=None, rate=None,
+                 lookahead=None, on_deferred=None):
+        self.send_fn = send_fn
+        self.limit = limit
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.workers = max(1, workers)
+        self.global_interval = 60.0 / max_per_minute if max_per_minute else 0
+        self.domain_interval = domain_interval
+        self.domain_cap = domain_cap
+        self.budget = budget
+        self.failure_delay = email_config.SEND_FAILURE_DELAY if failure_delay is None else failure_delay
+        self.rate = rate
+        self.lookahead = lookahead or email_config.DOMAIN_LOOKAHEAD
+        self.on_deferred = on_deferred
+
+        self.sent = 0
+        self.failed = 0
+        self._in_flight = 0
+        self.queue = None
+        self._exhausted = False
+        self._deadline = None
+        self._next_global = 0.0
+        self._next_domain = {}
+        self._cond = threading.Condition()
+        self._halt = threading.Event()
+
+    def _time_left(self):
+        if self._deadline is None:
+            return None
+        return self._deadline - time.monotonic()
+
+    def _next_job(self):
+        while True:
+            with self._cond:
+                if self._exhausted or self.sent >= self.limit:
+                    return None
+                if self.sent + self._in_flight >= self.limit:
+                    # Limit is covered by in-flight sends; wait in case one fails
+                    self._cond.wait()
+                    continue
+                # Claiming far past the limit would starve other senders of outbox jobs
+                self.queue.lookahead = min(self.lookahead, self.limit - self.sent - self._in_flight)
+
+            # Reading ahead may stream a CSV or claim outbox jobs; the other
+            # workers keep settling their sends meanwhile
+            self.queue.fill()
+
+            with self._cond:
+                if self._exhausted or self.sent >= self.limit:
+                    return None
+                if self.sent + self._in_flight >= self.limit:
+                    continue
+                job = self.queue.pop(self._domain_ready, fill=False)
+                if job is not None:
+                    self._in_flight += 1
+                    return job
+                if not self.queue.drained:
+                    # Another worker took what was read; read on
+                    continue
+                if self.queue.waiting():
+                    # A failing send in flight may still free a held job
+                    self._cond.wait()
+                    continue
+                # Nothing left to pace for; cut short any pending sleeps
+                self._exhausted = True
+                self._halt.set()
+                return None
+
+    def _finish_job(self, to_email, success):
+        """
+        Settles an in-flight job. `success` is None when the job was
+        abandoned without a send attempt.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self.queue.finish(to_email, success)
+            if success:
+                self.sent += 1
+            elif success is not None:
+                self.failed += 1
+            if self.sent >= self.limit:
+                self._halt.set()
+            self._cond.notify_all()
+
+    def _domain_ready(self, domain):
+        return self._next_domain.get(domain, 0.0)
+
+    def _reserve_slot(self, domain):
+        """
+        Returns the monotonic time at which the caller may send, or None
+        if that would fall outside the run budget.
+        """
+        with self._cond:
+            start = max(time.monotonic(), self._next_global, self._next_domain.get(domain, 0.0))
+            if self._deadline is not None and start > self._deadline:
+                return None
+            interval = max(self.global_interval, self.rate.backoff if self.rate else 0)
+            if interval:
+                self._next_global = start + interval
+            if self.domain_interval:
+                self._next_domain[domain] = start + self.domain_interval
+            return start
+
+    def _record_result(self, result):
+        """
+        Feeds a send result to the rate controller. Returns False if the
+        run has to stop.
+        """
+        if self.rate is None:
+            return True
+        pause = self.rate.record(result)
+        if pause:
+            with self._cond:
+                self._next_global = max(self._next_global, time.monotonic() + pause)
+        return not self.rate.stopped
+
+    def _sleep(self, seconds):
+        """
+        Sleeps for `seconds`, returning False if the run budget ends first
+        or the run is halted meanwhile.
+        """
+        time_left = self._time_left()
+        if time_left is not None and seconds > time_left:
+            self._halt.wait(max(time_left, 0))
+            return False
+        return not self._halt.wait(seconds)
+
+    def _stop(self):
+        with self._cond:
+            self._exhausted = True
+            self._halt.set()
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            to_email, context = job
+
+            start = self._reserve_slot(domain_of(to_email))
+            if start is None:
+                logger.info("Run budget reached, stopping before the next send.")
+                self._finish_job(to_email, None)
+                self._stop()
+                return
+            wait = start - time.monotonic()
+            if wait > 0:
+                # Pacing and sleeps are timed apart from the sends themselves
+                metrics.observe("pacing_wait", wait)
+                time.sleep(wait)
+
+            try:
+                with metrics.timer("send_job"):
+                    result = self.send_fn(to_email, context)
+            except Exception as e:
+                logger.error(f"Unexpected error while sending to {to_email}: {e}")
+                result = False
+            if result is None:
+                # send_fn dropped the job without sending it
+                self._finish_job(to_email, None)
+                continue
+            success = bool(result)
+            self._finish_job(to_email, success)
+            if not self._record_result(result):
+                self._stop()
+            if self._halt.is_set():
+                return
+
+            if success:
+                delay = random.randint(self.min_delay, self.max_delay)
+                logger.info(f"Sleeping for {delay} seconds...")
+            else:
+                delay = self.failure_delay
+
+            with metrics.timer("send_delay"):
+                slept = self._sleep(delay)
+            if not slept:
+                if not self._halt.is_set():
+                    logger.info("Run budget reached, stopping.")
+                    self._stop()
+                return
+
+    def _log_queue(self):
+        depths = self.queue.depths()
+        if depths:
+            deepest = ", ".join(f"{domain} ({depth})" for domain, depth in list(depths.items())[:5])
+            logger.info(f"Still queued: {sum(depths.values())} job(s) across {len(depths)} domain(s); deepest: {deepest}")
+        deferred = +self.queue.deferred
+        if deferred:
+            logger.info(f"Deferred {sum(deferred.values())} job(s) from {len(deferred)} domain(s) at the per-run cap of {self.domain_cap}.")
+
+    def run(self, jobs):
+        """
+        Drains `jobs`, an iterable of (to_email, context) tuples, until the
+        limit is reached, the jobs run out or the run budget is spent.
+        Returns the number of successful sends.
+        """
+        self.queue = DomainQueue(jobs, max_per_domain=self.domain_cap, on_deferred=self.on_deferred)
+        self._exhausted = False
+        self._halt.clear()
+        self._deadline = time.monotonic() + self.budget if self.budget else None
+
+        threads = [
+            threading.Thread(target=self._worker, name=f"sender-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.sent >= self.limit:
+            logger.info("Daily limit reached.")
+        self._log_queue()
+        if self.rate is not None:
+            logger.info(f"SMTP outcomes: {self.rate.summary()}")
+        logger.info(f"Scheduler finished: {self.sent} sent, {self.failed} failed.")
+        return self.sent
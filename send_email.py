@@ -1,10 +1,17 @@
-import pandas as pd
-import time
-import os
-import random
+import hashlib
 import argparse
+import sys
+import accounts
+import csv_state
 import email_config
 import mailer
+import metrics
+import templates
+from message_index import MessageIndex
+from outbox import OUTBOX_DB, CampaignSender, Outbox
+from scheduler import SendScheduler
+from state_journal import StateJournal
+from suppression import load_suppression_index
 
 # Setup logging
 logger = mailer.logger
@@ -12,73 +19,136 @@ logger = mailer.logger
 def parse_args():
     parser = argparse.ArgumentParser(description="Send outreach emails.")
     parser.add_argument("--dry-run", action="store_true", help="Print emails instead of sending them.")
+    parser.add_argument("--workers", type=int, default=email_config.SEND_WORKERS, help="Number of concurrent send workers.")
+    parser.add_argument("--budget", type=int, default=email_config.RUN_BUDGET_SECONDS, help="Stop starting new sends after this many seconds.")
+    parser.add_argument("--worker", default="", help="Name of this sender when several drain the outbox at once.")
+    parser.add_argument("--account", help="Send only this account's share (default: every account, one process each).")
     return parser.parse_args()
 
-def generate_email_body(first_name):
-    opening = random.choice(email_config.INITIAL_OPENINGS)
-    signature = random.choice(email_config.INITIAL_SIGNATURES)
-
-    body = email_config.INITIAL_BODY_TEMPLATE.format(
-        first_name=first_name,
-        opening=opening,
-        signature=signature,
-        links=email_config.LINKS
-    )
-    return body
-
-def main():
-    args = parse_args()
+def address_key(address):
+    """
+    64-bit hash of a normalized address; the sent index stores these instead of strings.
+    """
+    return int.from_bytes(hashlib.blake2b(csv_state.normalize(address).encode("utf-8"), digest_size=8).digest(), "big")
+
+def load_sent_index(path="sent_log.csv"):
+    """
+    Streams the sent logs of every account into a compact set of address hashes.
+    """
+    with metrics.timer("csv_load"):
+        return {address_key(value) for log in csv_state.account_files(path) for value in csv_state.iter_column(log)}
+
+def iter_pending_contacts(path, sent_index):
+    """
+    Streams (email, first_name) pairs of contacts that haven't been emailed yet.
+    emails.csv is read row by row and only as far as the caller consumes,
+    so peak memory stays flat regardless of list size. Yielded addresses
+    are added to `sent_index`, so a contact listed twice comes up once.
+    """
+    for to_email, first_name in csv_state.iter_contacts(path):
+        key = address_key(to_email)
+        if key not in sent_index:
+            sent_index.add(key)
+            yield to_email, first_name
+
+def main(args=None):
+    args = args or parse_args()
     
     if not mailer.should_run(email_config.RUN_OUTREACH_AUTO):
         return
 
+    sender_accounts = accounts.load_accounts()
+    if args.account is None and len(sender_accounts) > 1:
+        logger.info(f"Sending from {len(sender_accounts)} accounts in parallel.")
+        if accounts.run_per_account(__file__, sender_accounts):
+            sys.exit(1)
+        return
+    account = accounts.find_account(sender_accounts, args.account)
+    if len(sender_accounts) > 1:
+        mailer.log_for_account(account.name)
+
     if args.dry_run:
         logger.info("Running in DRY-RUN mode. No emails will be sent.")
 
-    emails_df = pd.read_csv("emails.csv")
+    # Fold in anything a crashed run journaled before reading the sent log
+    journal_name = account.path("send_email")
+    journal = StateJournal(f"{journal_name}.{args.worker}" if args.worker else journal_name)
+    journal.replay()
+
+    sent_log = account.path("sent_log.csv")
+    csv_state.ensure_file(sent_log, ["email", "sent_on"])
+    with metrics.timer("suppression_load"):
+        suppressed = load_suppression_index()
+    outbox = None if args.dry_run else Outbox(account.path(OUTBOX_DB))
+    message_index = None if args.dry_run else MessageIndex()
+    sender = CampaignSender(
+        "initial", sent_log, journal, outbox, message_index,
+        from_addr=account.address,
+        attachment_path=email_config.ATTACHMENT_PATH,
+        dry_run=args.dry_run
+    )
 
-    if os.path.exists("sent_log.csv"):
-        sent_df = pd.read_csv("sent_log.csv")
-        sent_emails = set(sent_df["email"].tolist())
+    scheduler = SendScheduler(
+        send_fn=sender.send,
+        limit=account.limit,
+        min_delay=email_config.INITIAL_MIN_DELAY,
+        max_delay=email_config.INITIAL_MAX_DELAY,
+        workers=args.workers,
+        max_per_minute=email_config.MAX_SENDS_PER_MINUTE,
+        domain_interval=email_config.DOMAIN_MIN_INTERVAL,
+        domain_cap=email_config.DOMAIN_MAX_PER_RUN,
+        budget=args.budget,
+        rate=mailer.RateController(),
+        # Jobs over a domain's cap go back to the outbox for other senders
+        on_deferred=None if outbox is None else lambda to_email: outbox.unclaim("initial", to_email)
+    )
+    def iter_recipients():
+        # Only runs when the outbox needs topping up (or on a dry run)
+        sent_index = load_sent_index()
+        skipped = 0
+        for to_email, first_name in iter_pending_contacts("emails.csv", sent_index):
+            if accounts.shard_for(to_email, sender_accounts) != account:
+                continue
+            if suppressed.is_suppressed(to_email):
+                skipped += 1
+                continue
+            yield to_email, first_name
+        logger.info(f"Skipped {skipped} suppressed address(es).")
+
+    def iter_queued():
+        # Suppressions may have grown, and a changed limit or account list
+        # may have moved the address to another account, since it was enqueued
+        for to_email, first_name in outbox.drain("initial", batch_size=min(email_config.OUTBOX_CLAIM_BATCH, scheduler.limit)):
+            if accounts.shard_for(to_email, sender_accounts) != account:
+                outbox.drop("initial", to_email)
+                continue
+            if suppressed.is_suppressed(to_email):
+                outbox.skip("initial", to_email, "suppressed")
+                continue
+            yield to_email, first_name
+
+    table = templates.initial_table()
+
+    if outbox is None:
+        jobs = iter_recipients()
     else:
-        sent_emails = set()
-        pd.DataFrame(columns=["email"]).to_csv("sent_log.csv", index=False)
-
-    pending_df = emails_df[~emails_df["email"].isin(sent_emails)]
-
-    limit = email_config.INITIAL_LIMIT
-    count = 0
-
-    for _, row in pending_df.iterrows():
-        if count >= limit:
-            logger.info("Daily limit reached.")
-            break
-
-        to_email = row["email"]
-        first_name = row.get("first_name", "") or ""
-
-        subject = random.choice(email_config.INITIAL_SUBJECTS)
-        body = generate_email_body(first_name)
-
-        success = mailer.send_smtp_email(
-            to_email=to_email,
-            subject=subject,
-            body=body,
-            attachment_path=email_config.ATTACHMENT_PATH,
-            dry_run=args.dry_run
-        )
-
-        if success:
-            if not args.dry_run:
-                with open("sent_log.csv", "a") as log:
-                    log.write(f"{to_email}\n")
-            
-            count += 1
-            delay = random.randint(email_config.INITIAL_MIN_DELAY, email_config.INITIAL_MAX_DELAY)
-            logger.info(f"Sleeping for {delay} seconds...")
-            time.sleep(delay)
-        else:
-            time.sleep(5)
+        outbox.recover()
+        with metrics.timer("pending_set"):
+            outbox.fill("initial", iter_recipients(), scheduler.limit)
+        jobs = iter_queued()
+
+    mailer.get_smtp_pool(size=scheduler.workers, username=account.address, password=account.password)
+    try:
+        scheduler.run(table.iter_rendered(jobs))
+    finally:
+        mailer.close_smtp_pool()
+        if outbox is not None:
+            outbox.release()
+            outbox.close()
+            message_index.close()
+        journal.compact()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    with metrics.run(f"send_email.{args.account}" if args.account else "send_email"):
+        main(args)
@@ -1,10 +1,16 @@
-import pandas as pd
-import time
-import os
-import random
 import argparse
+import sys
+import accounts
+import csv_state
 import email_config
 import mailer
+import metrics
+import templates
+from message_index import MessageIndex
+from outbox import OUTBOX_DB, CampaignSender, Outbox
+from scheduler import SendScheduler
+from state_journal import StateJournal
+from suppression import load_suppression_index
 
 # Setup logging
 logger = mailer.logger
@@ -12,75 +18,131 @@ logger = mailer.logger
 def parse_args():
     parser = argparse.ArgumentParser(description="Send follow-up emails.")
     parser.add_argument("--dry-run", action="store_true", help="Print emails instead of sending them.")
+    parser.add_argument("--workers", type=int, default=email_config.SEND_WORKERS, help="Number of concurrent send workers.")
+    parser.add_argument("--budget", type=int, default=email_config.RUN_BUDGET_SECONDS, help="Stop starting new sends after this many seconds.")
+    parser.add_argument("--worker", default="", help="Name of this sender when several drain the outbox at once.")
+    parser.add_argument("--account", help="Follow up only on this account's sends (default: every account, one process each).")
     return parser.parse_args()
 
-def build_email(first_name):
-    subject = random.choice(email_config.FOLLOWUP_SUBJECTS)
-    opener = random.choice(email_config.FOLLOWUP_OPENERS)
-    body = random.choice(email_config.FOLLOWUP_BODY_VARIANTS)
-    signature = random.choice(email_config.FOLLOWUP_SIGNATURES)
-
-    final_body = email_config.FOLLOWUP_BODY_TEMPLATE.format(
-        first_name=first_name,
-        opener=opener,
-        body=body,
-        signature=signature
-    )
-    return subject, final_body
-
-def main():
-    args = parse_args()
+def select_followups(contacts, sent, replied, followed_up, bounced):
+    """
+    Builds the follow-up queue as a single anti-join on normalized addresses:
+    sent minus replied, followed-up and bounced, paired with first_name.
+    The result keeps the order of sent_log.csv, i.e. the original send order.
+    """
+    excluded = set(map(csv_state.normalize, replied))
+    excluded.update(map(csv_state.normalize, followed_up))
+    excluded.update(map(csv_state.normalize, bounced))
+
+    names = {}
+    for email, first_name in contacts:
+        names.setdefault(csv_state.normalize(email), first_name)
+
+    pending = []
+    for email in sent:
+        key = csv_state.normalize(email)
+        if key in excluded:
+            continue
+        # Marking it excluded also drops later duplicates in the sent log
+        excluded.add(key)
+        pending.append((email, names.get(key, "")))
+    return pending
+
+def main(args=None):
+    args = args or parse_args()
     
     if not mailer.should_run(email_config.RUN_FOLLOWUP_AUTO):
         return
 
+    sender_accounts = accounts.load_accounts()
+    if args.account is None and len(sender_accounts) > 1:
+        logger.info(f"Following up from {len(sender_accounts)} accounts in parallel.")
+        if accounts.run_per_account(__file__, sender_accounts):
+            sys.exit(1)
+        return
+    account = accounts.find_account(sender_accounts, args.account)
+    if len(sender_accounts) > 1:
+        mailer.log_for_account(account.name)
+
     if args.dry_run:
         logger.info("Running in DRY-RUN mode. No follow-ups will be sent.")
 
-    emails_df = pd.read_csv("emails.csv")
-    sent_df = pd.read_csv("sent_log.csv")
-    
-    replied_df = pd.read_csv("replied.csv") if os.path.exists("replied.csv") else pd.DataFrame(columns=["email"])
-    followup_df = pd.read_csv("followup_sent.csv") if os.path.exists("followup_sent.csv") else pd.DataFrame(columns=["email"])
-
-    sent_emails = set(sent_df["email"].tolist())
-    replied_emails = set(replied_df["email"].tolist())
-    followed_emails = set(followup_df["email"].tolist())
-
-    pending_followup = [email for email in sent_emails if email not in replied_emails and email not in followed_emails]
-
-    logger.info(f"Follow-up emails to send today: {len(pending_followup)}")
-
-    limit = email_config.FOLLOWUP_LIMIT
-    count = 0
-
-    for email in pending_followup:
-        if count >= limit:
-            logger.info("Follow-up limit reached.")
-            break
-
-        row = emails_df[emails_df["email"] == email]
-        first_name = row["first_name"].iloc[0] if "first_name" in row and len(row) > 0 else ""
-
-        subject, full_body = build_email(first_name)
+    # Fold in anything a crashed run journaled before reading the state files
+    journal_name = account.path("send_followup")
+    journal = StateJournal(f"{journal_name}.{args.worker}" if args.worker else journal_name)
+    journal.replay()
+
+    followup_log = account.path("followup_sent.csv")
+    with metrics.timer("suppression_load"):
+        suppressed = load_suppression_index()
+    outbox = None if args.dry_run else Outbox(account.path(OUTBOX_DB))
+    message_index = None if args.dry_run else MessageIndex()
+    sender = CampaignSender(
+        "followup", followup_log, journal, outbox, message_index,
+        from_addr=account.address,
+        dry_run=args.dry_run
+    )
 
-        success = mailer.send_smtp_email(
-            to_email=email,
-            subject=subject,
-            body=full_body,
-            dry_run=args.dry_run
+    def iter_pending():
+        # Only runs when the outbox needs topping up (or on a dry run).
+        # Follow-ups come from the account that sent the first email.
+        pending_followup = select_followups(
+            csv_state.iter_contacts("emails.csv"),
+            csv_state.iter_column(account.path("sent_log.csv")),
+            csv_state.iter_column("replied.csv"),
+            csv_state.iter_column(followup_log),
+            csv_state.iter_column("bounced_emails.csv")
         )
+        pending_followup = [job for job in pending_followup if not suppressed.is_suppressed(job[0])]
+        logger.info(f"Follow-up emails pending: {len(pending_followup)}")
+        yield from pending_followup
+
+    def iter_queued():
+        # Replies, bounces and suppressions may have arrived since a job was enqueued
+        replied = csv_state.read_emails("replied.csv") | csv_state.read_emails("bounced_emails.csv")
+        for email, first_name in outbox.drain("followup", batch_size=min(email_config.OUTBOX_CLAIM_BATCH, scheduler.limit)):
+            if csv_state.normalize(email) in replied or suppressed.is_suppressed(email):
+                outbox.skip("followup", email, "replied or suppressed")
+                continue
+            yield email, first_name
+
+    scheduler = SendScheduler(
+        send_fn=sender.send,
+        limit=account.followup_limit,
+        min_delay=email_config.FOLLOWUP_MIN_DELAY,
+        max_delay=email_config.FOLLOWUP_MAX_DELAY,
+        workers=args.workers,
+        max_per_minute=email_config.MAX_SENDS_PER_MINUTE,
+        domain_interval=email_config.DOMAIN_MIN_INTERVAL,
+        domain_cap=email_config.DOMAIN_MAX_PER_RUN,
+        budget=args.budget,
+        rate=mailer.RateController(),
+        # Jobs over a domain's cap go back to the outbox for other senders
+        on_deferred=None if outbox is None else lambda to_email: outbox.unclaim("followup", to_email)
+    )
 
-        if success:
-            if not args.dry_run:
-                pd.DataFrame([[email]], columns=["email"]).to_csv("followup_sent.csv", mode="a", header=False, index=False)
-            
-            count += 1
-            delay = random.randint(email_config.FOLLOWUP_MIN_DELAY, email_config.FOLLOWUP_MAX_DELAY)
-            logger.info(f"Sleeping for {delay} seconds...")
-            time.sleep(delay)
-        else:
-            time.sleep(5)
+    table = templates.followup_table()
+
+    if outbox is None:
+        jobs = iter_pending()
+    else:
+        outbox.recover()
+        with metrics.timer("pending_set"):
+            outbox.fill("followup", iter_pending(), scheduler.limit)
+        jobs = iter_queued()
+
+    mailer.get_smtp_pool(size=scheduler.workers, username=account.address, password=account.password)
+    try:
+        scheduler.run(table.iter_rendered(jobs))
+    finally:
+        mailer.close_smtp_pool()
+        if outbox is not None:
+            outbox.release()
+            outbox.close()
+            message_index.close()
+        journal.compact()
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    with metrics.run(f"send_followup.{args.account}" if args.account else "send_followup"):
+        main(args)
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import csv_state
+import mailer
+import metrics
+
+# ---------------- CONFIG ----------------
+# Buffered records are written and fsynced together once this many are pending
+JOURNAL_GROUP_SIZE = 20
+# ----------------------------------------
+
+logger = mailer.logger
+
+def journal_path(name):
+    return f".{name}.journal"
+
+class StateJournal:
+    """
+    Append-only journal in front of the tracking CSVs.
+
+    Rows are recorded as JSON lines and only copied into the CSVs by
+    compact(), in one append per file. A send is journaled in two steps:
+    begin() is fsynced before the message goes out and commit()/abort()
+    follow in the next group write. A send whose outcome never reached the
+    disk is treated as sent on replay, so a crash can't cause a double send.
+
+    Compaction skips rows whose address the target CSV already holds, so
+    replaying a journal twice (e.g. after a crash mid-compaction) is harmless.
+    """
+
+    def __init__(self, name):
+        self.path = journal_path(name)
+        self._buffer = []
+        self._file = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.replay()
+        return self
+
+    def __exit__(self, *exc):
+        self.compact()
+
+    # --- Writing ---
+
+    def _write(self, op, seq, sync, **fields):
+        self._buffer.append(json.dumps(dict(op=op, seq=seq, **fields), separators=(",", ":")) + "\n")
+        if sync or len(self._buffer) >= JOURNAL_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a")
+        with metrics.timer("journal_fsync"):
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def append(self, csv_path, row, header=None):
+        """
+        Records a row for csv_path. Written with the next group.
+        """
+        with self._lock:
+            self._write("add", self._next_seq(), False, file=csv_path, row=list(row), header=header)
+
+    def begin(self, csv_path, row, header=None):
+        """
+        Durably records a row before the action it describes (e.g. a send).
+        Returns a sequence number for commit() or abort().
+        """
+        with self._lock:
+            seq = self._next_seq()
+            self._write("begin", seq, True, file=csv_path, row=list(row), header=header)
+            return seq
+
+    def commit(self, seq):
+        with self._lock:
+            self._write("commit", seq, False)
+
+    def abort(self, seq):
+        with self._lock:
+            self._write("abort", seq, False)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    # --- Replay / Compaction ---
+
+    def _load(self):
+        """
+        Returns (records to apply in order, number of begins with no outcome).
+        A torn final line from a crash mid-write is ignored.
+        """
+        if not os.path.exists(self.path):
+            return [], 0
+        records = {}
+        confirmed = set()
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                op, seq = record["op"], record["seq"]
+                if op in ("add", "begin"):
+                    records[seq] = record
+                    if op == "add":
+                        confirmed.add(seq)
+                elif op == "commit":
+                    confirmed.add(seq)
+                elif op == "abort":
+                    records.pop(seq, None)
+        unconfirmed = sum(1 for seq in records if seq not in confirmed)
+        return [records[seq] for seq in sorted(records)], unconfirmed
+
+    def _apply(self, records):
+        by_file = {}
+        for record in records:
+            rows, _ = by_file.setdefault(record["file"], ([], record.get("header")))
+            rows.append(record["row"])
+
+        applied = 0
+        for path, (rows, header) in by_file.items():
+            existing = csv_state.read_emails(path)
+            new_rows = []
+            for row in rows:
+                key = csv_state.normalize(row[0])
+                if key not in existing:
+                    existing.add(key)
+                    new_rows.append(row)
+            if new_rows:
+                csv_state.append_rows(path, new_rows, header, fsync=True)
+                applied += len(new_rows)
+        return applied
+
+    def compact(self):
+        """
+        Copies everything journaled into the CSVs and removes the journal.
+        Returns (rows added to the CSVs, sends with no recorded outcome).
+        """
+        with self._lock, metrics.timer("journal_compact"):
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            records, unconfirmed = self._load()
+            applied = self._apply(records)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._seq = 0
+        return applied, unconfirmed
+
+    def replay(self):
+        """
+        Recovers a journal left behind by a crashed run before any state is read.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        applied, unconfirmed = self.compact()
+        logger.warning(f"Recovered {applied} row(s) from an unfinished run in {self.path}.")
+        if unconfirmed:
+            logger.warning(f"{unconfirmed} send(s) had no recorded outcome; they were logged as sent and won't be retried.")
+        return applied
@@ -1,23 +1,316 @@
-import pandas as pd
+import argparse
+import csv
+import hashlib
+import json
 import os
+import re
+import sqlite3
+from collections import Counter
+from datetime import date
+import csv_state
 
-def get_csv_count(filename):
-    if not os.path.exists(filename):
-        return 0
+# ---------------- CONFIG ----------------
+STATS_DB = ".stats.db"
+
+# (kind, file) in processing order: sends must be seen before the replies to them
+SOURCES = [
+    ("contact", "emails.csv"),
+    ("sent", "sent_log.csv"),
+    ("followup", "followup_sent.csv"),
+    ("replied", "replied.csv"),
+    ("bounced", "bounced_emails.csv"),
+]
+# replied.csv column with the exact seconds from a send to the reply, when known
+LATENCY_COLUMN = 3
+# Kinds every sending account logs to its own copy of, e.g. sent_log.work.csv
+ACCOUNT_KINDS = {"sent", "followup"}
+# Column holding the record's date, per kind
+DATE_COLUMN = {"sent": 1, "followup": 1, "replied": 1, "bounced": 2}
+
+# Bytes before the checkpoint that must be unchanged for a file to count as appended-to
+TAIL_CHECK_BYTES = 256
+# ----------------------------------------
+
+UNDATED = "undated"
+
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    path    TEXT PRIMARY KEY,
+    offset  INTEGER NOT NULL,   -- bytes consumed (always at a line boundary)
+    tail    TEXT NOT NULL       -- hash of the TAIL_CHECK_BYTES before offset
+);
+CREATE TABLE IF NOT EXISTS seen (
+    kind    TEXT NOT NULL,
+    address TEXT NOT NULL,
+    day     TEXT NOT NULL,
+    PRIMARY KEY (kind, address)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily (
+    day     TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    count   INTEGER NOT NULL,
+    PRIMARY KEY (day, kind)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS domains (
+    domain  TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    count   INTEGER NOT NULL,
+    PRIMARY KEY (domain, kind)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latency (
+    days    INTEGER PRIMARY KEY,
+    count   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bounce_types (
+    bounce_type TEXT PRIMARY KEY,
+    count       INTEGER NOT NULL
+);
+"""
+
+def source_files():
+    """
+    (kind, file) for every state file, including other accounts' logs.
+    """
+    return [
+        (kind, path)
+        for kind, source in SOURCES
+        for path in (csv_state.account_files(source) if kind in ACCOUNT_KINDS else [source])
+    ]
+
+def _tail_hash(f, offset):
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.blake2b(f.read(offset - start), digest_size=16).hexdigest()
+
+def _seconds(value):
     try:
-        df = pd.read_csv(filename)
-        return len(df)
-    except Exception:
-        return 0
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def _percentile(histogram, fraction):
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    threshold = fraction * total
+    running = 0
+    for value, count in histogram:
+        running += count
+        if running >= threshold:
+            return value
+
+class StatsEngine:
+    """
+    Campaign aggregates kept in a small SQLite checkpoint.
+
+    Each update() only parses the lines appended to the state files since
+    the previous one, so reporting costs O(new records) however large the
+    campaign gets. Addresses are counted once per kind. If a file was
+    rewritten rather than appended to (e.g. by a contact_store export),
+    the aggregates are rebuilt from scratch.
+    """
+
+    def __init__(self, path=STATS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Ingest ---
+
+    def _checkpoint(self, path):
+        row = self.conn.execute("SELECT offset, tail FROM checkpoints WHERE path = ?", (path,)).fetchone()
+        return row or (0, None)
+
+    def _rewritten(self, path):
+        offset, tail = self._checkpoint(path)
+        if not offset:
+            return False
+        if not os.path.exists(path) or os.path.getsize(path) < offset:
+            return True
+        with open(path, "rb") as f:
+            return _tail_hash(f, offset) != tail
+
+    def reset(self):
+        with self.conn:
+            for table in ("checkpoints", "seen", "daily", "domains", "latency", "bounce_types"):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def update(self):
+        """
+        Folds new lines from every state file into the aggregates.
+        Returns the number of new records.
+        """
+        sources = source_files()
+        if any(self._rewritten(path) for _, path in sources):
+            self.reset()
+
+        added = 0
+        with self.conn:
+            for kind, path in sources:
+                if os.path.exists(path):
+                    added += self._consume(kind, path)
+        return added
+
+    def _consume(self, kind, path):
+        offset, _ = self._checkpoint(path)
+        consumed = offset
+
+        def complete_lines(f):
+            nonlocal consumed
+            for line in f:
+                # A line still being written is picked up by the next update
+                if not line.endswith(b"\n"):
+                    return
+                consumed += len(line)
+                yield line.decode("utf-8", "replace")
+
+        daily, domains, latency, bounce_types = Counter(), Counter(), Counter(), Counter()
+        added = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for row in csv.reader(complete_lines(f)):
+                added += self._record(kind, row, daily, domains, latency, bounce_types)
+            tail = _tail_hash(f, consumed)
 
-def show_stats():
-    total_contacts = get_csv_count("emails.csv")
-    sent_emails = get_csv_count("sent_log.csv")
-    followups_sent = get_csv_count("followup_sent.csv")
-    replies = get_csv_count("replied.csv")
-    bounces = get_csv_count("bounced_emails.csv")
+        self._bump("daily", "day, kind", daily)
+        self._bump("domains", "domain, kind", domains)
+        self._bump("latency", "days", latency)
+        self._bump("bounce_types", "bounce_type", bounce_types)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (path, offset, tail) VALUES (?, ?, ?)",
+            (path, consumed, tail)
+        )
+        return added
 
-    pending = total_contacts - sent_emails
+    def _record(self, kind, row, daily, domains, latency, bounce_types):
+        if not row:
+            return 0
+        address = csv_state.normalize(row[0])
+        if not address or address == "email":
+            return 0
+
+        column = DATE_COLUMN.get(kind)
+        day = row[column].strip() if column is not None and len(row) > column else ""
+        day = day if _DAY_RE.match(day) else UNDATED
+
+        inserted = self.conn.execute(
+            "INSERT OR IGNORE INTO seen (kind, address, day) VALUES (?, ?, ?)", (kind, address, day)
+        ).rowcount
+        if not inserted:
+            return 0
+
+        domains[(address.rsplit("@", 1)[-1], kind)] += 1
+        if kind == "contact":
+            return 1
+        daily[(day, kind)] += 1
+
+        if kind == "replied":
+            exact = _seconds(row[LATENCY_COLUMN]) if len(row) > LATENCY_COLUMN else None
+            if exact is not None:
+                # Measured by the checkers from the Message-ID the reply answered
+                latency[int(exact // 86400)] += 1
+            elif day != UNDATED:
+                sent = self.conn.execute(
+                    "SELECT day FROM seen WHERE kind = 'sent' AND address = ?", (address,)
+                ).fetchone()
+                if sent and sent[0] != UNDATED:
+                    latency[(date.fromisoformat(day) - date.fromisoformat(sent[0])).days] += 1
+        elif kind == "bounced":
+            bounce_types[row[1].strip() if len(row) > 1 and row[1].strip() else "unknown"] += 1
+        return 1
+
+    def _bump(self, table, key_columns, counts):
+        if not counts:
+            return
+        keys = key_columns.split(", ")
+        placeholders = ", ".join("?" * (len(keys) + 1))
+        self.conn.executemany(f"""
+            INSERT INTO {table} ({key_columns}, count) VALUES ({placeholders})
+            ON CONFLICT({key_columns}) DO UPDATE SET count = count + excluded.count
+        """, [(*(key if isinstance(key, tuple) else (key,)), count) for key, count in counts.items()])
+
+    # --- Reporting ---
+
+    def totals(self):
+        counts = dict(self.conn.execute("SELECT kind, COUNT(*) FROM seen GROUP BY kind"))
+        return {kind: counts.get(kind, 0) for kind, _ in SOURCES}
+
+    def daily_series(self):
+        """
+        One row per day: {"day", "sent", "followup", "replied", "bounced"}.
+        Records without a date are reported under "undated".
+        """
+        series = {}
+        for day, kind, count in self.conn.execute("SELECT day, kind, count FROM daily ORDER BY day"):
+            series.setdefault(day, {"day": day, "sent": 0, "followup": 0, "replied": 0, "bounced": 0})[kind] = count
+        return list(series.values())
+
+    def domain_rates(self, limit=None):
+        rows = self.conn.execute("""
+            SELECT domain,
+                   SUM(CASE WHEN kind = 'sent' THEN count ELSE 0 END) AS sent,
+                   SUM(CASE WHEN kind = 'replied' THEN count ELSE 0 END) AS replied,
+                   SUM(CASE WHEN kind = 'bounced' THEN count ELSE 0 END) AS bounced
+            FROM domains GROUP BY domain HAVING sent > 0
+            ORDER BY sent DESC, domain LIMIT ?
+        """, (-1 if limit is None else limit,))
+        return [
+            {"domain": domain, "sent": sent, "replied": replied, "bounced": bounced,
+             "reply_rate": replied / sent, "bounce_rate": bounced / sent}
+            for domain, sent, replied, bounced in rows
+        ]
+
+    def reply_latency(self):
+        histogram = self.conn.execute("SELECT days, count FROM latency ORDER BY days").fetchall()
+        return {
+            "samples": sum(count for _, count in histogram),
+            "median_days": _percentile(histogram, 0.5),
+            "p90_days": _percentile(histogram, 0.9),
+            "histogram": {days: count for days, count in histogram},
+        }
+
+    def bounce_types(self):
+        return dict(self.conn.execute("SELECT bounce_type, count FROM bounce_types ORDER BY bounce_type"))
+
+    def summary(self, domain_limit=None):
+        return {
+            "totals": self.totals(),
+            "bounce_types": self.bounce_types(),
+            "reply_latency": self.reply_latency(),
+            "daily": self.daily_series(),
+            "domains": self.domain_rates(domain_limit),
+        }
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["day", "sent", "followup", "replied", "bounced"], lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(self.daily_series())
+
+def show_stats(engine, top_domains=5, recent_days=7):
+    totals = engine.totals()
+    total_contacts = totals["contact"]
+    sent_emails = totals["sent"]
+    followups_sent = totals["followup"]
+    replies = totals["replied"]
+    bounces = totals["bounced"]
+
+    pending = max(0, total_contacts - sent_emails)
 
     print("\n" + "="*30)
     print("      CAMPAIGN STATISTICS")
@@ -29,14 +322,53 @@ def show_stats():
     print("-" * 30)
     print(f"Replies Detected:  {replies}")
     print(f"Bounces Detected:  {bounces}")
-    
+    bounce_types = engine.bounce_types()
+    if bounce_types:
+        print("  " + ", ".join(f"{count} {bounce_type}" for bounce_type, count in bounce_types.items()))
+
     if sent_emails > 0:
         reply_rate = (replies / sent_emails) * 100
         bounce_rate = (bounces / sent_emails) * 100
         print("-" * 30)
         print(f"Reply Rate:        {reply_rate:.2f}%")
         print(f"Bounce Rate:       {bounce_rate:.2f}%")
+
+    latency = engine.reply_latency()
+    if latency["samples"]:
+        print(f"Reply Latency:     median {latency['median_days']}d, p90 {latency['p90_days']}d ({latency['samples']} replies)")
+
+    recent = [row for row in engine.daily_series() if row["day"] != UNDATED][-recent_days:]
+    if recent:
+        print("-" * 30)
+        print("Day          Sent  F/up  Repl  Bnc")
+        for row in recent:
+            print(f"{row['day']}  {row['sent']:>4}  {row['followup']:>4}  {row['replied']:>4}  {row['bounced']:>3}")
+
+    domains = engine.domain_rates(top_domains)
+    if domains:
+        print("-" * 30)
+        print("Top domains (sent / reply% / bounce%)")
+        for row in domains:
+            print(f"  {row['domain']:<22.22} {row['sent']:>5}  {row['reply_rate'] * 100:5.1f}%  {row['bounce_rate'] * 100:5.1f}%")
     print("="*30 + "\n")
 
+def main():
+    parser = argparse.ArgumentParser(description="Campaign statistics from the tracking CSVs.")
+    parser.add_argument("--json", metavar="PATH", help="Also export all aggregates as JSON.")
+    parser.add_argument("--csv", metavar="PATH", help="Also export the per-day time series as CSV.")
+    parser.add_argument("--domains", type=int, default=5, help="Number of top domains to show.")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the checkpoint and recount everything.")
+    args = parser.parse_args()
+
+    with StatsEngine() as engine:
+        if args.rebuild:
+            engine.reset()
+        engine.update()
+        show_stats(engine, top_domains=args.domains)
+        if args.json:
+            engine.export_json(args.json)
+        if args.csv:
+            engine.export_csv(args.csv)
+
 if __name__ == "__main__":
-    show_stats()
+    main()
@@ -0,0 +1,107 @@
+import json
+import os
+from collections import defaultdict
+import email_config
+import mailer
+from csv_state import normalize, read_rows
+
+# ---------------- CONFIG ----------------
+BOUNCED_CSV = "bounced_emails.csv"
+REPLIED_CSV = "replied.csv"
+UNSUBSCRIBED_CSV = "unsubscribed.csv"
+INVALID_CSV = "invalid_emails.csv"
+
+SUPPRESSION_CACHE = ".suppression_cache.json"
+# ----------------------------------------
+
+# Bumped whenever the rules change, so a cached index is rebuilt
+CACHE_VERSION = 2
+
+logger = mailer.logger
+
+def domain_of(address):
+    return normalize(address).rsplit("@", 1)[-1]
+
+class SuppressionIndex:
+    """
+    Addresses (and whole domains) that must never be emailed again.
+    Both lookups are set membership tests on normalized values.
+    """
+
+    def __init__(self, addresses=(), domains=()):
+        self.addresses = set(addresses)
+        self.domains = set(domains)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def is_suppressed(self, address):
+        address = normalize(address)
+        return address in self.addresses or address.rsplit("@", 1)[-1] in self.domains
+
+def _source_key(paths):
+    key = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            key[path] = [stat.st_mtime_ns, stat.st_size]
+    return key
+
+def build_suppression_index(bounced_csv=BOUNCED_CSV, replied_csv=REPLIED_CSV, unsubscribed_csv=UNSUBSCRIBED_CSV,
+                            invalid_csv=INVALID_CSV):
+    """
+    Only hard bounces suppress an address: soft ones may deliver later, and
+    "policy" ones rejected the message, not the address. A domain is
+    suppressed once hard bounces came from enough distinct addresses on it.
+    """
+    addresses = set()
+    hard_bounced_per_domain = defaultdict(set)
+
+    for row in read_rows(bounced_csv):
+        if len(row) > 1 and row[1] == "hard":
+            address = normalize(row[0])
+            addresses.add(address)
+            hard_bounced_per_domain[domain_of(address)].add(address)
+
+    for path in (replied_csv, unsubscribed_csv, invalid_csv):
+        addresses.update(normalize(row[0]) for row in read_rows(path))
+
+    domains = {
+        domain for domain, bounced in hard_bounced_per_domain.items()
+        if len(bounced) >= email_config.SUPPRESS_DOMAIN_AFTER_HARD_BOUNCES
+        and domain not in email_config.SUPPRESSION_EXEMPT_DOMAINS
+    }
+    return SuppressionIndex(addresses, domains)
+
+def load_suppression_index(cache_path=SUPPRESSION_CACHE):
+    """
+    Returns the suppression index, rebuilding it from the bounce, reply,
+    unsubscribe and invalid-address files only when one of them changed
+    since the cached copy.
+    """
+    sources = [BOUNCED_CSV, REPLIED_CSV, UNSUBSCRIBED_CSV, INVALID_CSV]
+    key = _source_key(sources)
+    key["version"] = CACHE_VERSION
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get("sources") == key:
+                return SuppressionIndex(cached["addresses"], cached["domains"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = build_suppression_index()
+    try:
+        with open(cache_path, "w") as f:
+            json.dump({
+                "sources": key,
+                "addresses": sorted(index.addresses),
+                "domains": sorted(index.domains),
+            }, f)
+    except OSError as e:
+        logger.warning(f"Could not write suppression cache: {e}")
+
+    logger.info(f"Suppression index: {len(index.addresses)} addresses, {len(index.domains)} domains.")
+    return index
@@ -0,0 +1,101 @@
+import json
+import os
+import mailer
+import metrics
+
+# ---------------- CONFIG ----------------
+SYNC_STATE_FILE = "imap_sync_state.json"
+# ----------------------------------------
+
+logger = mailer.logger
+
+def _response_int(mail, name):
+    _, data = mail.response(name)
+    try:
+        return int(data[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+class SyncState:
+    """
+    Per-account, per-folder IMAP high-water marks (UIDVALIDITY + last seen UID),
+    so the checkers only fetch mail that arrived since their previous run.
+
+    A folder is rescanned over the full search window when it has no entry yet
+    or when the server reports a different UIDVALIDITY. Marks are only advanced
+    by commit() once the caller has finished processing the folder, and never
+    past a UID whose fetch failed (see hold_back()).
+    """
+
+    def __init__(self, path=SYNC_STATE_FILE):
+        self.path = path
+        self.data = {}
+        self._pending = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable sync state {path}: {e}")
+
+    def search_new(self, mail, account, folder, criteria):
+        """
+        Selects `folder` and returns the UIDs matching `criteria` that are
+        newer than the stored mark, or None if the folder can't be searched.
+        """
+        status, _ = mail.select(f'"{folder}"')
+        if status != "OK":
+            return None
+        uidvalidity = _response_int(mail, "UIDVALIDITY")
+        uidnext = _response_int(mail, "UIDNEXT")
+
+        account = account or "default"
+        entry = self.data.get(account, {}).get(folder)
+        last_uid = 0
+        if entry and uidvalidity is not None and entry.get("uidvalidity") == uidvalidity:
+            last_uid = entry.get("last_uid", 0)
+            criteria = f"UID {last_uid + 1}:* {criteria}"
+        elif entry:
+            logger.info(f"UIDVALIDITY changed for {folder}, rescanning the full window.")
+
+        with metrics.timer("imap_search"):
+            status, data = mail.uid("SEARCH", None, f"({criteria})")
+        if status != "OK":
+            return None
+
+        # "n:*" always matches the highest UID, even when it's below n
+        uids = [int(u) for u in data[0].split() if int(u) > last_uid]
+        high_water = max(uids + [last_uid, (uidnext or 1) - 1])
+        if uidvalidity is not None:
+            self._pending[(account, folder)] = (uidvalidity, high_water)
+        logger.info(f"{folder}: {len(uids)} new candidate(s) since UID {last_uid}")
+        return uids
+
+    def hold_back(self, account, folder, failed_uids):
+        """
+        Keeps the pending mark below the first UID that couldn't be fetched,
+        so the next run fetches it (and everything after it) again.
+        """
+        account = account or "default"
+        pending = self._pending.get((account, folder))
+        if pending is None or not failed_uids:
+            return
+        uidvalidity, last_uid = pending
+        first_failed = min(failed_uids)
+        if first_failed <= last_uid:
+            self._pending[(account, folder)] = (uidvalidity, first_failed - 1)
+            logger.warning(f"{folder}: {len(failed_uids)} message(s) not fetched, keeping the mark at UID {first_failed - 1}")
+
+    def commit(self, account, folder):
+        account = account or "default"
+        pending = self._pending.pop((account, folder), None)
+        if pending is None:
+            return
+        uidvalidity, last_uid = pending
+        self.data.setdefault(account, {})[folder] = {"uidvalidity": uidvalidity, "last_uid": last_uid}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,105 @@
+import itertools
+import zlib
+from collections import namedtuple
+import email_config
+import metrics
+
+# ---------------- CONFIG ----------------
+# Messages rendered per render_batch() call when feeding the scheduler
+RENDER_BATCH_SIZE = 100
+
+# Stands in for first_name in the pre-rendered bodies; can't occur in config text
+_NAME_SLOT = "\x00first_name\x00"
+# ----------------------------------------
+
+RenderedEmail = namedtuple("RenderedEmail", ["to_email", "subject", "body"])
+
+class VariantTable:
+    """
+    Every subject × slot-value combination of a template, formatted once.
+
+    Each variant keeps its body split around first_name, so rendering a
+    message is a single join. The variant for a recipient is picked by a
+    seeded CRC32 of their address: reruns and dry-runs produce the same
+    message for the same person.
+    """
+
+    def __init__(self, name, template, subjects, slots, fixed=None, seed=None):
+        self.name = name
+        self.seed = email_config.TEMPLATE_SEED if seed is None else seed
+        self.variants = []
+        # CRC32 continued from the seed prefix == CRC32 of "seed:name:address"
+        self._salt = zlib.crc32(f"{self.seed}:{name}:".encode("utf-8"))
+
+        keys = list(slots)
+        for subject in subjects:
+            for values in itertools.product(*(slots[key] for key in keys)):
+                fields = dict(fixed or {}, **dict(zip(keys, values)))
+                body = template.format(first_name=_NAME_SLOT, **fields)
+                self.variants.append((subject, body.split(_NAME_SLOT)))
+
+    def __len__(self):
+        return len(self.variants)
+
+    def select(self, to_email):
+        key = str(to_email).strip().lower().encode("utf-8")
+        return zlib.crc32(key, self._salt) % len(self.variants)
+
+    def render(self, to_email, first_name):
+        subject, pieces = self.variants[self.select(to_email)]
+        return RenderedEmail(to_email, subject, str(first_name).join(pieces))
+
+    def render_batch(self, recipients):
+        """
+        Renders (to_email, first_name) pairs into a list of RenderedEmail.
+        """
+        variants = self.variants
+        select = self.select
+        batch = []
+        for to_email, first_name in recipients:
+            subject, pieces = variants[select(to_email)]
+            batch.append(RenderedEmail(to_email, subject, str(first_name).join(pieces)))
+        return batch
+
+    def iter_rendered(self, recipients, batch_size=RENDER_BATCH_SIZE):
+        """
+        Lazily renders an iterable of recipients, batch_size at a time,
+        yielding (to_email, RenderedEmail) jobs for the scheduler.
+        """
+        recipients = iter(recipients)
+        while True:
+            # Pulling the recipients (CSV reads, outbox claims) is timed by its own phase
+            pulled = list(itertools.islice(recipients, batch_size))
+            with metrics.timer("render"):
+                batch = self.render_batch(pulled)
+            if not batch:
+                return
+            for message in batch:
+                yield message.to_email, message
+
+_tables = {}
+
+def initial_table():
+    if "initial" not in _tables:
+        _tables["initial"] = VariantTable(
+            "initial",
+            email_config.INITIAL_BODY_TEMPLATE,
+            email_config.INITIAL_SUBJECTS,
+            {"opening": email_config.INITIAL_OPENINGS, "signature": email_config.INITIAL_SIGNATURES},
+            fixed={"links": email_config.LINKS}
+        )
+    return _tables["initial"]
+
+def followup_table():
+    if "followup" not in _tables:
+        _tables["followup"] = VariantTable(
+            "followup",
+            email_config.FOLLOWUP_BODY_TEMPLATE,
+            email_config.FOLLOWUP_SUBJECTS,
+            {
+                "opener": email_config.FOLLOWUP_OPENERS,
+                "body": email_config.FOLLOWUP_BODY_VARIANTS,
+                "signature": email_config.FOLLOWUP_SIGNATURES,
+            }
+        )
+    return _tables["followup"]
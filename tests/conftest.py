@@ -0,0 +1,20 @@
+import logging
+import pytest
+import mailer
+
+@pytest.fixture(autouse=True, scope="session")
+def log_to_tmp(tmp_path_factory):
+    """
+    Writes the test run's log lines under a temp dir, not to outreach.log in the repo.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.FileHandler):
+            root.removeHandler(handler)
+            handler.close()
+    handler = logging.FileHandler(tmp_path_factory.mktemp("logs") / mailer.LOG_FILE)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    root.addHandler(handler)
+    yield
+    root.removeHandler(handler)
+    handler.close()
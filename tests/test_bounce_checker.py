@@ -0,0 +1,71 @@
+import mailbox
+import os
+from types import SimpleNamespace
+import pytest
+import bounce_checker
+import dsn_parser
+import fake_servers
+import imap_utils
+from sync_state import SyncState
+
+MAILBOX_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bounce_mailbox.mbox")
+ACCOUNT = SimpleNamespace(name="default", address="me@example.com")
+SINCE = "01-Jan-2020"
+
+# Everyone the fixture's messages are about, except someone.else@other-example.com
+SENT = {
+    "hr@contoso-example.com", "careers@fabrikam-example.com", "team@slowmx-example.org",
+    "ravi.k@unknown-corp.in", "anil@typo-domain.co", "neha@fullbox.co", "jobs@old-startup.io",
+    "priya@busy-example.in", "talent@corp-example.net", "saiyo@global-example.jp",
+    "priya.s@realco-example.com", "arjun@shipfast-example.in", "talent@realco-example.com",
+}
+
+@pytest.fixture
+def server():
+    box = fake_servers.Mailbox()
+    for message in mailbox.mbox(MAILBOX_FIXTURE):
+        box.add(message.as_bytes())
+    server = fake_servers.FakeIMAPServer({"INBOX": box}).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def mail(server):
+    mail = imap_utils.connect("127.0.0.1", ACCOUNT.address, "x", port=server.port, use_ssl=False)
+    yield mail
+    mail.logout()
+
+def legacy_bounces(mail):
+    """
+    The pre-filtering scan: download every message in the window and parse
+    the whole thing.
+    """
+    mail.select("INBOX")
+    _, data = mail.uid("SEARCH", None, f'(SINCE "{SINCE}")')
+    bounces = set()
+    for uid in data[0].split():
+        msg = imap_utils.fetch_message(mail, int(uid))
+        info = dsn_parser.parse_bounce(msg) if bounce_checker.is_bounce(msg) else None
+        if info and info.recipient in SENT:
+            bounces.add((info.recipient, info.bounce_type))
+    return bounces
+
+def test_filtered_scan_finds_the_same_bounces_as_a_full_download(tmp_path, server, mail):
+    before = server.counters["bytes_out"]
+    expected = legacy_bounces(mail)
+    legacy_bytes = server.counters["bytes_out"] - before
+
+    before = server.counters["bytes_out"]
+    sync = SyncState(str(tmp_path / "sync.json"))
+    infos = bounce_checker.process_folder(mail, ACCOUNT, "INBOX", SINCE, SENT, sync)
+    filtered_bytes = server.counters["bytes_out"] - before
+
+    assert {(info.recipient, info.bounce_type) for info in infos} == expected
+    assert expected == {
+        ("hr@contoso-example.com", "hard"), ("careers@fabrikam-example.com", "hard"),
+        ("team@slowmx-example.org", "soft"), ("ravi.k@unknown-corp.in", "hard"),
+        ("anil@typo-domain.co", "hard"), ("neha@fullbox.co", "soft"),
+        ("jobs@old-startup.io", "hard"), ("priya@busy-example.in", "soft"),
+        ("talent@corp-example.net", "hard"), ("saiyo@global-example.jp", "hard"),
+    }
+    assert filtered_bytes < legacy_bytes
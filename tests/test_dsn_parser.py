@@ -0,0 +1,33 @@
+import csv
+import email
+import os
+import pytest
+import dsn_parser
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bounce_samples")
+
+with open(os.path.join(SAMPLES_DIR, "expected.csv"), newline="") as f:
+    EXPECTED = list(csv.DictReader(f))
+
+@pytest.mark.parametrize("row", EXPECTED, ids=[row["file"] for row in EXPECTED])
+def test_bounce_samples(row):
+    with open(os.path.join(SAMPLES_DIR, row["file"]), "rb") as f:
+        info = dsn_parser.parse_bounce(email.message_from_bytes(f.read()))
+    if row["bounce_type"] == "none":
+        assert info is None
+    else:
+        assert (info.recipient, info.bounce_type) == (row["recipient"], row["bounce_type"])
+
+@pytest.mark.parametrize("status, diagnostic, bounce_type", [
+    ("5.1.1", "550 5.1.1 No such user", "hard"),
+    ("5.2.1", "550 5.2.1 Mailbox disabled", "hard"),
+    ("4.2.2", "452 4.2.2 Mailbox full", "soft"),
+    ("5.3.4", "552 5.3.4 Message size exceeds fixed limit", "policy"),
+    ("5.6.0", "550 5.6.0 Content conversion failed", "policy"),
+    ("5.7.26", "550 5.7.26 Unauthenticated email is not accepted", "policy"),
+    ("5.7.1", "550 5.7.1 Message rejected as spam", "policy"),
+    ("5.7.1", "550 5.7.1 RESOLVER.RST.AuthRequired; authentication required", "hard"),
+    ("5.7.13", "525 5.7.13 User account disabled", "hard"),
+])
+def test_only_message_and_sender_rejects_are_policy_bounces(status, diagnostic, bounce_type):
+    assert dsn_parser._type_from_status(status, diagnostic) == bounce_type
@@ -0,0 +1,153 @@
+import os
+import zlib
+import pytest
+import extract_contacts
+from extract_contacts import PageText, contacts_from_page
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+def builtin_page(runs, links=()):
+    # page_text() only needs the page's text runs and links
+    document = object.__new__(extract_contacts.BuiltinDocument)
+    document.pages = [None]
+    document._runs = lambda page: [list(run) for run in runs]
+    document._links = lambda page: list(links)
+    return document.page_text(0)
+
+def addresses(page):
+    return [address for address, _, _ in contacts_from_page(page)]
+
+def test_known_page_matches_reviewed_addresses():
+    with open(os.path.join(HERE, "data", "email_list_3_page_4.txt")) as f:
+        expected = f.read().split()
+    document = extract_contacts.open_document(os.path.join(ROOT, "email collections", "Email List 3.pdf"))
+    assert addresses(document.page_text(3)) == expected
+
+def test_company_mention_is_not_part_of_an_address():
+    page = PageText(["@Fx31labs aruna@guvi.in", "@Nicklefox@rishabhsoft.com", "Daaslabs @crafto.app Intern"], [])
+    assert addresses(page) == ["aruna@guvi.in"]
+
+def test_address_wrapped_after_the_at_is_joined():
+    page = builtin_page([
+        (100, 3, "@Ncircletech"), (100, 230, "reeshank.kohad@"),
+        (112, 232, "ncircletech.com"),
+    ])
+    assert addresses(page) == ["reeshank.kohad@ncircletech.com"]
+
+def test_address_wrapped_before_the_at_is_joined_in_the_address_column():
+    page = builtin_page([
+        (80, 230, "kiran@gable.io"),
+        (100, 3, "@Crafto"), (100, 230, "yachna.singh"),
+        (112, 3, "@crafto.app"), (112, 232, "@daaslabs.ai"),
+    ])
+    assert addresses(page) == ["kiran@gable.io", "yachna.singh@daaslabs.ai"]
+
+# --- Built-in reader on small generated PDFs ---
+
+def stream(data, attrs=b""):
+    return b"<< /Length %d %s >>\nstream\n%s\nendstream" % (len(data), attrs, data)
+
+def pdf_objects(content, font=b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>", extra=None):
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        3: b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        4: content,
+        5: font,
+    }
+    objects.update(extra or {})
+    return objects
+
+def write_pdf(path, objects, trailer=b"/Root 1 0 R"):
+    data = b"%PDF-1.4\n"
+    offsets = {}
+    for num, body in sorted(objects.items()):
+        offsets[num] = len(data)
+        data += b"%d 0 obj\n%s\nendobj\n" % (num, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offsets[num] for num in sorted(objects))
+    data += b"trailer\n<< /Size %d %s >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, trailer, xref)
+    path.write_bytes(data)
+    return str(path)
+
+TEXT = b"BT /F1 10 Tf 1 0 0 -1 50 100 Tm (hr@example.com) Tj 1 0 0 -1 50 120 Tm (jobs@example.in) Tj ET"
+# Codes 0x01.. map to the printable ASCII range, so the raw bytes mean nothing without the map
+CMAP = b"begincmap 1 beginbfrange <01> <5f> <0020> endbfrange endcmap"
+
+def shifted(text):
+    return bytes(byte - 0x1F for byte in text).hex().encode()
+
+def test_builtin_reader_reads_flate_streams_and_tounicode_maps(tmp_path):
+    content = b"BT /F1 10 Tf 1 0 0 -1 50 100 Tm <%s> Tj ET" % shifted(b"talent@example.com")
+    path = write_pdf(tmp_path / "compressed.pdf", pdf_objects(
+        stream(zlib.compress(content), b"/Filter /FlateDecode"),
+        font=b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /ToUnicode 6 0 R >>",
+        extra={6: stream(zlib.compress(CMAP), b"/Filter [/FlateDecode]")},
+    ))
+    document = extract_contacts.BuiltinDocument(path)
+    assert len(document) == 1
+    assert addresses(document.page_text(0)) == ["talent@example.com"]
+
+def test_builtin_reader_reads_plain_streams(tmp_path):
+    document = extract_contacts.BuiltinDocument(write_pdf(tmp_path / "plain.pdf", pdf_objects(stream(TEXT))))
+    assert addresses(document.page_text(0)) == ["hr@example.com", "jobs@example.in"]
+
+def malformed_pdfs(tmp_path):
+    good = write_pdf(tmp_path / "good.pdf", pdf_objects(stream(TEXT)))
+    with open(good, "rb") as f:
+        data = f.read()
+    startxref = data.rindex(b"startxref")
+    yield "truncated", data[:len(data) // 2]
+    yield "garbage", b"%PDF-1.4\n" + bytes(range(256)) * 4
+    yield "bad startxref", data[:startxref] + b"startxref\n12\n%%EOF\n"
+    yield "startxref past the end", data[:startxref] + b"startxref\n999999\n%%EOF\n"
+    yield "xref stream", data.replace(b"xref\n0 6", b"6 0 obj\n0 6")
+
+def test_builtin_reader_rejects_malformed_files(tmp_path):
+    for name, data in malformed_pdfs(tmp_path):
+        path = tmp_path / "broken.pdf"
+        path.write_bytes(data)
+        with pytest.raises(extract_contacts.UnsupportedPDF):
+            extract_contacts.BuiltinDocument(str(path))
+
+@pytest.mark.parametrize("objects, trailer", [
+    # A page tree whose kid points back at itself
+    (pdf_objects(stream(TEXT), extra={2: b"<< /Type /Pages /Kids [2 0 R] /Count 1 >>"}), b"/Root 1 0 R"),
+    (pdf_objects(stream(TEXT), extra={6: b"<< /Filter /Standard >>"}), b"/Root 1 0 R /Encrypt 6 0 R"),
+    # An object the cross-reference table doesn't list
+    (pdf_objects(stream(TEXT), extra={1: b"<< /Type /Catalog /Pages 9 0 R >>"}), b"/Root 1 0 R"),
+])
+def test_builtin_reader_rejects_unsupported_documents(tmp_path, objects, trailer):
+    with pytest.raises(extract_contacts.UnsupportedPDF):
+        extract_contacts.BuiltinDocument(write_pdf(tmp_path / "doc.pdf", objects, trailer))
+
+@pytest.mark.parametrize("content", [
+    stream(b"not zlib data at all", b"/Filter /FlateDecode"),
+    stream(TEXT, b"/Filter /LZWDecode"),
+    stream(zlib.compress(TEXT)[:-8] + b"\xff" * 8, b"/Filter /FlateDecode"),
+])
+def test_bad_content_streams_fail_the_page(tmp_path, content):
+    document = extract_contacts.BuiltinDocument(write_pdf(tmp_path / "doc.pdf", pdf_objects(content)))
+    with pytest.raises(extract_contacts.UnsupportedPDF):
+        addresses(document.page_text(0))
+
+def test_extract_skips_broken_files_and_counts_its_own_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_contacts, "_pypdf", lambda: None)
+    folder = tmp_path / "lists"
+    folder.mkdir()
+    write_pdf(folder / "good.pdf", pdf_objects(stream(TEXT)))
+    (folder / "broken.pdf").write_bytes(b"%PDF-1.4\nnot really\n")
+    contacts = tmp_path / "emails.csv"
+    contacts.write_text("email,first_name\nhr@example.com,Team\n")
+
+    report = extract_contacts.extract(str(folder), str(contacts), str(tmp_path / "cache.json"), workers=1)
+    assert report == extract_contacts.ExtractReport(files=2, pages=1, extracted=1, contacts=2, invalid=0, added=1)
+    assert contacts.read_text().splitlines()[-1] == "jobs@example.in,Team"
+
+    # A second call in the same process reports only its own work
+    again = extract_contacts.extract(str(folder), str(contacts), str(tmp_path / "cache.json"), workers=1)
+    assert (again.extracted, again.added) == (0, 0)
+    fresh = extract_contacts.extract(str(folder), str(contacts), str(tmp_path / "other.json"), workers=1, write=False)
+    assert (fresh.extracted, fresh.added) == (1, 0)
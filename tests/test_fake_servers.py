@@ -0,0 +1,40 @@
+import pytest
+import bounce_checker
+import fake_servers
+import imap_utils
+
+@pytest.fixture
+def imap_server():
+    server = fake_servers.FakeIMAPServer(fake_servers.synthetic_mailboxes(["gone@example.org"], bounces=1)).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def mail(imap_server):
+    mail = imap_utils.connect("127.0.0.1", "me@example.com", "x", port=imap_server.port, use_ssl=False)
+    mail.select("INBOX", readonly=True)
+    yield mail
+    mail.logout()
+
+def test_bounce_pass_fetches_only_the_delivery_status_part(mail):
+    dsn_sections, full_fetch = {}, []
+    items = f"(UID BODYSTRUCTURE {imap_utils.header_items(bounce_checker.BOUNCE_HEADER_FIELDS)})"
+    for result in imap_utils.fetch(mail, [1], items):
+        bounce_checker.plan_bounce_fetch(result, dsn_sections, full_fetch)
+    assert dsn_sections == {"2": [1]}
+    assert full_fetch == []
+
+    infos = list(bounce_checker.fetch_bounce_infos(mail, dsn_sections, full_fetch))
+    assert [(info.recipient, info.bounce_type) for info in infos] == [("gone@example.org", "hard")]
+
+def test_body_sections_follow_rfc_3501():
+    raw = fake_servers.synthetic_bounce("gone@example.org")
+    msg = fake_servers.StoredMessage(1, raw, None).msg
+    structure = imap_utils.parse_bodystructure(b"BODYSTRUCTURE " + fake_servers._bodystructure(msg).encode())
+    assert [part[:2] for part in structure[:3]] == [
+        ["text", "plain"], ["message", "delivery-status"], ["message", "rfc822"]
+    ]
+    # Sections carry no MIME headers; an attached message is returned whole
+    assert fake_servers._part_bytes(msg, "2", raw).startswith(b"Reporting-MTA: dns; googlemail.com\r\n")
+    assert fake_servers._part_bytes(msg, "3", raw).startswith(b"From: me@example.com\r\n")
+    assert fake_servers._part_bytes(msg, "3.1", raw) == b"Hi there\r\n"
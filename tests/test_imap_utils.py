@@ -0,0 +1,42 @@
+import math
+import pytest
+import fake_servers
+import imap_utils
+from reply_checker import REPLY_HEADER_FIELDS
+
+REPLIES = 120
+
+@pytest.fixture
+def imap_server():
+    sent = [f"recruiter{i}@example.com" for i in range(REPLIES)]
+    mailboxes = fake_servers.synthetic_mailboxes(sent, replies=REPLIES)
+    # Replies that quote a long thread: none of it should cross the wire
+    for message in mailboxes["INBOX"].messages[::10]:
+        message.raw += b"> earlier message\r\n" * 5000
+    server = fake_servers.FakeIMAPServer(mailboxes).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def mail(imap_server):
+    mail = imap_utils.connect("127.0.0.1", "me@example.com", "x", port=imap_server.port, use_ssl=False)
+    mail.select("INBOX", readonly=True)
+    yield mail
+    mail.logout()
+
+@pytest.mark.parametrize("batch_size", [1, 50, 500])
+def test_headers_are_fetched_in_one_round_trip_per_batch(imap_server, mail, batch_size):
+    commands = imap_server.counters["commands"]
+    stats = imap_utils.FetchStats()
+    headers = dict(imap_utils.fetch_headers(mail, range(1, REPLIES + 1), REPLY_HEADER_FIELDS, batch_size, stats))
+    assert len(headers) == stats.messages == REPLIES
+    assert stats.round_trips == imap_server.counters["commands"] - commands == math.ceil(REPLIES / batch_size)
+    assert headers[1].get("From") == "Recruiter <recruiter0@example.com>"
+
+def test_only_the_requested_header_fields_are_transferred(imap_server, mail):
+    stats = imap_utils.FetchStats()
+    for _, headers in imap_utils.fetch_headers(mail, range(1, REPLIES + 1), REPLY_HEADER_FIELDS, stats=stats):
+        assert headers.get("To") is None
+    mailbox_bytes = sum(len(message.raw) for message in imap_server.mailboxes["INBOX"].messages)
+    assert stats.bytes < mailbox_bytes / 20
+    assert imap_server.counters["bytes_out"] < mailbox_bytes / 10
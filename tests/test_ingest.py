@@ -0,0 +1,63 @@
+import csv
+import pytest
+import ingest
+from ingest import MXCache, StaticResolver, clean_address
+
+@pytest.mark.parametrize("raw, address, reason", [
+    ("  Ravi.K@Example.COM ", "ravi.k@example.com", None),
+    ("<mailto:hr@example.in>", "hr@example.in", None),
+    ("jobs@example.com.", "jobs@example.com", None),
+    ("talent@bücher.de", "talent@xn--bcher-kva.de", None),
+    ("team@example.community", "team@example.community", None),
+    ("hr@example.network", "hr@example.network", None),
+    ("anirban.chakravorty@nttdata.comSenior", "anirban.chakravorty@nttdata.comsenior", "text after domain"),
+    ("gautam.pathak@opshub.comVice", "gautam.pathak@opshub.comvice", "text after domain"),
+    # The same addresses after an earlier ingest lowercased them
+    ("amit.sahoo@areteanstech.comvice", "amit.sahoo@areteanstech.comvice", "text after domain"),
+    ("hr@example.orgHead", "hr@example.orghead", "text after domain"),
+    ("hr@example.inHead", "hr@example.inhead", "text after domain"),
+    ("hr@@example.com", "hr@@example.com", "not an address"),
+    ("hr..team@example.com", "hr..team@example.com", "bad local part"),
+    ("hr@example", "hr@example", "bad domain"),
+    ("hr@-example.com", "hr@-example.com", "bad domain"),
+])
+def test_clean_address(raw, address, reason):
+    assert clean_address(raw) == (address, reason)
+
+def write_contacts(path, rows):
+    path.write_text("email,first_name\n" + "".join(f"{email},{name}\n" for email, name in rows))
+    return str(path)
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+def test_ingest_dedupes_and_records_undeliverable(tmp_path):
+    contacts = write_contacts(tmp_path / "emails.csv", [
+        ("Ravi.K@Example.com", "Ravi"), ("ravi.k@example.com", "Ravi"),
+        ("laxman.reddy@lorhanit.comVice", "Laxman"), ("anil@gone-example.co", "Anil"), ("neha@example.in", "Neha"),
+    ])
+    invalid = str(tmp_path / "invalid_emails.csv")
+    mx_cache = MXCache(StaticResolver({"gone-example.co": False}), path=None)
+
+    report = ingest.ingest(contacts, invalid, mx_cache=mx_cache)
+
+    assert report == ingest.IngestReport(contacts=4, duplicates=1, invalid=2, rewritten=True)
+    assert [row[:2] for row in read_csv(contacts)] == [
+        ["email", "first_name"], ["ravi.k@example.com", "Ravi"], ["laxman.reddy@lorhanit.comvice", "Laxman"],
+        ["anil@gone-example.co", "Anil"], ["neha@example.in", "Neha"],
+    ]
+    assert [row[:2] for row in read_csv(invalid)[1:]] == [
+        ["anil@gone-example.co", "no mail server"], ["laxman.reddy@lorhanit.comvice", "text after domain"],
+    ]
+
+    # A run without MX lookups keeps the earlier findings, and the lowercased glued address stays flagged
+    assert ingest.ingest(contacts, invalid) == ingest.IngestReport(4, 0, 2, False)
+
+def test_dry_run_writes_nothing(tmp_path):
+    contacts = write_contacts(tmp_path / "emails.csv", [("Ravi.K@Example.com", "Ravi"), ("hr@example.comHead", "")])
+    before = (tmp_path / "emails.csv").read_text()
+    report = ingest.ingest(contacts, str(tmp_path / "invalid_emails.csv"), write=False)
+    assert report.invalid == 1
+    assert (tmp_path / "emails.csv").read_text() == before
+    assert not (tmp_path / "invalid_emails.csv").exists()
@@ -0,0 +1,97 @@
+import smtplib
+import pytest
+import fake_servers
+import mailer
+from mailer import SendResult, classify_smtp_error
+
+@pytest.mark.parametrize("exc, status", [
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (550, b"5.1.1 No such user")}), SendResult.REJECTED),
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (553, b"Mailbox name not allowed")}), SendResult.REJECTED),
+    (smtplib.SMTPDataError(550, b"5.1.1 The email account does not exist"), SendResult.REJECTED),
+    (smtplib.SMTPDataError(550, b"5.7.1 Message rejected as spam"), SendResult.FAILED),
+    (smtplib.SMTPDataError(552, b"5.3.4 Message size exceeds fixed limit"), SendResult.FAILED),
+    (smtplib.SMTPDataError(421, b"4.7.0 Try again later"), SendResult.THROTTLED),
+    (smtplib.SMTPSenderRefused(550, b"5.4.5 Daily sending quota exceeded", "me@x.com"), SendResult.FATAL),
+])
+def test_only_refused_recipients_are_bounces(exc, status):
+    assert classify_smtp_error(exc, "a@x.com").status == status
+
+def test_session_survives_refused_recipients():
+    server = fake_servers.FakeSMTPServer(reject_every=2).start()
+    pool = mailer.SMTPPool(size=1, host="127.0.0.1", port=server.port, use_tls=False)
+    try:
+        results = []
+        for i in range(4):
+            try:
+                with pool.session() as session:
+                    session.sendmail("me@example.com", f"user{i}@example.com", b"Subject: hi\r\n\r\nhi\r\n")
+                results.append(SendResult.OK)
+            except smtplib.SMTPException as e:
+                results.append(classify_smtp_error(e, f"user{i}@example.com").status)
+    finally:
+        pool.close()
+        server.stop()
+    assert results == [SendResult.OK, SendResult.REJECTED] * 2
+    assert pool.handshakes == 1
+    assert server.counters["connections"] == 1
+
+@pytest.fixture
+def smtp_server():
+    server = fake_servers.FakeSMTPServer().start()
+    yield server
+    server.stop()
+
+def send_many(pool, count):
+    return [
+        mailer.send_smtp_email(f"user{i}@example.com", "Hello", "Hi there", pool=pool, from_addr="me@example.com")
+        for i in range(count)
+    ]
+
+def test_pool_reuses_one_authenticated_connection(smtp_server):
+    pool = mailer.SMTPPool(size=1, host="127.0.0.1", port=smtp_server.port, use_tls=False,
+                           username="me@example.com", password="x", max_messages=100)
+    results = send_many(pool, 10)
+    pool.close()
+    assert all(results)
+    assert smtp_server.counters["messages"] == 10
+    assert pool.handshakes == smtp_server.counters["connections"] == 1
+
+def test_pool_recycles_after_max_messages(smtp_server):
+    pool = mailer.SMTPPool(size=1, host="127.0.0.1", port=smtp_server.port, use_tls=False, max_messages=3)
+    assert all(send_many(pool, 7))
+    pool.close()
+    assert pool.handshakes == smtp_server.counters["connections"] == 3
+
+def test_pool_reconnects_when_the_server_drops_the_connection(smtp_server):
+    pool = mailer.SMTPPool(size=1, host="127.0.0.1", port=smtp_server.port, use_tls=False, max_messages=100)
+    assert all(send_many(pool, 2))
+    # A connection the server closed: smtplib raises SMTPServerDisconnected on the next command
+    pool._sessions[0].server.close()
+    assert all(send_many(pool, 2))
+    pool.close()
+    assert smtp_server.counters["messages"] == 4
+    assert pool.handshakes == 2
+
+class _AuthFails(smtplib.SMTP):
+    def login(self, user, password, **kwargs):
+        raise smtplib.SMTPAuthenticationError(535, b"5.7.8 Username and Password not accepted")
+
+@pytest.mark.parametrize("smtp_class, use_tls, error", [
+    # The fake server doesn't offer STARTTLS
+    (smtplib.SMTP, True, smtplib.SMTPNotSupportedError),
+    (_AuthFails, False, smtplib.SMTPAuthenticationError),
+])
+def test_failed_handshake_closes_the_socket(smtp_server, monkeypatch, smtp_class, use_tls, error):
+    opened = []
+
+    class Recording(smtp_class):
+        def __init__(self, *args, **kwargs):
+            opened.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(mailer.smtplib, "SMTP", Recording)
+    session = mailer.SMTPSession("127.0.0.1", smtp_server.port, username="me@example.com", password="x", use_tls=use_tls)
+    with pytest.raises(error):
+        session.connect()
+    assert session.server is None
+    assert len(opened) == 1 and opened[0].sock is None
@@ -0,0 +1,72 @@
+import pytest
+import csv_state
+import fake_servers
+import mailer
+from mailer import SendResult
+from message_index import MessageIndex
+from outbox import CampaignSender, Outbox
+from scheduler import SendScheduler
+from state_journal import StateJournal
+from templates import RenderedEmail
+
+@pytest.fixture
+def outbox(tmp_path):
+    with Outbox(str(tmp_path / "outbox.db"), owner="a") as outbox:
+        yield outbox
+
+def claimed(outbox):
+    return outbox.counts()["initial"].get("rendering", 0)
+
+def test_sender_claims_only_about_its_limit(outbox):
+    recipients = [(f"hr{i}@big.com", "") for i in range(300)] + [(f"hr@company{i}.com", "") for i in range(700)]
+    outbox.enqueue("initial", recipients)
+    most_claimed = []
+
+    def send(to_email, context):
+        assert outbox.start_send("initial", to_email)
+        most_claimed.append(claimed(outbox))
+        outbox.finish_send("initial", to_email, True)
+        return True
+
+    scheduler = SendScheduler(send, limit=20, min_delay=0, max_delay=0, domain_cap=3,
+                              on_deferred=lambda to_email: outbox.unclaim("initial", to_email))
+    jobs = outbox.drain("initial", batch_size=5)
+    assert scheduler.run(jobs) == 20
+    assert max(most_claimed) <= 20 + 5
+    # Jobs over big.com's cap went back for other senders right away
+    assert claimed(outbox) <= 5 + 3
+    assert scheduler.queue.sent["big.com"] == 3
+
+def test_unclaimed_jobs_are_not_claimed_again_by_the_same_drain(outbox):
+    outbox.enqueue("initial", [(f"hr{i}@big.com", "") for i in range(10)])
+    seen = []
+    for email, _ in outbox.drain("initial", batch_size=3):
+        seen.append(email)
+        outbox.unclaim("initial", email)
+    assert len(seen) == 10
+    assert outbox.ready("initial") == 10
+
+def test_campaign_sender_settles_each_send(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = fake_servers.FakeSMTPServer(reject_every=2).start()
+    pool = mailer.SMTPPool(size=1, host="127.0.0.1", port=server.port, use_tls=False)
+    journal = StateJournal("send_email")
+    try:
+        with Outbox("outbox.db", owner="a") as outbox, MessageIndex("message_ids.db") as index:
+            outbox.enqueue("initial", [("ok@example.com", ""), ("gone@example.com", "")])
+            sender = CampaignSender("initial", "sent_log.csv", journal, outbox, index,
+                                    from_addr="me@example.com", pool=pool)
+            results = [sender.send(email, RenderedEmail(email, "Hi", "Hello")) for email, _ in outbox.drain("initial")]
+            assert [result.status for result in results] == [SendResult.OK, SendResult.REJECTED]
+            assert outbox.counts()["initial"] == {"sent": 1, "failed": 1}
+            assert index.lookup(results[0].message_id).address == "ok@example.com"
+            assert index.count() == 1
+            # Already settled, so a second attempt isn't sent
+            assert sender.send("ok@example.com", RenderedEmail("ok@example.com", "Hi", "Hello")) is None
+    finally:
+        pool.close()
+        server.stop()
+    journal.compact()
+    assert csv_state.read_emails("sent_log.csv") == {"ok@example.com"}
+    assert csv_state.read_emails("bounced_emails.csv") == {"gone@example.com"}
+    assert server.counters["messages"] == 1
@@ -0,0 +1,73 @@
+import email
+import pytest
+import fake_servers
+import mailer
+from message_index import MessageIndex, referenced_ids
+from reply_checker import Reply, match_reply
+
+SENT_AT = 1_700_000_000.0
+
+@pytest.fixture
+def index(tmp_path):
+    with MessageIndex(str(tmp_path / "message_ids.db")) as index:
+        yield index
+
+@pytest.fixture
+def sent(index):
+    """
+    Two sends to the same company and one elsewhere: {address: Message-ID}.
+    """
+    ids = {}
+    for address, campaign in [("alice@acme.com", "initial"), ("bob@acme.com", "followup"), ("carol@other.org", "initial")]:
+        ids[address] = mailer.make_message_id("me@example.com")
+        index.record(ids[address], address, campaign, sent_at=SENT_AT)
+    return ids
+
+def headers(raw):
+    return email.message_from_bytes(raw)
+
+def reply(sender, in_reply_to=None, references=None, date="Tue, 14 Nov 2023 23:13:20 +0000"):
+    msg = email.message.EmailMessage()
+    msg["From"] = sender
+    msg["Date"] = date
+    msg["Subject"] = "Re: Application"
+    if in_reply_to:
+        msg["In-Reply-To"] = in_reply_to
+    if references:
+        msg["References"] = references
+    msg.set_content("Thanks, let's talk.")
+    return headers(msg.as_bytes())
+
+def test_referenced_ids_prefers_in_reply_to():
+    assert referenced_ids("<b@x>", "<a@x> <b@x> <c@x>") == ["<b@x>", "<c@x>", "<a@x>"]
+
+def test_in_reply_to_matches_the_recipient(index, sent):
+    found = match_reply(reply("Bob <bob@acme.com>", in_reply_to=sent["bob@acme.com"]), set(), index)
+    assert found == Reply("bob@acme.com", "followup", 3600.0)
+
+def test_references_match_the_recipient(index, sent):
+    # A client that only keeps References, with an unrelated ID first
+    references = f"<thread-start@acme.com> {sent['alice@acme.com']}"
+    found = match_reply(reply("alice@acme.com", in_reply_to="<unknown@acme.com>", references=references), set(), index)
+    assert found.address == "alice@acme.com"
+    assert found.replied_to == "initial"
+
+def test_colleague_reply_counts_for_the_recipient(index, sent):
+    found = match_reply(reply("hiring@acme.com", in_reply_to=sent["alice@acme.com"]), set(), index)
+    assert found.address == "alice@acme.com"
+
+def test_forwarded_id_from_another_company_does_not_match(index, sent):
+    assert match_reply(reply("eve@elsewhere.net", in_reply_to=sent["carol@other.org"]), set(), index) is None
+
+def test_without_an_id_only_known_senders_count(index, sent):
+    assert match_reply(reply("carol@other.org"), {"carol@other.org"}, index) == Reply("carol@other.org", None, None)
+    assert match_reply(reply("dave@other.org"), {"carol@other.org"}, index) is None
+    assert match_reply(reply("carol@other.org"), {"carol@other.org"}, None) == Reply("carol@other.org", None, None)
+
+@pytest.mark.parametrize("daemon", ["mailer-daemon@googlemail.com", "MAILER-DAEMON@acme.com", "postmaster@acme.com"])
+def test_bounce_quoting_our_id_is_not_a_reply(index, sent, daemon):
+    raw = fake_servers.synthetic_bounce("alice@acme.com").replace(
+        b"mailer-daemon@googlemail.com", daemon.encode("ascii"), 1
+    )
+    raw = f"In-Reply-To: {sent['alice@acme.com']}\r\nReferences: {sent['alice@acme.com']}\r\n".encode("ascii") + raw
+    assert match_reply(headers(raw), {"alice@acme.com"}, index) is None
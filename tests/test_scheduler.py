@@ -0,0 +1,83 @@
+import time
+import pytest
+from scheduler import DomainQueue, SendScheduler
+
+# Timer and thread wakeup jitter
+SLACK = 0.02
+
+def jobs(*addresses):
+    return [(address, None) for address in addresses]
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_domain_cap_counts_only_successful_sends(workers):
+    failures = {"a1@a.com", "a2@a.com"}
+    attempts = []
+
+    def send(to_email, context):
+        attempts.append(to_email)
+        return to_email not in failures
+
+    scheduler = SendScheduler(send, limit=100, min_delay=0, max_delay=0, domain_cap=2, failure_delay=0, workers=workers)
+    scheduler.run(jobs(*(f"a{i}@a.com" for i in range(1, 7)), "b1@b.com"))
+    assert attempts.count("b1@b.com") == 1
+    assert sorted(a for a in attempts if a.endswith("@a.com")) == ["a1@a.com", "a2@a.com", "a3@a.com", "a4@a.com"]
+    assert scheduler.queue.sent == {"a.com": 2, "b.com": 1}
+    assert +scheduler.queue.deferred == {"a.com": 2}
+
+def test_queue_interleaves_domains():
+    queue = DomainQueue(jobs("1@a.com", "2@a.com", "3@a.com", "1@b.com", "1@c.com", "2@b.com"))
+    assert [to_email for to_email, _ in queue] == ["1@a.com", "1@b.com", "1@c.com", "2@a.com", "2@b.com", "3@a.com"]
+
+def timed_sends(**kwargs):
+    sends = []
+
+    def send(to_email, context):
+        sends.append((to_email, time.monotonic()))
+        return True
+
+    scheduler = SendScheduler(send, min_delay=0, max_delay=0, **kwargs)
+    return scheduler, sends
+
+def gaps(times):
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+def test_global_rate_cap_spaces_all_sends():
+    scheduler, sends = timed_sends(limit=5, workers=3, max_per_minute=600)
+    scheduler.run(jobs(*(f"hr@company{i}.com" for i in range(5))))
+    assert len(sends) == 5
+    assert min(gaps(sorted(t for _, t in sends))) >= 0.1 - SLACK
+
+def test_domain_interval_spaces_sends_to_one_domain():
+    scheduler, sends = timed_sends(limit=6, workers=3, domain_interval=0.2)
+    scheduler.run(jobs("1@a.com", "2@a.com", "3@a.com", "1@b.com", "2@b.com", "3@b.com"))
+    assert len(sends) == 6
+    for domain in ("a.com", "b.com"):
+        assert min(gaps([t for to_email, t in sends if to_email.endswith(domain)])) >= 0.2 - SLACK
+    # Other domains fill the gaps
+    assert gaps(sorted(t for _, t in sends))[0] < 0.1
+
+def test_run_budget_stops_before_the_next_send():
+    scheduler, sends = timed_sends(limit=10, domain_interval=0.2, budget=0.3)
+    start = time.monotonic()
+    assert scheduler.run(jobs(*(f"{i}@a.com" for i in range(10)))) == 2
+    assert time.monotonic() - start < 1
+
+def test_slow_source_does_not_block_settling_sends():
+    scheduler = None
+
+    def source():
+        yield "1@a.com", None
+        # Blocks until the first send is settled; reading under the scheduler lock would deadlock here
+        deadline = time.monotonic() + 2
+        while scheduler.sent < 1:
+            assert time.monotonic() < deadline, "first send never settled"
+            time.sleep(0.01)
+        yield "1@b.com", None
+
+    def send(to_email, context):
+        # Lets the other worker start reading the source first
+        time.sleep(0.1)
+        return True
+
+    scheduler = SendScheduler(send, limit=10, min_delay=0, max_delay=0, workers=2, lookahead=1)
+    assert scheduler.run(source()) == 2
@@ -0,0 +1,22 @@
+import email_config
+from suppression import build_suppression_index
+
+def write_bounces(path, rows):
+    path.write_text("email,bounce_type,detected_on\n" + "".join(f"{a},{t},2026-01-09\n" for a, t in rows))
+    return str(path)
+
+def build(tmp_path, rows):
+    missing = str(tmp_path / "missing.csv")
+    return build_suppression_index(write_bounces(tmp_path / "bounced.csv", rows), missing, missing, missing)
+
+def test_only_hard_bounces_suppress_the_address(tmp_path):
+    index = build(tmp_path, [("a@x.com", "hard"), ("b@x.com", "soft"), ("c@x.com", "policy"), ("d@x.com", "unknown")])
+    assert [index.is_suppressed(f"{name}@x.com") for name in "abcd"] == [True, False, False, False]
+
+def test_domain_needs_distinct_hard_bounced_addresses(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_config, "SUPPRESS_DOMAIN_AFTER_HARD_BOUNCES", 3)
+    index = build(tmp_path, [
+        ("a@x.com", "hard"), ("A@x.com", "hard"), ("a@x.com", "hard"), ("b@x.com", "hard"), ("c@x.com", "policy"),
+        ("a@y.com", "hard"), ("b@y.com", "hard"), ("c@y.com", "hard"),
+    ])
+    assert index.domains == {"y.com"}
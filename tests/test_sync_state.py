@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+import pytest
+import fake_servers
+import imap_utils
+import reply_checker
+from sync_state import SyncState
+
+SENT = [f"recruiter{i}@example.com" for i in range(600)]
+ACCOUNT = SimpleNamespace(name="default", address="me@example.com")
+
+@pytest.fixture
+def mail():
+    server = fake_servers.FakeIMAPServer(fake_servers.synthetic_mailboxes(SENT, replies=len(SENT))).start()
+    mail = imap_utils.connect("127.0.0.1", "me@example.com", "x", port=server.port, use_ssl=False)
+    yield mail
+    mail.logout()
+    server.stop()
+
+def fail_fetch_batch(mail, batch):
+    # The server answers NO to the given UID FETCH batch (0-based)
+    uid, fetches = mail.uid, []
+
+    def failing_uid(command, *args):
+        if command == "FETCH":
+            fetches.append(args)
+            if len(fetches) == batch + 1:
+                return "NO", [b"fetch failed"]
+        return uid(command, *args)
+
+    mail.uid = failing_uid
+
+def scan(mail, sync):
+    return reply_checker.scan_inbox(mail, ACCOUNT, "01-Jan-2020", set(SENT), sync, None)
+
+def test_mark_stays_below_a_failed_batch(tmp_path, mail):
+    sync = SyncState(str(tmp_path / "sync.json"))
+    fail_fetch_batch(mail, 1)
+    replies = scan(mail, sync)
+    sync.commit(ACCOUNT.address, "INBOX")
+    assert len(replies) == imap_utils.FETCH_BATCH_SIZE
+    assert sync.data[ACCOUNT.address]["INBOX"]["last_uid"] == imap_utils.FETCH_BATCH_SIZE
+
+    # The next run picks up exactly the messages that weren't fetched
+    del mail.uid
+    replies = scan(mail, sync)
+    sync.commit(ACCOUNT.address, "INBOX")
+    assert {reply.address for reply in replies} == set(SENT[imap_utils.FETCH_BATCH_SIZE:])
+    assert sync.data[ACCOUNT.address]["INBOX"]["last_uid"] == len(SENT)
+
+def test_mark_advances_when_every_batch_is_fetched(tmp_path, mail):
+    sync = SyncState(str(tmp_path / "sync.json"))
+    assert len(scan(mail, sync)) == len(SENT)
+    sync.commit(ACCOUNT.address, "INBOX")
+    assert sync.data[ACCOUNT.address]["INBOX"]["last_uid"] == len(SENT)
@@ -0,0 +1,73 @@
+import random
+import zlib
+import email_config
+import templates
+from templates import RenderedEmail, VariantTable
+
+TEMPLATE = "{greeting} {first_name},\n\n{pitch}\n{links}"
+SUBJECTS = ["Hello", "Quick question"]
+SLOTS = {"greeting": ["Hi", "Hey"], "pitch": ["I build APIs.", "I write Python.", "I ship backends."]}
+
+RECIPIENTS = [(f"hr{i}@company{i % 7}.com", f"Name{i}") for i in range(200)]
+
+def table(seed=None, name="initial"):
+    return VariantTable(name, TEMPLATE, SUBJECTS, SLOTS, fixed={"links": "https://example.com"}, seed=seed)
+
+def test_every_combination_is_a_variant():
+    assert len(table()) == 2 * 2 * 3
+
+def test_variant_is_a_seeded_hash_of_the_address():
+    variants = table(seed="outreach")
+    for to_email, _ in RECIPIENTS:
+        expected = zlib.crc32(f"outreach:initial:{to_email}".encode("utf-8")) % len(variants)
+        assert variants.select(to_email) == expected
+
+def test_variant_choice_is_stable_for_a_seed_and_address():
+    first, second = table(seed="outreach"), table(seed="outreach")
+    assert [first.select(e) for e, _ in RECIPIENTS] == [second.select(e) for e, _ in RECIPIENTS]
+    # Case and surrounding spaces don't change who gets what
+    assert first.select(" HR1@Company1.com ") == first.select("hr1@company1.com")
+
+def test_default_seed_comes_from_config(monkeypatch):
+    monkeypatch.setattr(email_config, "TEMPLATE_SEED", "other")
+    assert table().seed == "other"
+    assert [table().select(e) for e, _ in RECIPIENTS] == [table(seed="other").select(e) for e, _ in RECIPIENTS]
+
+def test_another_seed_or_template_reshuffles():
+    base = [table(seed="outreach").select(e) for e, _ in RECIPIENTS]
+    assert [table(seed="reshuffled").select(e) for e, _ in RECIPIENTS] != base
+    assert [table(seed="outreach", name="followup").select(e) for e, _ in RECIPIENTS] != base
+
+def test_all_variants_get_used():
+    variants = table()
+    assert {variants.select(e) for e, _ in RECIPIENTS} == set(range(len(variants)))
+
+def test_render_fills_in_the_chosen_variant():
+    message = table().render("hr1@company1.com", "Ada")
+    assert isinstance(message, RenderedEmail)
+    assert message.to_email == "hr1@company1.com"
+    assert message.subject in SUBJECTS
+    assert message.body.split(",", 1)[0] in ("Hi Ada", "Hey Ada")
+    assert message.body.endswith("\nhttps://example.com")
+    assert "{" not in message.body
+
+def test_render_batch_matches_render_in_any_order():
+    variants = table()
+    expected = {e: variants.render(e, name) for e, name in RECIPIENTS}
+    shuffled = RECIPIENTS[:]
+    random.Random(1).shuffle(shuffled)
+    batch = variants.render_batch(shuffled)
+    assert [message.to_email for message in batch] == [e for e, _ in shuffled]
+    assert all(message == expected[message.to_email] for message in batch)
+
+def test_iter_rendered_yields_jobs_across_batches():
+    variants = table()
+    jobs = list(variants.iter_rendered(iter(RECIPIENTS), batch_size=30))
+    assert jobs == [(e, variants.render(e, name)) for e, name in RECIPIENTS]
+    assert list(variants.iter_rendered([])) == []
+
+def test_shipped_templates_render():
+    for variants in (templates.initial_table(), templates.followup_table()):
+        message = variants.render("hr@example.com", "Ada")
+        assert "Ada" in message.body
+        assert templates._NAME_SLOT not in message.body